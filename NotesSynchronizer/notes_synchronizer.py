@@ -1,14 +1,21 @@
+import json
+from concurrent.futures import ThreadPoolExecutor
 from dataclasses import dataclass
-from typing import List, Dict, Tuple
+from pathlib import Path
+from typing import Callable, List, Dict, Tuple
 
+import numpy as np
+import torch
+
+from config.config import FrameSampling, Pipeline
 from subtitles.subtitles import (
+    config,
     Subtitles,
     ImageCaption,
     TextSummarizer,
     extract_frames,
-    extract_audio,
 )
-from utils.utils import AUDIO_DIR
+from utils.utils import batched
 
 
 @dataclass
@@ -70,26 +77,50 @@ class NotesSynchronizer:
         subtitles_model: Subtitles,
         image_caption_model: ImageCaption,
         summarizer: TextSummarizer,
+        pipeline: Pipeline | None = None,
+        sampling: FrameSampling | None = None,
     ):
         self.subtitles = subtitles_model
         self.image_caption = image_caption_model
         self.summarizer = summarizer
+        self.pipeline = pipeline or config.pipeline
+        self.sampling = sampling
 
     def synchronize(
-        self, video_path: str, video_id: int
+        self,
+        video_path: str,
+        video_id: int,
+        on_progress: Callable[[str], None] | None = None,
     ) -> List[TimestampedNote]:
-        """синхронизирует кадры видео с отрезками звука"""
-        audio_path = AUDIO_DIR / f"{video_id}.wav"
-        audio_path = extract_audio(video_path, str(audio_path))
-        transcription_result = self.subtitles.transcribe_audio_with_timestamps(
-            audio_path
-        )
-
-        frames_paths, timestamps = extract_frames(video_path, video_id)
-        descriptions = [
-            self.image_caption.caption_image(str(path))
-            for path in frames_paths
-        ]
+        """синхронизирует кадры видео с отрезками звука
+
+        on_progress получает накопленный текст транскрипции после
+        каждого распознанного окна аудио.
+        """
+        if self.pipeline.concurrent:
+            # Аудио и видео ветки независимы до слияния по временным меткам
+            with ThreadPoolExecutor(max_workers=2) as executor:
+                audio_future = executor.submit(
+                    self._with_torch_threads,
+                    self.pipeline.asr_threads,
+                    self._transcribe,
+                    video_path,
+                    on_progress,
+                )
+                frames_future = executor.submit(
+                    self._with_torch_threads,
+                    self.pipeline.caption_threads,
+                    self._caption_frames,
+                    video_path,
+                    video_id,
+                )
+                transcription_result = audio_future.result()
+                timestamps, descriptions = frames_future.result()
+        else:
+            transcription_result = self._transcribe(video_path, on_progress)
+            timestamps, descriptions = self._caption_frames(
+                video_path, video_id
+            )
 
         synchronized_notes = self._synchronize_by_timestamp(
             transcription_result, list(zip(timestamps, descriptions))
@@ -97,6 +128,49 @@ class NotesSynchronizer:
 
         return synchronized_notes
 
+    @staticmethod
+    def _with_torch_threads(threads: int, func: Callable, *args):
+        """Выполняет func с ограничением числа потоков torch.
+
+        Ограничение задается в рабочем потоке, поэтому при сборке torch
+        с OpenMP оно действует только на эту ветку конвейера.
+        С планировщиком пачек модели считают в его потоке, и тот же
+        бюджет задается там (SingleProcessor._start_scheduler).
+        """
+        if threads > 0:
+            torch.set_num_threads(threads)
+        return func(*args)
+
+    def _transcribe(
+        self,
+        video_path: str,
+        on_progress: Callable[[str], None] | None = None,
+    ) -> Dict:
+        """Распознает речь потоково, сообщая промежуточный текст"""
+        chunks = []
+        texts = []
+        for window_chunks in self.subtitles.transcribe_stream(video_path):
+            chunks.extend(window_chunks)
+            texts.extend(chunk["text"] for chunk in window_chunks)
+            if on_progress is not None:
+                on_progress(" ".join(texts))
+        return {"text": " ".join(texts), "chunks": chunks}
+
+    def _caption_frames(
+        self, video_path: str, video_id: int
+    ) -> Tuple[List[float], List[str]]:
+        """Подписывает кадры пачками по мере их декодирования"""
+        timestamps = []
+        descriptions = []
+        for batch in batched(
+            extract_frames(video_path, video_id, self.sampling),
+            self.image_caption.batch_size,
+        ):
+            batch_timestamps, frames = zip(*batch)
+            timestamps.extend(batch_timestamps)
+            descriptions.extend(self.image_caption.caption_batch(frames))
+        return timestamps, descriptions
+
     def _synchronize_by_timestamp(
         self, transcription_result: Dict, frame_data: List[Tuple[int, str]]
     ) -> List[TimestampedNote]:
@@ -108,22 +182,20 @@ class NotesSynchronizer:
                 transcription_result["text"], frame_data
             )
 
+        chunks = transcription_result["chunks"]
+        frame_ts = np.array([ts for ts, _ in frame_data], dtype=float)
+        order = np.argsort(frame_ts, kind="stable")
+        frame_ranges = self._assign_frames(chunks, frame_ts[order])
+        descriptions = [frame_desc for _, frame_desc in frame_data]
+
         # Синхронизация по временным меткам
-        for chunk in transcription_result["chunks"]:
+        for chunk, (first, last) in zip(chunks, frame_ranges):
             chunk_text = chunk["text"]
-            chunk_start, chunk_end = chunk["timestamp"]  # в секундах
-            chunk_start_ms = chunk_start * 1000
-            chunk_end_ms = chunk_end * 1000
-
-            # Находим кадры, попадающие в этот временной интервал
-            relevant_frames = []
-            for frame_ts, frame_desc in frame_data:
-                if chunk_start_ms <= frame_ts <= chunk_end_ms:
-                    relevant_frames.append(frame_desc)
+            chunk_start_ms = chunk["timestamp"][0] * 1000
 
             # Объединяем описания кадров
-            combined_descriptions = (
-                " ".join(relevant_frames) if relevant_frames else ""
+            combined_descriptions = " ".join(
+                descriptions[index] for index in order[first:last]
             )
 
             # Создаем комбинированный текст
@@ -139,6 +211,42 @@ class NotesSynchronizer:
 
         return notes
 
+    @staticmethod
+    def _assign_frames(
+        chunks: List[Dict], frame_ts: np.ndarray
+    ) -> List[Tuple[int, int]]:
+        """Находит для каждого чанка диапазон индексов в отсортированном
+        массиве временных меток кадров frame_ts (мс).
+
+        Интервал чанка полуоткрытый [начало, конец): кадр ровно на
+        границе относится к следующему чанку, к последнему чанку
+        относится и кадр на его конце. Если конец чанка неизвестен,
+        им считается начало следующего. Бинарный поиск по всем чанкам
+        сразу дает O((n + m) log m) вместо перебора всех пар.
+        """
+        starts = np.array(
+            [chunk["timestamp"][0] * 1000 for chunk in chunks], dtype=float
+        )
+        next_starts = np.append(starts[1:], np.inf)
+        ends = np.array(
+            [
+                (
+                    next_start
+                    if chunk["timestamp"][1] is None
+                    else chunk["timestamp"][1] * 1000
+                )
+                for chunk, next_start in zip(chunks, next_starts)
+            ],
+            dtype=float,
+        )
+
+        firsts = np.searchsorted(frame_ts, starts, side="left")
+        lasts = np.searchsorted(frame_ts, ends, side="left")
+        if len(chunks):
+            lasts[-1] = np.searchsorted(frame_ts, ends[-1], side="right")
+        lasts = np.maximum(lasts, firsts)
+        return list(zip(firsts.tolist(), lasts.tolist()))
+
     def _fallback_synchronization(
         self, transcription_text: str, frame_data: List[Tuple[int, str]]
     ) -> List[TimestampedNote]:
@@ -185,13 +293,30 @@ class NotesSynchronizer:
 
         return notes
 
-    def generate_summary(self, notes: List[TimestampedNote]):
-        """генерирует саммари по уже синхронизированным частям видео"""
+    def generate_summary(
+        self, notes: List[TimestampedNote], tree_path: Path | None = None
+    ):
+        """генерирует саммари по уже синхронизированным частям видео
+
+        Если задан tree_path, промежуточные уровни иерархической
+        суммаризации сохраняются в него и переиспользуются при
+        повторной генерации.
+        """
         full_text = " ".join([note.combined_text for note in notes])
 
+        cached = None
+        if tree_path is not None and tree_path.exists():
+            with open(tree_path, "r", encoding="utf-8") as f:
+                cached = json.load(f)
+        tree = self.summarizer.build_tree(full_text, cached)
+        if tree_path is not None:
+            with open(tree_path, "w", encoding="utf-8") as f:
+                json.dump(tree, f, ensure_ascii=False)
+
+        concise, detailed = self.summarizer.summarize_tree(tree, [150, 300])
         return VideoSummary(
-            self.summarizer.summarize(full_text, max_length=150),
-            self.summarizer.summarize(full_text, max_length=300),
+            concise,
+            detailed,
             self._extract_key_points(notes),
             self._create_timestamped_summary(notes),
         )
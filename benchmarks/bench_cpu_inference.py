@@ -0,0 +1,101 @@
+"""Бенчмарк CPU профилей инференса трех моделей.
+
+Запуск: PYTHONPATH=. python benchmarks/bench_cpu_inference.py VIDEO
+Для Subtitles, ImageCaption и TextSummarizer сравнивает float32,
+bfloat16, динамическую int8 квантизацию и ONNX Runtime (нужен
+optimum[onnxruntime], первый запуск экспортирует модели): среднюю
+задержку и расхождение результата с float32 (доля совпадающих слов).
+Модели загружаются через SingleProcessor, кэш результатов отключен.
+"""
+
+import sys
+import time
+from difflib import SequenceMatcher
+from itertools import islice
+
+import torch
+
+from subtitles.subtitles import (
+    ImageCaption,
+    SingleProcessor,
+    Subtitles,
+    TextSummarizer,
+    config,
+    cpu_supports_bf16,
+    load_audio,
+    sample_frames,
+    SAMPLE_RATE,
+)
+
+PROFILES = [
+    ("float32", "float32", False, "torch"),
+    ("bfloat16", "bfloat16", False, "torch"),
+    ("int8", "float32", True, "torch"),
+    ("onnx", "float32", False, "onnx"),
+]
+AUDIO_S = 30
+FRAMES = 8
+REPEATS = 3
+
+
+def unload(cls):
+    for key in [key for key in SingleProcessor._instances if key[0] is cls]:
+        del SingleProcessor._instances[key]
+
+
+def load(cls, cpu_dtype: str, quantize: bool, backend: str):
+    config.inference.cpu_dtype = cpu_dtype
+    config.inference.quantize = quantize
+    config.models.asr_backend = backend
+    config.models.caption_backend = backend
+    config.models.summary_backend = backend
+    unload(cls)
+    return cls()
+
+
+def similarity(reference: list[str], result: list[str]) -> float:
+    words = " ".join(reference).split()
+    return SequenceMatcher(None, words, " ".join(result).split()).ratio()
+
+
+def measure(run) -> tuple[float, list[str]]:
+    run()  # прогрев
+    start = time.perf_counter()
+    for _ in range(REPEATS):
+        result = run()
+    return (time.perf_counter() - start) / REPEATS, result
+
+
+def main(video_path: str):
+    torch.set_num_threads(config.inference.torch_threads or 4)
+    config.cache.enabled = False
+    config.frame_sampling.save_frames = False
+    audio = load_audio(video_path)[: AUDIO_S * SAMPLE_RATE]
+    frames = [frame for _, frame in islice(sample_frames(video_path), FRAMES)]
+
+    text = None
+    benchmarks = [
+        (Subtitles, lambda model: [model.transcribe_audio(audio)]),
+        (ImageCaption, lambda model: model.caption_batch(frames)),
+        (TextSummarizer, lambda model: [model.summarize(text)]),
+    ]
+    print(f"bf16 на процессоре: {cpu_supports_bf16()}")
+    for cls, run in benchmarks:
+        reference = None
+        for name, *profile in PROFILES:
+            model = load(cls, *profile)
+            latency, result = measure(lambda: run(model))
+            if reference is None:
+                reference = result
+                if cls is Subtitles:
+                    # Текст для суммаризатора берется из эталонной ASR
+                    text = result[0]
+            print(
+                f"{cls.__name__:15} {name:9} {latency:8.2f} с  "
+                f"совпадение с float32 {similarity(reference, result):.3f}"
+            )
+        unload(cls)
+
+
+if __name__ == "__main__":
+    main(sys.argv[1])
@@ -0,0 +1,118 @@
+"""Нагрузочный бенчмарк базы: чтение статуса во время записи прогресса.
+
+Запуск: PYTHONPATH=. python benchmarks/bench_db_load.py
+Несколько потоков читают VideoTranscription, как поллинг статуса
+клиентами, а пишущие потоки сохраняют частичную транскрипцию, как
+save_progress в write_subtitles. Сравнивает прежний движок SQLite
+(журнал rollback, таймаут блокировки sqlite3 по умолчанию) с
+make_engine: чтения и записи в секунду и число ошибок database is
+locked.
+"""
+
+import tempfile
+import threading
+import time
+from pathlib import Path
+
+from sqlalchemy.exc import OperationalError
+from sqlmodel import Session, SQLModel, create_engine
+
+from config.config import Database
+from db import VideoTranscription, make_engine
+
+READERS = 8
+WRITERS = 2
+DURATION_S = 5.0
+TRANSCRIPTIONS = 20
+TEXT = "слово " * 2000
+
+
+def default_engine(url: str):
+    """Прежняя конфигурация из db.py"""
+    return create_engine(url, connect_args={"check_same_thread": False})
+
+
+def tuned_engine(url: str):
+    return make_engine(
+        Database(
+            url=url,
+            busy_timeout_ms=5000,
+            mmap_size_mb=256,
+            pool_size=10,
+            max_overflow=20,
+            pool_timeout_s=30,
+            pool_recycle_s=1800,
+        )
+    )
+
+
+def run(engine) -> dict:
+    SQLModel.metadata.create_all(engine)
+    with Session(engine) as session:
+        for _ in range(TRANSCRIPTIONS):
+            session.add(VideoTranscription(video_name="bench.mp4"))
+        session.commit()
+
+    counters = {"reads": 0, "writes": 0, "locked": 0}
+    lock = threading.Lock()
+    stop = threading.Event()
+
+    def count(name: str):
+        with lock:
+            counters[name] += 1
+
+    def reader(offset: int):
+        video_id = offset
+        while not stop.is_set():
+            video_id = video_id % TRANSCRIPTIONS + 1
+            try:
+                with Session(engine) as session:
+                    session.get(VideoTranscription, video_id)
+                count("reads")
+            except OperationalError:
+                count("locked")
+
+    def writer(offset: int):
+        video_id = offset
+        while not stop.is_set():
+            video_id = video_id % TRANSCRIPTIONS + 1
+            try:
+                with Session(engine) as session:
+                    transcription = session.get(VideoTranscription, video_id)
+                    transcription.transcription = TEXT
+                    session.add(transcription)
+                    session.commit()
+                count("writes")
+            except OperationalError:
+                count("locked")
+
+    threads = [
+        threading.Thread(target=reader, args=(i,)) for i in range(READERS)
+    ] + [threading.Thread(target=writer, args=(i,)) for i in range(WRITERS)]
+    for thread in threads:
+        thread.start()
+    time.sleep(DURATION_S)
+    stop.set()
+    for thread in threads:
+        thread.join()
+    engine.dispose()
+    return counters
+
+
+def main():
+    print(f"{READERS} читателей, {WRITERS} писателей, {DURATION_S:.0f} с")
+    for name, factory in [
+        ("default", default_engine),
+        ("make_engine", tuned_engine),
+    ]:
+        with tempfile.TemporaryDirectory() as tmp:
+            counters = run(factory(f"sqlite:///{Path(tmp) / 'bench.db'}"))
+        print(
+            f"{name:12} reads/s: {counters['reads'] / DURATION_S:8.0f}  "
+            f"writes/s: {counters['writes'] / DURATION_S:6.0f}  "
+            f"locked: {counters['locked']}"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,88 @@
+"""Сравнение последовательного декодера кадров с покадровыми перемотками.
+
+Запуск: PYTHONPATH=. python benchmarks/bench_frames.py [video.mp4]
+Без аргумента генерирует синтетическое H.264 видео во временной директории
+с редкими ключевыми кадрами, как у записей экрана с лекций. Выигрыш
+iter_frames растет с расстоянием между ключевыми кадрами: при GOP меньше
+FRAME_DISTANCE перемотки почти бесплатны.
+"""
+
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+import cv2
+import imageio_ffmpeg
+import numpy as np
+
+from subtitles.subtitles import iter_frames
+
+FRAME_DISTANCE = 150
+GOP_SIZE = 1500
+
+
+def seek_frames(video_path: str, frame_distance: int = FRAME_DISTANCE):
+    """Прежний цикл extract_frames: перемотка к каждому нужному кадру."""
+    capture = cv2.VideoCapture(video_path)
+    total_frames = capture.get(cv2.CAP_PROP_FRAME_COUNT)
+    frames = []
+    frame_number = 0
+    while frame_number < total_frames:
+        if capture.set(cv2.CAP_PROP_POS_FRAMES, frame_number):
+            ret, frame = capture.read()
+            if ret:
+                frames.append((capture.get(cv2.CAP_PROP_POS_MSEC), frame))
+        frame_number += frame_distance
+    capture.release()
+    return frames
+
+
+def make_video(path: str, seconds: int = 120, fps: int = 25):
+    writer = imageio_ffmpeg.write_frames(
+        path,
+        (640, 360),
+        fps=fps,
+        codec="libx264",
+        output_params=["-g", str(GOP_SIZE)],
+        macro_block_size=1,
+    )
+    writer.send(None)
+    rng = np.random.default_rng(42)
+    base = rng.integers(0, 255, (360, 640, 3), dtype=np.uint8)
+    for i in range(seconds * fps):
+        writer.send(np.ascontiguousarray(np.roll(base, i, axis=1)))
+    writer.close()
+
+
+def measure(name: str, func, video_path: str):
+    start = time.perf_counter()
+    frames = func(video_path)
+    elapsed = time.perf_counter() - start
+    print(f"{name:<12} {len(frames):>5} кадров  {elapsed:8.3f} с")
+    return frames
+
+
+def main():
+    if len(sys.argv) > 1:
+        video_path = sys.argv[1]
+        tmp_dir = None
+    else:
+        tmp_dir = tempfile.TemporaryDirectory()
+        video_path = str(Path(tmp_dir.name) / "bench.mp4")
+        make_video(video_path)
+
+    seek = measure("seek", seek_frames, video_path)
+    stream = measure(
+        "stream",
+        lambda path: list(iter_frames(path, FRAME_DISTANCE)),
+        video_path,
+    )
+    assert [ts for ts, _ in seek] == [ts for ts, _ in stream]
+
+    if tmp_dir is not None:
+        tmp_dir.cleanup()
+
+
+if __name__ == "__main__":
+    main()
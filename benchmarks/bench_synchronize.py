@@ -0,0 +1,63 @@
+"""Микробенчмарк сопоставления кадров с чанками транскрипции.
+
+Запуск: PYTHONPATH=. python benchmarks/bench_synchronize.py
+Сравнивает прежний перебор всех пар чанк x кадр с бинарным поиском
+в NotesSynchronizer._assign_frames на синтетических данных.
+"""
+
+import time
+
+import numpy as np
+
+from NotesSynchronizer.notes_synchronizer import NotesSynchronizer
+
+CHUNKS = 10_000
+FRAMES = 10_000
+
+
+def make_data(seed: int = 42):
+    rng = np.random.default_rng(seed)
+    bounds = np.cumsum(rng.uniform(1.0, 5.0, CHUNKS + 1))
+    chunks = [
+        {"text": f"chunk {i}", "timestamp": (bounds[i], bounds[i + 1])}
+        for i in range(CHUNKS)
+    ]
+    frame_ts = np.sort(rng.uniform(0, bounds[-1] * 1000, FRAMES))
+    frames = [(ts, f"frame {i}") for i, ts in enumerate(frame_ts)]
+    return {"text": "", "chunks": chunks}, frames
+
+
+def nested_loop(transcription, frames):
+    """Прежний алгоритм: O(chunks x frames)"""
+    result = []
+    for chunk in transcription["chunks"]:
+        start_ms = chunk["timestamp"][0] * 1000
+        end_ms = chunk["timestamp"][1] * 1000
+        result.append([desc for ts, desc in frames if start_ms <= ts < end_ms])
+    return result
+
+
+def main():
+    transcription, frames = make_data()
+    synchronizer = NotesSynchronizer(None, None, None)
+
+    start = time.perf_counter()
+    expected = nested_loop(transcription, frames)
+    nested_time = time.perf_counter() - start
+
+    start = time.perf_counter()
+    notes = synchronizer._synchronize_by_timestamp(transcription, frames)
+    bisect_time = time.perf_counter() - start
+
+    # Случайные метки не попадают точно на границы, поэтому
+    # результаты обоих алгоритмов должны совпасть
+    assert [note.image_description for note in notes] == [
+        " ".join(descriptions) for descriptions in expected
+    ]
+    print(f"{CHUNKS} чанков x {FRAMES} кадров")
+    print(f"nested loop {nested_time:8.3f} с")
+    print(f"searchsorted {bisect_time:7.3f} с")
+
+
+if __name__ == "__main__":
+    main()
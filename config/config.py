@@ -1,5 +1,7 @@
+from enum import Enum
+
 from environs import Env
-from dataclasses import dataclass
+from dataclasses import dataclass, replace
 
 
 @dataclass
@@ -9,9 +11,177 @@ class JWToken:
     access_token_expire_minutes: int
 
 
+@dataclass
+class FrameSampling:
+    # "interval" - каждый frame_distance-й кадр,
+    # "scene" - только кадры со сменой содержимого
+    mode: str
+    frame_distance: int
+    probe_interval_ms: int
+    min_interval_ms: int
+    max_interval_ms: int
+    hash_threshold: int
+    # Сохранять выбранные кадры в PNG (только для отладки)
+    save_frames: bool
+
+
+@dataclass
+class Inference:
+    caption_batch_size: int
+    summary_batch_size: int
+    # Окно потокового распознавания речи, 0 - вся дорожка целиком
+    asr_window_s: float
+    asr_overlap_s: float
+    # Бюджет чанка суммаризации в токенах модели без префикса
+    summary_chunk_tokens: int
+    # Число предложений, повторяемых в начале следующего чанка
+    summary_chunk_overlap: int
+    # Длина саммари промежуточных уровней иерархической суммаризации
+    summary_level_max_length: int
+    # Тип весов на CPU: auto (bfloat16 при аппаратной поддержке, иначе
+    # float32), float32 или bfloat16. На GPU всегда float16
+    cpu_dtype: str
+    # Динамическая int8 квантизация линейных слоев на CPU
+    quantize: bool
+    # Потоки torch внутри и между операциями, 0 - по умолчанию torch
+    torch_threads: int
+    interop_threads: int
+    # Общие пачки запросов к моделям от одновременных задач. Задачи
+    # разных процессов не объединяются, поэтому планировщик запускается
+    # только при WORKER_POOL=thread
+    scheduler_enabled: bool
+    scheduler_max_wait_ms: float
+    asr_batch_size: int
+
+
+@dataclass
+class Pipeline:
+    # Распознавание речи и подписи кадров выполняются параллельно
+    concurrent: bool
+    # Потоки torch на каждую ветку, 0 - не менять
+    asr_threads: int
+    caption_threads: int
+
+
+@dataclass
+class Worker:
+    processes: int
+    poll_interval_s: float
+    max_attempts: int
+    heartbeat_s: float
+    # Задача без heartbeat дольше этого времени считается брошенной
+    stale_after_s: float
+    # process - задача в отдельном процессе со своими моделями, thread -
+    # задачи в потоках одного процесса с общими моделями и пачками
+    pool: str
+
+
+@dataclass
+class Database:
+    url: str
+    # Только для SQLite: ожидание блокировки и размер mmap
+    busy_timeout_ms: int
+    mmap_size_mb: int
+    # Только для серверных СУБД (PostgreSQL и т.п.)
+    pool_size: int
+    max_overflow: int
+    pool_timeout_s: float
+    pool_recycle_s: int
+
+
+@dataclass
+class Upload:
+    max_mb: int
+    chunk_mb: int
+    # Незавершенные загрузки без активности удаляются через expire_h
+    expire_h: float
+
+
+@dataclass
+class Cache:
+    enabled: bool
+    memory_items: int
+    caption_max_mb: int
+    summary_max_mb: int
+
+
+class Tier(str, Enum):
+    fast = "fast"
+    balanced = "balanced"
+    accurate = "accurate"
+
+
+@dataclass(frozen=True)
+class TierProfile:
+    asr_model: str
+    caption_model: str
+    summary_model: str
+    # Множитель интервалов выборки кадров из FrameSampling: больше -
+    # реже кадры и быстрее обработка
+    sampling_scale: float
+
+
+# balanced совпадает с прежним поведением, accurate отличается от него
+# только более частой выборкой кадров
+TIER_PROFILES = {
+    Tier.fast: TierProfile(
+        asr_model="openai/whisper-small",
+        caption_model="Salesforce/blip-image-captioning-base",
+        summary_model="IlyaGusev/rut5_base_sum_gazeta",
+        sampling_scale=2.0,
+    ),
+    Tier.balanced: TierProfile(
+        asr_model="antony66/whisper-large-v3-russian",
+        caption_model="Salesforce/blip-image-captioning-large",
+        summary_model="IlyaGusev/rut5_base_sum_gazeta",
+        sampling_scale=1.0,
+    ),
+    Tier.accurate: TierProfile(
+        asr_model="antony66/whisper-large-v3-russian",
+        caption_model="Salesforce/blip-image-captioning-large",
+        summary_model="IlyaGusev/rut5_base_sum_gazeta",
+        sampling_scale=0.5,
+    ),
+}
+
+
+def tier_sampling(sampling: FrameSampling, tier: Tier) -> FrameSampling:
+    """Настройки выборки кадров с учетом уровня обработки"""
+    scale = TIER_PROFILES[tier].sampling_scale
+    return replace(
+        sampling,
+        frame_distance=max(1, round(sampling.frame_distance * scale)),
+        probe_interval_ms=round(sampling.probe_interval_ms * scale),
+        min_interval_ms=round(sampling.min_interval_ms * scale),
+        max_interval_ms=round(sampling.max_interval_ms * scale),
+    )
+
+
+@dataclass
+class Models:
+    # background - загрузка в фоне при старте API, lazy - при первом
+    # обращении, disabled - API без моделей (обработку ведет воркер,
+    # по умолчанию)
+    loading: str
+    # Уровень обработки, если он не указан при загрузке
+    default_tier: Tier
+    # Бэкенд каждой модели: torch или onnx (ONNX Runtime на CPU)
+    asr_backend: str
+    caption_backend: str
+    summary_backend: str
+
+
 @dataclass
 class Config:
     jwtoken: JWToken
+    frame_sampling: FrameSampling
+    inference: Inference
+    pipeline: Pipeline
+    worker: Worker
+    database: Database
+    upload: Upload
+    cache: Cache
+    models: Models
 
 
 def load_config(path: str) -> Config:
@@ -22,5 +192,70 @@ def load_config(path: str) -> Config:
             secret_key=env("SECRET_KEY"),
             algorithm=env("ALGORITHM"),
             access_token_expire_minutes=env("ACCESS_TOKEN_EXPIRE_MINUTES"),
-        )
+        ),
+        frame_sampling=FrameSampling(
+            mode=env.str("FRAME_SAMPLING_MODE", "scene"),
+            frame_distance=env.int("FRAME_DISTANCE", 150),
+            probe_interval_ms=env.int("FRAME_PROBE_INTERVAL_MS", 1000),
+            min_interval_ms=env.int("FRAME_MIN_INTERVAL_MS", 2000),
+            max_interval_ms=env.int("FRAME_MAX_INTERVAL_MS", 60000),
+            hash_threshold=env.int("FRAME_HASH_THRESHOLD", 10),
+            save_frames=env.bool("SAVE_FRAMES", False),
+        ),
+        inference=Inference(
+            caption_batch_size=env.int("CAPTION_BATCH_SIZE", 8),
+            summary_batch_size=env.int("SUMMARY_BATCH_SIZE", 8),
+            asr_window_s=env.float("ASR_WINDOW_S", 300),
+            asr_overlap_s=env.float("ASR_OVERLAP_S", 10),
+            summary_chunk_tokens=env.int("SUMMARY_CHUNK_TOKENS", 400),
+            summary_chunk_overlap=env.int("SUMMARY_CHUNK_OVERLAP", 0),
+            summary_level_max_length=env.int("SUMMARY_LEVEL_MAX_LENGTH", 150),
+            cpu_dtype=env.str("INFERENCE_CPU_DTYPE", "auto"),
+            quantize=env.bool("INFERENCE_QUANTIZE", False),
+            torch_threads=env.int("TORCH_THREADS", 0),
+            interop_threads=env.int("TORCH_INTEROP_THREADS", 0),
+            scheduler_enabled=env.bool("INFERENCE_SCHEDULER", True),
+            scheduler_max_wait_ms=env.float("SCHEDULER_MAX_WAIT_MS", 10),
+            asr_batch_size=env.int("ASR_BATCH_SIZE", 4),
+        ),
+        pipeline=Pipeline(
+            concurrent=env.bool("PIPELINE_CONCURRENT", True),
+            asr_threads=env.int("ASR_TORCH_THREADS", 0),
+            caption_threads=env.int("CAPTION_TORCH_THREADS", 0),
+        ),
+        worker=Worker(
+            processes=env.int("WORKER_PROCESSES", 2),
+            poll_interval_s=env.float("WORKER_POLL_INTERVAL_S", 2),
+            max_attempts=env.int("JOB_MAX_ATTEMPTS", 3),
+            heartbeat_s=env.float("JOB_HEARTBEAT_S", 30),
+            stale_after_s=env.float("JOB_STALE_AFTER_S", 120),
+            pool=env.str("WORKER_POOL", "process"),
+        ),
+        database=Database(
+            url=env.str("DATABASE_URL", "sqlite:///database.db"),
+            busy_timeout_ms=env.int("DB_BUSY_TIMEOUT_MS", 5000),
+            mmap_size_mb=env.int("DB_MMAP_SIZE_MB", 256),
+            pool_size=env.int("DB_POOL_SIZE", 10),
+            max_overflow=env.int("DB_MAX_OVERFLOW", 20),
+            pool_timeout_s=env.float("DB_POOL_TIMEOUT_S", 30),
+            pool_recycle_s=env.int("DB_POOL_RECYCLE_S", 1800),
+        ),
+        upload=Upload(
+            max_mb=env.int("UPLOAD_MAX_MB", 4096),
+            chunk_mb=env.int("UPLOAD_CHUNK_MB", 8),
+            expire_h=env.float("UPLOAD_EXPIRE_H", 24),
+        ),
+        cache=Cache(
+            enabled=env.bool("CACHE_ENABLED", True),
+            memory_items=env.int("CACHE_MEMORY_ITEMS", 1024),
+            caption_max_mb=env.int("CAPTION_CACHE_MAX_MB", 64),
+            summary_max_mb=env.int("SUMMARY_CACHE_MAX_MB", 64),
+        ),
+        models=Models(
+            loading=env.str("MODEL_LOADING", "disabled"),
+            default_tier=env.enum("DEFAULT_TIER", "balanced", enum=Tier),
+            asr_backend=env.str("ASR_BACKEND", "torch"),
+            caption_backend=env.str("CAPTION_BACKEND", "torch"),
+            summary_backend=env.str("SUMMARY_BACKEND", "torch"),
+        ),
     )
@@ -1,17 +1,39 @@
+from enum import Enum
 from typing import Annotated
 from fastapi import Depends
-from sqlmodel import Session, SQLModel, create_engine, Field
+from sqlalchemy import URL, Engine, Index, event, make_url, text
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.ext.asyncio import AsyncEngine, create_async_engine
+from sqlmodel import Session, SQLModel, create_engine, Field, select
+from sqlmodel.ext.asyncio.session import AsyncSession
 from datetime import datetime, UTC
+from uuid import uuid4
+
+from config.config import Config, Database, Tier, load_config
+from utils.utils import ENV_FILE
+
+config: Config = load_config(ENV_FILE)
 
 
 class VideoTranscriptionPublic(SQLModel):
     id: int
     transcription: str = Field(default="", nullable=False)
     transcription_ready: bool = Field(default=False)
+    # Задача обработки исчерпала попытки, результата не будет
+    transcription_failed: bool = Field(default=False)
     user_id: int
+    # Уровень обработки: набор моделей и частота выборки кадров
+    tier: Tier = Field(default=Tier.balanced)
 
 
 class VideoTranscription(VideoTranscriptionPublic, table=True):
+    # Индекс для перцентилей времени обработки в статистике юзера
+    __table_args__ = (
+        Index(
+            "ix_videotranscription_user_processing", "user_id", "processing_s"
+        ),
+    )
+
     # Поля только для базы (с ID и временем)
     id: int | None = Field(default=None, primary_key=True)
     user_id: int | None = Field(default=None, foreign_key="user.id")
@@ -19,6 +41,60 @@ class VideoTranscription(VideoTranscriptionPublic, table=True):
     created_at: datetime = Field(default_factory=datetime.utcnow)
     completed_at: datetime | None = None
     video_path: str | None = Field(default=None)
+    # SHA-256 содержимого видео для поиска повторных загрузок
+    content_hash: str | None = Field(default=None, index=True)
+    duration_s: float | None = None
+    # Время обработки в секундах, заполняется при завершении
+    processing_s: float | None = None
+    # Результаты взяты из обработки того же видео: processing_s не
+    # заполняется, время обработки не входит в статистику
+    reused_from: int | None = Field(
+        default=None, foreign_key="videotranscription.id"
+    )
+
+
+class JobStatus(str, Enum):
+    queued = "queued"
+    running = "running"
+    done = "done"
+    failed = "failed"
+
+
+# Задача на обработку видео в очереди воркеров
+class Job(SQLModel, table=True):
+    id: int | None = Field(default=None, primary_key=True)
+    transcription_id: int = Field(
+        foreign_key="videotranscription.id", index=True
+    )
+    video_path: str
+    status: JobStatus = Field(default=JobStatus.queued, index=True)
+    attempts: int = 0
+    max_attempts: int = 3
+    error: str | None = None
+    worker_id: str | None = None
+
+    created_at: datetime = Field(
+        default_factory=lambda: datetime.now(UTC).replace(tzinfo=None)
+    )
+    started_at: datetime | None = None
+    heartbeat_at: datetime | None = None
+    finished_at: datetime | None = None
+
+
+# Докачиваемая загрузка видео: принятые байты лежат во временном файле,
+# текущее смещение равно его размеру
+class UploadSession(SQLModel, table=True):
+    id: str = Field(default_factory=lambda: uuid4().hex, primary_key=True)
+    user_id: int = Field(foreign_key="user.id", index=True)
+    filename: str
+    size: int
+    tier: Tier = Field(default=Tier.balanced)
+    transcription_id: int | None = Field(
+        default=None, foreign_key="videotranscription.id"
+    )
+    created_at: datetime = Field(
+        default_factory=lambda: datetime.now(UTC).replace(tzinfo=None)
+    )
 
 
 class UserOut(SQLModel):
@@ -34,6 +110,18 @@ class User(UserOut, table=True):
     disabled: bool = False
 
 
+# Агрегаты по обработанным видео юзера, обновляются при завершении
+# каждой обработки, чтобы /users/stats читал одну строку
+class UserStats(SQLModel, table=True):
+    user_id: int = Field(foreign_key="user.id", primary_key=True)
+    total_videos: int = 0
+    # Видео с временем обработки, без переиспользованных результатов
+    processed_videos: int = 0
+    total_processing_s: float = 0
+    total_video_s: float = 0
+    p95_processing_s: float = 0
+
+
 # Модель под создание отзыва
 class ReviewCreate(SQLModel):
     username: str
@@ -50,8 +138,40 @@ class ReviewResponse(ReviewCreate):
     created_dt_tm: datetime
 
 
+# Страница отзывов, next_cursor передается в следующий запрос
+class ReviewPage(SQLModel):
+    items: list[ReviewResponse]
+    next_cursor: str | None = None
+
+
 # Отзывы
 class Review(ReviewResponse, table=True):
+    # Индексы под сортировки списков отзывов с keyset пагинацией
+    __table_args__ = (
+        Index(
+            "ix_review_transcription_created",
+            "transcription_id",
+            "created_dt_tm",
+            "id",
+        ),
+        Index(
+            "ix_review_transcription_rating_created",
+            "transcription_id",
+            "rating",
+            "created_dt_tm",
+            "id",
+        ),
+        # worst: оценка по возрастанию, внутри оценки новые первыми.
+        # Смешанные направления не читаются обходом индекса выше
+        Index(
+            "ix_review_transcription_rating_newest",
+            "transcription_id",
+            "rating",
+            text("created_dt_tm DESC"),
+            text("id DESC"),
+        ),
+    )
+
     id: int | None = Field(default=None, primary_key=True)
     user_id: int = Field(foreign_key="user.id", index=True)
 
@@ -60,8 +180,63 @@ class Review(ReviewResponse, table=True):
     )
 
 
+# Ключ агрегата отзывов на сервис. NULL в уникальном индексе не мешает
+# дублям, поэтому ключ всегда заполнен
+SERVICE_RATING_KEY = 0
+
+
+# Агрегаты оценок по транскрипции (NULL - отзывы на сервис),
+# обновляются в одной транзакции с созданием отзыва
+class ReviewRating(SQLModel, table=True):
+    id: int | None = Field(default=None, primary_key=True)
+    # id транскрипции или SERVICE_RATING_KEY
+    key: int = Field(unique=True)
+    transcription_id: int | None = Field(
+        default=None, foreign_key="videotranscription.id"
+    )
+    count: int = 0
+    rating_sum: int = 0
+    stars_1: int = 0
+    stars_2: int = 0
+    stars_3: int = 0
+    stars_4: int = 0
+    stars_5: int = 0
+
+
+# Средняя оценка и число отзывов по каждой звезде
+class ReviewSummary(SQLModel):
+    transcription_id: int | None
+    count: int
+    average: float
+    stars: dict[int, int]
+
+
 def create_db_and_tables():
     SQLModel.metadata.create_all(engine)
+    with Session(engine) as session:
+        backfill_processing_s(session)
+
+
+def backfill_processing_s(session: Session) -> int:
+    """Заполняет processing_s видео, обработанных до появления поля.
+
+    Время считается как в прежней статистике: completed_at - created_at.
+    Возвращает число заполненных видео.
+    """
+    transcriptions = session.exec(
+        select(VideoTranscription).where(
+            VideoTranscription.completed_at.is_not(None),
+            VideoTranscription.processing_s.is_(None),
+            VideoTranscription.reused_from.is_(None),
+        )
+    ).all()
+    for transcription in transcriptions:
+        transcription.processing_s = (
+            transcription.completed_at - transcription.created_at
+        ).total_seconds()
+        session.add(transcription)
+    session.commit()
+    return len(transcriptions)
 
 
 def get_session():
@@ -69,9 +244,82 @@ def get_session():
         yield session
 
 
-sql_db_file = "database.db"
-sqlite_url = f"sqlite:///{sql_db_file}"
-connect_args = {"check_same_thread": False}
-engine = create_engine(sqlite_url, connect_args=connect_args)
+async def get_async_session():
+    async with AsyncSession(async_engine, expire_on_commit=False) as session:
+        yield session
+
+
+# Асинхронные драйверы для URL из DATABASE_URL
+ASYNC_DRIVERS = {"sqlite": "aiosqlite", "postgresql": "asyncpg"}
+
+# INSERT ... ON CONFLICT DO UPDATE с одинаковым API в обоих диалектах
+UPSERT_INSERTS = {"sqlite": sqlite.insert, "postgresql": postgresql.insert}
+
+
+def _engine_kwargs(database: Database) -> dict:
+    if make_url(database.url).get_backend_name() != "sqlite":
+        return {
+            "pool_size": database.pool_size,
+            "max_overflow": database.max_overflow,
+            "pool_timeout": database.pool_timeout_s,
+            "pool_recycle": database.pool_recycle_s,
+            "pool_pre_ping": True,
+        }
+    return {
+        "connect_args": {
+            "check_same_thread": False,
+            "timeout": database.busy_timeout_ms / 1000,
+        }
+    }
+
+
+def _set_sqlite_pragmas(engine: Engine, database: Database):
+    @event.listens_for(engine, "connect")
+    def set_sqlite_pragmas(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        cursor.execute("PRAGMA journal_mode=WAL")
+        cursor.execute("PRAGMA synchronous=NORMAL")
+        cursor.execute(f"PRAGMA busy_timeout={database.busy_timeout_ms}")
+        cursor.execute(
+            f"PRAGMA mmap_size={database.mmap_size_mb * 1024 * 1024}"
+        )
+        cursor.close()
+
+
+def make_engine(database: Database) -> Engine:
+    """Создает движок базы по настройкам из конфига.
+
+    SQLite переводится в WAL: читатели не ждут запись прогресса
+    обработки, а писатели ждут друг друга busy_timeout вместо ошибки
+    database is locked. Для серверных СУБД настраивается пул соединений.
+    """
+    url = make_url(database.url)
+    engine = create_engine(url, **_engine_kwargs(database))
+    if url.get_backend_name() == "sqlite":
+        _set_sqlite_pragmas(engine, database)
+    return engine
+
+
+def async_url(url: str) -> URL:
+    """Тот же DATABASE_URL с асинхронным драйвером"""
+    url = make_url(url)
+    backend = url.get_backend_name()
+    if backend not in ASYNC_DRIVERS:
+        raise ValueError(f"Нет асинхронного драйвера для {backend}")
+    return url.set(drivername=f"{backend}+{ASYNC_DRIVERS[backend]}")
+
+
+def make_async_engine(database: Database) -> AsyncEngine:
+    """Асинхронный движок для ручек API с теми же настройками"""
+    url = async_url(database.url)
+    engine = create_async_engine(url, **_engine_kwargs(database))
+    if url.get_backend_name() == "sqlite":
+        _set_sqlite_pragmas(engine.sync_engine, database)
+    return engine
+
+
+engine = make_engine(config.database)
+async_engine = make_async_engine(config.database)
 
 SessionDep = Annotated[Session, Depends(get_session)]
+AsyncSessionDep = Annotated[AsyncSession, Depends(get_async_session)]
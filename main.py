@@ -1,121 +1,124 @@
 from contextlib import asynccontextmanager
-import shutil
 import json
 from pathlib import Path
 from users.users_router import router
+from uploads.uploads_router import router as uploads_router
 
+from fastapi.concurrency import run_in_threadpool
 from fastapi import (
     FastAPI,
     UploadFile,
     HTTPException,
-    BackgroundTasks,
     Depends,
+    Form,
     Query,
+    status,
 )
-from datetime import datetime, UTC
+from fastapi.responses import JSONResponse
 from db import (
     User,
+    AsyncSessionDep,
     SessionDep,
     VideoTranscriptionPublic,
     VideoTranscription,
     ReviewCreate,
+    ReviewPage,
     ReviewResponse,
-    Session,
+    ReviewSummary,
     create_db_and_tables,
     Review,
 )
 
 
-from utils.utils import VIDEO_DIR, TEXT_DIR, SUMMARY_POSTFIX
-from subtitles.subtitles import Subtitles, ImageCaption, TextSummarizer
-from NotesSynchronizer.notes_synchronizer import NotesSynchronizer
-from sqlmodel import select, join, desc, asc
+from utils.utils import TEXT_DIR, SUMMARY_POSTFIX
+from config.config import Tier
+from subtitles.subtitles import config, probe_duration
 
 
 from users.users import get_current_active_user
-from services.video_service import get_user_stats
-
+from services.video_service import (
+    get_cache_stats,
+    get_user_stats,
+    register_video,
+)
+from services.model_registry import ModelRegistry
+from services.review_service import (
+    add_review,
+    get_review_summary,
+    list_reviews,
+)
+from services.upload_service import UploadSizeLimit, receive_video
 
-from typing import List
+models = ModelRegistry(config.models.loading)
 
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     create_db_and_tables()
-    Subtitles()
-    ImageCaption()
-    TextSummarizer()
+    # С MODEL_LOADING=background модели грузятся в фоне, ручки без ML
+    # доступны сразу
+    models.start()
     yield
 
 
 app = FastAPI(lifespan=lifespan)
+# Большое видео отклоняется до того, как multipart попадет на диск
+app.add_middleware(UploadSizeLimit, paths=("/process/",))
 
 app.include_router(router)
-
-
-def write_subtitles(video_path: str, video_id, session: Session):
-    transcription = session.get(VideoTranscription, video_id)
-    transcription.created_at = datetime.now(UTC)
-    subtitles = Subtitles()
-    image_caption = ImageCaption()
-    summarizer = TextSummarizer()
-
-    synchronizer = NotesSynchronizer(subtitles, image_caption, summarizer)
-    notes = synchronizer.synchronize(video_path, video_id)
-    video_summary = synchronizer.generate_summary(notes)
-
-    video_summary_file = str(TEXT_DIR / f"{video_id}_{SUMMARY_POSTFIX}")
-
-    with open(video_summary_file, "w", encoding="utf-8") as f:
-        json.dump(video_summary.summary_dict, f, ensure_ascii=False, indent=2)
-
-    full_transcription = " ".join([note.audio_text for note in notes])
-
-    transcription.transcription = full_transcription
-    transcription.transcription_ready = True
-    transcription.completed_at = datetime.now(UTC)
-    session.add(transcription)
-    session.commit()
+app.include_router(uploads_router)
 
 
 @app.get("/")
-def root():
+async def root():
     return {"message": "Hello World"}
 
 
+# Готовность моделей API: 503, пока в режиме background загружены не
+# все модели или какая-то не загрузилась
+@app.get("/health/ready")
+async def health_ready():
+    models_status = models.status()
+    return JSONResponse(
+        models_status,
+        status_code=(
+            status.HTTP_200_OK
+            if models_status["ready"]
+            else status.HTTP_503_SERVICE_UNAVAILABLE
+        ),
+    )
+
+
 @app.post("/process/", response_model=VideoTranscriptionPublic)
-def process_video(
+async def process_video(
     video: UploadFile,
     session: SessionDep,
-    background_tasks: BackgroundTasks,
+    tier: Tier | None = Form(None),
     current_user: User = Depends(get_current_active_user),
 ):
-    video_transcription = VideoTranscription(
-        transcription="", transcription_ready=False, user_id=current_user.id
+    video_path, content_hash = await receive_video(video)
+    duration_s = await run_in_threadpool(probe_duration, video_path)
+    return await run_in_threadpool(
+        register_video,
+        session,
+        current_user.id,
+        video_path,
+        content_hash,
+        duration_s,
+        tier,
     )
-    session.add(video_transcription)
-    session.commit()
-    session.refresh(video_transcription)
-    video_path = VIDEO_DIR / f"{video_transcription.id}_{video.filename}"
-    with open(video_path, "wb") as f:
-        shutil.copyfileobj(video.file, f)
-
-    background_tasks.add_task(
-        write_subtitles, video_path, video_transcription.id, session
-    )
-    return video_transcription
 
 
 @app.get(
     "/transcription/{transcription_id}",
     response_model=VideoTranscriptionPublic,
 )
-def download_transcription(
+async def download_transcription(
     transcription_id: int,
-    session: SessionDep,
+    session: AsyncSessionDep,
     current_user: User = Depends(get_current_active_user),
 ):
-    transcription = session.get(VideoTranscription, transcription_id)
+    transcription = await session.get(VideoTranscription, transcription_id)
     if not transcription:
         raise HTTPException(
             status_code=404,
@@ -124,8 +127,13 @@ def download_transcription(
     return transcription
 
 
+def read_summary(path: str):
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
 @app.get("/summary/{transcription_id}")
-def download_summary(
+async def download_summary(
     transcription_id: int,
     current_user: User = Depends(get_current_active_user),
 ):
@@ -138,22 +146,30 @@ def download_summary(
             detail=f"transcription with id {transcription_id} not found",
         )
 
-    with open(video_summary_file, "r", encoding="utf-8") as f:
-        return json.load(f)
+    return await run_in_threadpool(read_summary, video_summary_file)
 
 
 @app.get("/users/stats")
-def read_stats(
-    session: SessionDep, current_user: User = Depends(get_current_active_user)
+async def read_stats(
+    session: AsyncSessionDep,
+    current_user: User = Depends(get_current_active_user),
 ):
-    return get_user_stats(session, current_user.id)
+    return await get_user_stats(session, current_user.id)
+
+
+# Попадания в кэши моделей, чтобы подобрать их размер
+@app.get("/cache/stats")
+async def read_cache_stats(
+    current_user: User = Depends(get_current_active_user),
+):
+    return await run_in_threadpool(get_cache_stats)
 
 
 # Создание отзыва
 @app.post("/reviews/", response_model=ReviewResponse)
-def create_review(
+async def create_review(
     review: ReviewCreate,
-    session: SessionDep,
+    session: AsyncSessionDep,
     current_user: User = Depends(get_current_active_user),
 ):
     review = Review(
@@ -163,80 +179,39 @@ def create_review(
         rating=review.rating,
         comment=review.comment,
     )
-    session.add(review)
-    session.commit()
-    session.refresh(review)
-    return review
+    return await add_review(session, review)
+
+
+# Средняя оценка и распределение звезд, без transcription_id - по
+# отзывам на сервис
+@app.get("/reviews/summary", response_model=ReviewSummary)
+async def get_reviews_summary(
+    session: AsyncSessionDep,
+    transcription_id: int | None = Query(None),
+):
+    return await get_review_summary(session, transcription_id)
 
 
 # Запрос отзывов без transcription_id (отзывы на сервис)
-@app.get("/reviews", response_model=List[ReviewResponse])
-def get_service_reviews(
-    session: SessionDep,
+@app.get("/reviews", response_model=ReviewPage)
+async def get_service_reviews(
+    session: AsyncSessionDep,
     limit: int = Query(10, ge=1, le=100),
     sort_by: str = Query("newest", pattern="^(newest|oldest|best|worst)$"),
+    cursor: str | None = Query(None),
 ):
-    statement = (
-        select(
-            Review.id,
-            User.username,
-            Review.transcription_id,
-            Review.rating,
-            Review.comment,
-            Review.created_dt_tm,
-        )
-        .select_from(join(Review, User, Review.user_id == User.id))
-        .where(Review.transcription_id.is_(None))
-    )
-    if sort_by == "newest":
-        statement = statement.order_by(desc(Review.created_dt_tm))
-    elif sort_by == "oldest":
-        statement = statement.order_by(asc(Review.created_dt_tm))
-    elif sort_by == "best":
-        statement = statement.order_by(
-            desc(Review.rating), desc(Review.created_dt_tm)
-        )
-    elif sort_by == "worst":
-        statement = statement.order_by(
-            asc(Review.rating), desc(Review.created_dt_tm)
-        )
-
-    statement = statement.limit(limit)
-    return session.exec(statement).all()
+    return await list_reviews(session, None, limit, sort_by, cursor)
 
 
 # Запрос отзывов на transcription
-@app.get("/reviews/{transcription_id}", response_model=List[ReviewResponse])
-def get_transcription_reviews(
-    session: SessionDep,
+@app.get("/reviews/{transcription_id}", response_model=ReviewPage)
+async def get_transcription_reviews(
+    session: AsyncSessionDep,
     transcription_id: int,
     limit: int = Query(10, ge=1, le=100),
     sort_by: str = Query("newest", pattern="^(newest|oldest|best|worst)$"),
+    cursor: str | None = Query(None),
 ):
-    statement = (
-        select(
-            Review.id,
-            User.username,
-            Review.transcription_id,
-            Review.rating,
-            Review.comment,
-            Review.created_dt_tm,
-        )
-        .select_from(join(Review, User, Review.user_id == User.id))
-        .where(Review.transcription_id == transcription_id)
+    return await list_reviews(
+        session, transcription_id, limit, sort_by, cursor
     )
-    if sort_by == "newest":
-        statement = statement.order_by(desc(Review.created_dt_tm))
-    elif sort_by == "oldest":
-        statement = statement.order_by(asc(Review.created_dt_tm))
-    elif sort_by == "best":
-        statement = statement.order_by(
-            desc(Review.rating), desc(Review.created_dt_tm)
-        )
-    elif sort_by == "worst":
-        statement = statement.order_by(
-            asc(Review.rating), desc(Review.created_dt_tm)
-        )
-
-    statement = statement.limit(limit)
-    return session.exec(statement).all()
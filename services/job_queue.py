@@ -0,0 +1,114 @@
+from datetime import UTC, datetime, timedelta
+
+from sqlalchemy import update
+from sqlmodel import Session, select
+
+from db import Job, JobStatus, VideoTranscription
+
+
+def _now() -> datetime:
+    return datetime.now(UTC).replace(tzinfo=None)
+
+
+def enqueue_job(
+    session: Session, transcription_id: int, video_path: str, max_attempts=3
+) -> Job:
+    """Ставит видео в очередь на обработку"""
+    job = Job(
+        transcription_id=transcription_id,
+        video_path=str(video_path),
+        max_attempts=max_attempts,
+    )
+    session.add(job)
+    session.commit()
+    session.refresh(job)
+    return job
+
+
+def claim_job(session: Session, worker_id: str) -> Job | None:
+    """Атомарно забирает самую старую задачу из очереди.
+
+    Задача переводится в running условным UPDATE, поэтому несколько
+    воркеров не могут забрать одну и ту же задачу.
+    """
+    while True:
+        job_id = session.exec(
+            select(Job.id)
+            .where(Job.status == JobStatus.queued)
+            .order_by(Job.id)
+            .limit(1)
+        ).first()
+        if job_id is None:
+            return None
+
+        now = _now()
+        result = session.execute(
+            update(Job)
+            .where(Job.id == job_id, Job.status == JobStatus.queued)
+            .values(
+                status=JobStatus.running,
+                attempts=Job.attempts + 1,
+                worker_id=worker_id,
+                started_at=now,
+                heartbeat_at=now,
+                error=None,
+            )
+        )
+        session.commit()
+        if result.rowcount == 1:
+            return session.get(Job, job_id)
+
+
+def heartbeat(session: Session, job_id: int):
+    session.execute(
+        update(Job)
+        .where(Job.id == job_id, Job.status == JobStatus.running)
+        .values(heartbeat_at=_now())
+    )
+    session.commit()
+
+
+def complete_job(session: Session, job_id: int):
+    job = session.get(Job, job_id)
+    job.status = JobStatus.done
+    job.finished_at = _now()
+    session.add(job)
+    session.commit()
+
+
+def fail_job(session: Session, job_id: int, error: str) -> Job:
+    """Возвращает задачу в очередь или помечает ее как failed,
+    если попытки исчерпаны.
+
+    Проваленная задача отмечается и на транскрипции, чтобы клиенты
+    отличали ошибку от обработки, которая еще идет.
+    """
+    job = session.get(Job, job_id)
+    job.error = error
+    job.worker_id = None
+    if job.attempts < job.max_attempts:
+        job.status = JobStatus.queued
+    else:
+        job.status = JobStatus.failed
+        job.finished_at = _now()
+        session.execute(
+            update(VideoTranscription)
+            .where(VideoTranscription.id == job.transcription_id)
+            .values(transcription_failed=True)
+        )
+    session.add(job)
+    session.commit()
+    return job
+
+
+def recover_stale_jobs(session: Session, stale_after_s: float) -> list[int]:
+    """Возвращает в очередь задачи упавших воркеров (без heartbeat)"""
+    deadline = _now() - timedelta(seconds=stale_after_s)
+    stale_jobs = session.exec(
+        select(Job).where(
+            Job.status == JobStatus.running, Job.heartbeat_at < deadline
+        )
+    ).all()
+    for job in stale_jobs:
+        fail_job(session, job.id, "Воркер перестал отвечать")
+    return [job.id for job in stale_jobs]
@@ -0,0 +1,98 @@
+import threading
+import traceback
+from enum import Enum
+from typing import Callable
+
+from subtitles.subtitles import ImageCaption, Subtitles, TextSummarizer
+
+LOADING_MODES = ("background", "lazy", "disabled")
+
+MODELS: dict[str, Callable] = {
+    "subtitles": Subtitles,
+    "image_caption": ImageCaption,
+    "summarizer": TextSummarizer,
+}
+
+
+class ModelState(str, Enum):
+    not_loaded = "not_loaded"
+    loading = "loading"
+    ready = "ready"
+    failed = "failed"
+    disabled = "disabled"
+
+
+class ModelRegistry:
+    """Загружает модели в фоне или по первому обращению.
+
+    Состояние каждой модели отдает status(), по нему работает
+    /health/ready. В режиме disabled модели не загружаются совсем,
+    инференс ведет воркер.
+    """
+
+    def __init__(
+        self,
+        loading: str = "background",
+        loaders: dict[str, Callable] | None = None,
+    ):
+        if loading not in LOADING_MODES:
+            raise ValueError(f"Неизвестный режим загрузки моделей: {loading}")
+        self.loading = loading
+        self._loaders = loaders or MODELS
+        initial = (
+            ModelState.disabled
+            if loading == "disabled"
+            else ModelState.not_loaded
+        )
+        self._states = {name: initial for name in self._loaders}
+        self._errors: dict[str, str] = {}
+        self._models: dict[str, object] = {}
+        self._locks = {name: threading.Lock() for name in self._loaders}
+        self._thread: threading.Thread | None = None
+
+    def start(self):
+        """Запускает фоновую загрузку, не блокируя старт приложения"""
+        if self.loading != "background" or self._thread is not None:
+            return
+        self._thread = threading.Thread(
+            target=self._load_all, name="model-loader", daemon=True
+        )
+        self._thread.start()
+
+    def get(self, name: str):
+        """Возвращает модель, при необходимости загружая ее"""
+        if self._states[name] == ModelState.disabled:
+            raise RuntimeError(f"Модель {name} отключена (MODEL_LOADING)")
+        with self._locks[name]:
+            if name not in self._models:
+                self._states[name] = ModelState.loading
+                try:
+                    self._models[name] = self._loaders[name]()
+                except Exception:
+                    self._states[name] = ModelState.failed
+                    self._errors[name] = traceback.format_exc(limit=1)
+                    raise
+                self._states[name] = ModelState.ready
+                self._errors.pop(name, None)
+        return self._models[name]
+
+    def status(self) -> dict:
+        models = {
+            name: {"state": state.value, "error": self._errors.get(name)}
+            for name, state in self._states.items()
+        }
+        # В режиме lazy незагруженная модель не мешает готовности: она
+        # загрузится по первому обращению
+        waiting = {ModelState.failed}
+        if self.loading == "background":
+            waiting |= {ModelState.not_loaded, ModelState.loading}
+        ready = not waiting.intersection(self._states.values())
+        return {"ready": ready, "loading": self.loading, "models": models}
+
+    def _load_all(self):
+        for name in self._loaders:
+            try:
+                self.get(name)
+            except Exception:
+                # Ошибка видна в status(), остальные модели грузятся дальше
+                continue
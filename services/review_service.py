@@ -0,0 +1,284 @@
+import base64
+import json
+import sys
+from datetime import datetime
+
+from fastapi import HTTPException, status
+from sqlalchemy import and_, func, or_
+from sqlmodel import Session, join, select
+from sqlmodel.ext.asyncio.session import AsyncSession
+
+from db import (
+    SERVICE_RATING_KEY,
+    UPSERT_INSERTS,
+    Review,
+    ReviewRating,
+    User,
+    engine,
+)
+
+STARS = range(1, 6)
+
+# Порядок сортировки: (колонка, по убыванию). id в конце делает ключ
+# уникальным, поэтому страницы не теряют и не повторяют отзывы
+SORT_KEYS = {
+    "newest": ((Review.created_dt_tm, True), (Review.id, True)),
+    "oldest": ((Review.created_dt_tm, False), (Review.id, False)),
+    "best": (
+        (Review.rating, True),
+        (Review.created_dt_tm, True),
+        (Review.id, True),
+    ),
+    "worst": (
+        (Review.rating, False),
+        (Review.created_dt_tm, True),
+        (Review.id, True),
+    ),
+}
+
+
+def _for_transcription(model, transcription_id: int | None):
+    """Фильтр по транскрипции, None выбирает отзывы на сервис"""
+    if transcription_id is None:
+        return model.transcription_id.is_(None)
+    return model.transcription_id == transcription_id
+
+
+def rating_key(transcription_id: int | None) -> int:
+    """Ключ ReviewRating: id транскрипции или ключ отзывов на сервис"""
+    if transcription_id is None:
+        return SERVICE_RATING_KEY
+    return transcription_id
+
+
+def encode_cursor(sort_by: str, row) -> str:
+    """Непрозрачный курсор: ключ сортировки последнего отзыва страницы"""
+    key = [getattr(row, column.key) for column, _ in SORT_KEYS[sort_by]]
+    payload = {
+        "sort": sort_by,
+        "key": [
+            value.isoformat() if isinstance(value, datetime) else value
+            for value in key
+        ],
+    }
+    return base64.urlsafe_b64encode(json.dumps(payload).encode()).decode()
+
+
+def decode_cursor(sort_by: str, cursor: str) -> list:
+    try:
+        payload = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+        if payload["sort"] != sort_by:
+            raise ValueError("курсор от другой сортировки")
+        keys = SORT_KEYS[sort_by]
+        if len(payload["key"]) != len(keys):
+            raise ValueError("неверная длина ключа")
+        return [
+            (
+                datetime.fromisoformat(value)
+                if column.type.python_type is datetime
+                else int(value)
+            )
+            for (column, _), value in zip(keys, payload["key"])
+        ]
+    except (ValueError, KeyError, TypeError):
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST, detail="Invalid cursor"
+        )
+
+
+def _after(keys, values):
+    """Условие для строк строго после курсора в порядке сортировки.
+
+    Нестрогая граница по первой колонке ключа дублирует условие OR в
+    виде, который планировщик превращает в диапазон индекса.
+    """
+    conditions = []
+    for position, (column, descending) in enumerate(keys):
+        previous = [
+            key == value
+            for (key, _), value in zip(keys[:position], values[:position])
+        ]
+        value = values[position]
+        conditions.append(
+            and_(*previous, column < value if descending else column > value)
+        )
+    first, descending = keys[0]
+    bound = first <= values[0] if descending else first >= values[0]
+    return and_(bound, or_(*conditions))
+
+
+def reviews_page_statement(
+    transcription_id: int | None,
+    limit: int,
+    sort_by: str,
+    cursor: str | None = None,
+):
+    """Запрос страницы отзывов: limit + 1 строк после курсора"""
+    keys = SORT_KEYS[sort_by]
+    statement = (
+        select(
+            Review.id,
+            User.username,
+            Review.transcription_id,
+            Review.rating,
+            Review.comment,
+            Review.created_dt_tm,
+        )
+        .select_from(join(Review, User, Review.user_id == User.id))
+        .where(_for_transcription(Review, transcription_id))
+    )
+    if cursor is not None:
+        statement = statement.where(
+            _after(keys, decode_cursor(sort_by, cursor))
+        )
+    return statement.order_by(
+        *(column.desc() if desc else column.asc() for column, desc in keys)
+    ).limit(limit + 1)
+
+
+async def list_reviews(
+    session: AsyncSession,
+    transcription_id: int | None,
+    limit: int,
+    sort_by: str,
+    cursor: str | None = None,
+) -> dict:
+    """Страница отзывов на транскрипцию или на сервис (None).
+
+    Keyset пагинация: следующая страница продолжает индекс с ключа
+    курсора, поэтому глубокие страницы читаются так же быстро, как
+    первая.
+    """
+    statement = reviews_page_statement(
+        transcription_id, limit, sort_by, cursor
+    )
+    rows = (await session.exec(statement)).all()
+    items = rows[:limit]
+    next_cursor = None
+    if len(rows) > limit:
+        next_cursor = encode_cursor(sort_by, items[-1])
+    return {"items": items, "next_cursor": next_cursor}
+
+
+async def add_review(session: AsyncSession, review: Review) -> Review:
+    """Сохраняет отзыв и в той же транзакции обновляет агрегаты оценок.
+
+    Строка агрегатов создается или обновляется одним upsert по ключу,
+    а счетчики увеличиваются на стороне базы, поэтому одновременные
+    отзывы, в том числе первые на транскрипцию, не теряют обновления.
+    """
+    session.add(review)
+    star = f"stars_{review.rating}"
+    insert = UPSERT_INSERTS[session.bind.dialect.name]
+    await session.exec(
+        insert(ReviewRating)
+        .values(
+            key=rating_key(review.transcription_id),
+            transcription_id=review.transcription_id,
+            count=1,
+            rating_sum=review.rating,
+            **{star: 1},
+        )
+        .on_conflict_do_update(
+            index_elements=[ReviewRating.key],
+            set_={
+                "count": ReviewRating.count + 1,
+                "rating_sum": ReviewRating.rating_sum + review.rating,
+                star: getattr(ReviewRating, star) + 1,
+            },
+        )
+    )
+    await session.commit()
+    await session.refresh(review)
+    return review
+
+
+def _summary(rating: ReviewRating | None, transcription_id: int | None):
+    count = rating.count if rating else 0
+    return {
+        "transcription_id": transcription_id,
+        "count": count,
+        "average": round(rating.rating_sum / count, 2) if count else 0,
+        "stars": {
+            star: getattr(rating, f"stars_{star}") if rating else 0
+            for star in STARS
+        },
+    }
+
+
+async def get_review_summary(
+    session: AsyncSession, transcription_id: int | None
+) -> dict:
+    """Агрегаты оценок одной строкой ReviewRating по уникальному ключу.
+
+    Отзывы на сервис хранятся под SERVICE_RATING_KEY, а не под NULL.
+    """
+    rating = (
+        await session.exec(
+            select(ReviewRating).where(
+                ReviewRating.key == rating_key(transcription_id)
+            )
+        )
+    ).first()
+    return _summary(rating, transcription_id)
+
+
+def _counters(rating: ReviewRating | None) -> tuple | None:
+    if rating is None:
+        return None
+    return (rating.count, rating.rating_sum) + tuple(
+        getattr(rating, f"stars_{star}") for star in STARS
+    )
+
+
+def check_review_ratings(session: Session, repair: bool = False) -> list:
+    """Сверяет ReviewRating с отзывами и возвращает расходящиеся ключи.
+
+    С repair=True расходящиеся агрегаты пересобираются из отзывов.
+    """
+    expected: dict[int | None, ReviewRating] = {}
+    for transcription_id, rating, number in session.exec(
+        select(Review.transcription_id, Review.rating, func.count()).group_by(
+            Review.transcription_id, Review.rating
+        )
+    ).all():
+        aggregate = expected.setdefault(
+            transcription_id,
+            ReviewRating(
+                key=rating_key(transcription_id),
+                transcription_id=transcription_id,
+            ),
+        )
+        aggregate.count += number
+        aggregate.rating_sum += rating * number
+        setattr(aggregate, f"stars_{rating}", number)
+
+    stored = {
+        aggregate.transcription_id: aggregate
+        for aggregate in session.exec(select(ReviewRating)).all()
+    }
+
+    mismatched = [
+        transcription_id
+        for transcription_id in expected.keys() | stored.keys()
+        if _counters(stored.get(transcription_id))
+        != _counters(expected.get(transcription_id))
+    ]
+    mismatched.sort(key=lambda key: (key is not None, key or 0))
+    if repair and mismatched:
+        for transcription_id in mismatched:
+            if transcription_id in stored:
+                session.delete(stored[transcription_id])
+        session.flush()
+        for transcription_id in mismatched:
+            if transcription_id in expected:
+                session.add(expected[transcription_id])
+        session.commit()
+    return mismatched
+
+
+if __name__ == "__main__":
+    # PYTHONPATH=. python services/review_service.py [--repair]
+    with Session(engine) as session:
+        keys = check_review_ratings(session, repair="--repair" in sys.argv)
+    print(f"Расхождений в агрегатах оценок: {len(keys)} {keys}")
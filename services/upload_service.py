@@ -0,0 +1,284 @@
+import asyncio
+import hashlib
+import os
+import time
+from contextlib import contextmanager
+from datetime import UTC, datetime, timedelta
+from pathlib import Path
+from typing import AsyncIterator
+from uuid import uuid4
+
+import anyio
+from fastapi import HTTPException, UploadFile, status
+from fastapi.responses import JSONResponse
+from sqlmodel import Session, select
+from starlette.datastructures import Headers
+
+from db import UploadSession
+from subtitles.subtitles import config
+from utils.utils import VIDEO_DIR
+
+try:
+    import fcntl
+except ImportError:  # Windows: блокировка только внутри процесса
+    fcntl = None
+
+MAX_UPLOAD_BYTES = config.upload.max_mb * 1024 * 1024
+UPLOAD_CHUNK_SIZE = config.upload.chunk_mb * 1024 * 1024
+# Запас на границы и поля multipart сверх самого файла
+MULTIPART_OVERHEAD = 64 * 1024
+PARTIAL_PREFIX = ".upload-"
+
+# Состояние SHA-256 (вместе с числом захэшированных байт) и блокировки
+# докачиваемых загрузок этого процесса. Если файл дописал другой
+# процесс или сервер перезапущен, хэш восстанавливается по файлу.
+_hashers: dict[str, tuple["hashlib._Hash", int]] = {}
+_locks: dict[str, asyncio.Lock] = {}
+
+
+def _too_large() -> HTTPException:
+    return HTTPException(
+        status_code=status.HTTP_413_CONTENT_TOO_LARGE,
+        detail=f"Максимальный размер видео {config.upload.max_mb} МБ",
+    )
+
+
+def check_upload_size(size: int | None):
+    """Отклоняет загрузку больше UPLOAD_MAX_MB до приема тела"""
+    if size is not None and size > MAX_UPLOAD_BYTES:
+        raise _too_large()
+
+
+class UploadSizeLimit:
+    """ASGI middleware, ограничивающее тело запросов загрузки видео.
+
+    Starlette сохраняет multipart во временный файл до вызова ручки,
+    поэтому размер проверяется здесь: по Content-Length до чтения тела,
+    а для тела без него по мере приема.
+    """
+
+    def __init__(self, app, paths: tuple[str, ...]):
+        self.app = app
+        self.paths = paths
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["path"] not in self.paths:
+            await self.app(scope, receive, send)
+            return
+        max_bytes = MAX_UPLOAD_BYTES + MULTIPART_OVERHEAD
+        length = Headers(scope=scope).get("content-length", "")
+        if length.isdigit() and int(length) > max_bytes:
+            error = _too_large()
+            response = JSONResponse(
+                {"detail": error.detail}, status_code=error.status_code
+            )
+            await response(scope, receive, send)
+            return
+
+        received = 0
+
+        async def limited_receive():
+            nonlocal received
+            message = await receive()
+            if message["type"] == "http.request":
+                received += len(message.get("body", b""))
+                if received > max_bytes:
+                    raise _too_large()
+            return message
+
+        await self.app(scope, limited_receive, send)
+
+
+def store_by_hash(tmp_path: Path, content_hash: str) -> tuple[Path, str]:
+    """Переносит принятый файл в хранилище с именем по SHA-256.
+
+    Одинаковые файлы, загруженные под разными именами, хранятся в одном
+    экземпляре. Имя без расширения: копия ищется одной проверкой, а
+    ffmpeg определяет формат по содержимому.
+    """
+    video_path = VIDEO_DIR / content_hash
+    if video_path.exists():
+        tmp_path.unlink(missing_ok=True)
+        return video_path, content_hash
+    os.replace(tmp_path, video_path)
+    return video_path, content_hash
+
+
+async def _write_chunks(
+    chunks: AsyncIterator[bytes], path: Path, digest, max_bytes: int
+) -> int:
+    """Дописывает поток в файл крупными блоками, считая хэш.
+
+    Возвращает число записанных байт. Запись на диск и хэширование
+    выполняются вне event loop.
+    """
+    written = 0
+    buffer = bytearray()
+    async with await anyio.open_file(path, "ab") as f:
+        try:
+            async for chunk in chunks:
+                if written + len(buffer) + len(chunk) > max_bytes:
+                    raise HTTPException(
+                        status_code=status.HTTP_413_CONTENT_TOO_LARGE,
+                        detail="Размер загрузки превышает допустимый",
+                    )
+                buffer += chunk
+                if len(buffer) >= UPLOAD_CHUNK_SIZE:
+                    written += await _flush(f, buffer, digest)
+        finally:
+            # Даже при обрыве соединения принятые байты сохраняются
+            if buffer:
+                written += await _flush(f, buffer, digest)
+    return written
+
+
+async def _flush(f, buffer: bytearray, digest) -> int:
+    data = bytes(buffer)
+    buffer.clear()
+    await f.write(data)
+    await anyio.to_thread.run_sync(digest.update, data)
+    return len(data)
+
+
+async def _iter_upload_file(file: UploadFile) -> AsyncIterator[bytes]:
+    while chunk := await file.read(UPLOAD_CHUNK_SIZE):
+        yield chunk
+
+
+async def receive_video(file: UploadFile) -> tuple[Path, str]:
+    """Принимает видео блоками с проверкой размера и хэшированием"""
+    check_upload_size(file.size)
+    digest = hashlib.sha256()
+    tmp_path = VIDEO_DIR / f"{PARTIAL_PREFIX}{uuid4().hex}"
+    try:
+        await _write_chunks(
+            _iter_upload_file(file), tmp_path, digest, MAX_UPLOAD_BYTES
+        )
+        return store_by_hash(tmp_path, digest.hexdigest())
+    finally:
+        tmp_path.unlink(missing_ok=True)
+
+
+def partial_path(upload: UploadSession) -> Path:
+    return VIDEO_DIR / f"{PARTIAL_PREFIX}{upload.id}"
+
+
+def upload_offset(upload: UploadSession) -> int:
+    path = partial_path(upload)
+    return path.stat().st_size if path.exists() else 0
+
+
+def _restore_hasher(upload: UploadSession):
+    digest = hashlib.sha256()
+    path = partial_path(upload)
+    if path.exists():
+        with open(path, "rb") as f:
+            while chunk := f.read(UPLOAD_CHUNK_SIZE):
+                digest.update(chunk)
+    return digest
+
+
+def _cached_hasher(upload: UploadSession, offset: int):
+    """Хэш этого процесса, если он покрывает ровно offset байт файла"""
+    digest, hashed = _hashers.get(upload.id, (None, -1))
+    return digest if hashed == offset else None
+
+
+@contextmanager
+def _partial_file_lock(upload: UploadSession):
+    """Межпроцессная блокировка файла докачки на время записи куска.
+
+    Несколько воркеров uvicorn не должны одновременно проверять
+    смещение и дописывать один файл. Блокировка снимается ОС, даже если
+    процесс упал, а занятый файл сразу дает 409.
+    """
+    with open(partial_path(upload), "ab") as f:
+        if fcntl is not None:
+            try:
+                fcntl.flock(f, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                raise HTTPException(
+                    status_code=status.HTTP_409_CONFLICT,
+                    detail={
+                        "message": "Загрузка уже идет в другом запросе",
+                        "offset": upload_offset(upload),
+                    },
+                )
+        yield
+
+
+async def append_chunk(
+    upload: UploadSession, offset: int, chunks: AsyncIterator[bytes]
+) -> int:
+    """Дописывает очередной кусок докачиваемой загрузки.
+
+    offset должен совпадать с числом уже принятых байт, иначе 409 с
+    текущим смещением, чтобы клиент продолжил с нужного места.
+    Возвращает новое смещение.
+    """
+    lock = _locks.setdefault(upload.id, asyncio.Lock())
+    async with lock:
+        with _partial_file_lock(upload):
+            current = upload_offset(upload)
+            if offset != current:
+                raise HTTPException(
+                    status_code=status.HTTP_409_CONFLICT,
+                    detail={"message": "Неверное смещение", "offset": current},
+                )
+            digest = _cached_hasher(upload, current)
+            if digest is None:
+                digest = await anyio.to_thread.run_sync(
+                    _restore_hasher, upload
+                )
+            # При ошибке записи хэш может не совпасть с файлом
+            _hashers.pop(upload.id, None)
+            await _write_chunks(
+                chunks, partial_path(upload), digest, upload.size - current
+            )
+            new_offset = upload_offset(upload)
+            _hashers[upload.id] = (digest, new_offset)
+            return new_offset
+
+
+def finish_upload(upload: UploadSession) -> tuple[Path, str]:
+    """Переносит полностью принятый файл в хранилище видео"""
+    digest = _cached_hasher(upload, upload_offset(upload)) or _restore_hasher(
+        upload
+    )
+    _hashers.pop(upload.id, None)
+    _locks.pop(upload.id, None)
+    return store_by_hash(partial_path(upload), digest.hexdigest())
+
+
+def expire_uploads(session: Session, max_age_s: float) -> int:
+    """Удаляет брошенные загрузки: сессии и файлы докачки без активности.
+
+    Активностью считается создание сессии или последняя запись в файл.
+    Файлы без сессии (оборванный прием /process/) удаляются по времени
+    изменения. Возвращает число удаленных файлов и сессий.
+    """
+    cutoff = time.time() - max_age_s
+    created_before = datetime.now(UTC).replace(tzinfo=None) - timedelta(
+        seconds=max_age_s
+    )
+
+    def inactive(path: Path) -> bool:
+        return not path.exists() or path.stat().st_mtime < cutoff
+
+    removed = 0
+    for upload in session.exec(
+        select(UploadSession).where(UploadSession.created_at < created_before)
+    ).all():
+        if inactive(partial_path(upload)):
+            partial_path(upload).unlink(missing_ok=True)
+            session.delete(upload)
+            removed += 1
+    session.commit()
+
+    sessions = set(session.exec(select(UploadSession.id)).all())
+    for path in VIDEO_DIR.glob(f"{PARTIAL_PREFIX}*"):
+        upload_id = path.name.removeprefix(PARTIAL_PREFIX)
+        if upload_id not in sessions and inactive(path):
+            path.unlink(missing_ok=True)
+            removed += 1
+    return removed
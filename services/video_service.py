@@ -1,25 +1,331 @@
+import json
+import math
+import shutil
+from datetime import datetime, UTC
+from pathlib import Path
+
+from sqlalchemy import func, update
 from sqlmodel import Session, select
-from db import VideoTranscription
+from sqlmodel.ext.asyncio.session import AsyncSession
+
+from config.config import Tier, tier_sampling
+from db import UPSERT_INSERTS, UserStats, VideoTranscription, engine
+from NotesSynchronizer.notes_synchronizer import NotesSynchronizer
+from services.job_queue import enqueue_job
+from subtitles.cache import PersistentCache
+from subtitles.subtitles import (
+    config,
+    Subtitles,
+    ImageCaption,
+    TextSummarizer,
+)
+from utils.utils import (
+    CAPTION_CACHE_FILE,
+    SUMMARY_CACHE_FILE,
+    SUMMARY_POSTFIX,
+    SUMMARY_TREE_POSTFIX,
+    TEXT_DIR,
+)
+
+# Перцентиль времени обработки в /users/stats
+STATS_PERCENTILE = 0.95
+
+
+def _percentile_statement(user_id: int, count: int):
+    """Время обработки по nearest-rank перцентилю среди count видео с
+    processing_s"""
+    return (
+        select(VideoTranscription.processing_s)
+        .where(
+            VideoTranscription.user_id == user_id,
+            VideoTranscription.processing_s.is_not(None),
+        )
+        .order_by(VideoTranscription.processing_s)
+        .offset(max(math.ceil(STATS_PERCENTILE * count) - 1, 0))
+        .limit(1)
+    )
 
 
-def get_user_stats(session: Session, user_id: int):
-    """Считает количество видео и среднее время обработки для юзера"""
-    statement = select(VideoTranscription).where(
-        VideoTranscription.user_id == user_id,
-        VideoTranscription.completed_at.is_not(None),
+def compute_user_stats(session: Session, user_id: int) -> UserStats:
+    """Пересчитывает агрегаты юзера запросами к базе без загрузки строк.
+
+    Видео считаются завершенные, время обработки - только у видео с
+    processing_s (без переиспользованных результатов).
+    """
+    total_videos, processed_videos, total_processing_s, total_video_s = (
+        session.exec(
+            select(
+                func.count(VideoTranscription.id),
+                func.count(VideoTranscription.processing_s),
+                func.coalesce(func.sum(VideoTranscription.processing_s), 0.0),
+                func.coalesce(func.sum(VideoTranscription.duration_s), 0.0),
+            ).where(
+                VideoTranscription.user_id == user_id,
+                VideoTranscription.completed_at.is_not(None),
+            )
+        ).one()
+    )
+    p95 = session.exec(
+        _percentile_statement(user_id, processed_videos)
+    ).first()
+    return UserStats(
+        user_id=user_id,
+        total_videos=total_videos,
+        processed_videos=processed_videos,
+        total_processing_s=total_processing_s,
+        total_video_s=total_video_s,
+        p95_processing_s=p95 or 0,
     )
-    videos = session.exec(statement).all()
 
-    if not videos:
-        return {"total_videos": 0, "avg_processing_time": 0}
 
-    durations = [
-        (v.completed_at - v.created_at).total_seconds() for v in videos
-    ]
+def update_user_stats(session: Session, transcription: VideoTranscription):
+    """Добавляет завершенную обработку в агрегаты юзера.
+
+    Строка UserStats создается или обновляется одним upsert, счетчики
+    увеличиваются на стороне базы, поэтому параллельные воркеры не
+    теряют обновления и не сталкиваются на первой обработке юзера.
+    Перцентиль берется одним запросом по индексу (user_id, processing_s).
+    """
+    user_id = transcription.user_id
+    if user_id is None:
+        return
+    session.add(transcription)
+    processed = transcription.processing_s is not None
+    processing_s = transcription.processing_s or 0
+    duration_s = transcription.duration_s or 0
+    values = {
+        "user_id": user_id,
+        "total_videos": 1,
+        "processed_videos": int(processed),
+        "total_processing_s": processing_s,
+        "total_video_s": duration_s,
+    }
+    if (
+        session.exec(
+            select(UserStats.user_id).where(UserStats.user_id == user_id)
+        ).first()
+        is None
+    ):
+        # Первая обработка юзера или статистика еще не собиралась. Если
+        # другой воркер успеет вставить строку, конфликт прибавит к ней
+        # только эту обработку
+        values = compute_user_stats(session, user_id).model_dump()
+    insert = UPSERT_INSERTS[session.get_bind().dialect.name]
+    session.execute(
+        insert(UserStats)
+        .values(**values)
+        .on_conflict_do_update(
+            index_elements=[UserStats.user_id],
+            set_={
+                "total_videos": UserStats.total_videos + 1,
+                "processed_videos": UserStats.processed_videos
+                + int(processed),
+                "total_processing_s": UserStats.total_processing_s
+                + processing_s,
+                "total_video_s": UserStats.total_video_s + duration_s,
+            },
+        )
+    )
+    if not processed:
+        return
+    processed_videos = session.exec(
+        select(UserStats.processed_videos).where(UserStats.user_id == user_id)
+    ).one()
+    p95 = session.exec(
+        _percentile_statement(user_id, processed_videos)
+    ).first()
+    session.execute(
+        update(UserStats)
+        .where(UserStats.user_id == user_id)
+        .values(p95_processing_s=p95 or 0)
+    )
 
-    avg_time = sum(durations) / len(durations)
 
+async def get_user_stats(session: AsyncSession, user_id: int):
+    """Статистика юзера: чтение одной строки UserStats по ключу.
+
+    total_videos и total_minutes учитывают все завершенные видео, а
+    avg_processing_time и p95_processing_time - только обработанные
+    моделями: переиспользованные результаты того же видео обработки не
+    требуют.
+    """
+    stats = await session.get(UserStats, user_id)
+    if stats is None:
+        stats = await session.run_sync(compute_user_stats, user_id)
+    avg_time = (
+        stats.total_processing_s / stats.processed_videos
+        if stats.processed_videos
+        else 0
+    )
     return {
-        "total_videos": len(videos),
+        "total_videos": stats.total_videos,
         "avg_processing_time": round(avg_time, 2),
+        "total_minutes": round(stats.total_video_s / 60, 2),
+        "p95_processing_time": round(stats.p95_processing_s, 2),
     }
+
+
+def complete_transcription(
+    session: Session,
+    transcription: VideoTranscription,
+    text: str,
+    source: VideoTranscription | None = None,
+):
+    """Сохраняет результат обработки и обновляет статистику юзера.
+
+    source - обработка того же видео, чьи результаты переиспользованы.
+    """
+    completed_at = datetime.now(UTC)
+    transcription.transcription = text
+    transcription.transcription_ready = True
+    transcription.completed_at = completed_at
+    if source is not None:
+        transcription.reused_from = source.id
+    else:
+        # created_at после чтения из базы приходит без часового пояса
+        transcription.processing_s = (
+            completed_at.replace(tzinfo=None)
+            - transcription.created_at.replace(tzinfo=None)
+        ).total_seconds()
+    update_user_stats(session, transcription)
+    session.commit()
+
+
+def get_cache_stats() -> dict:
+    """Суммарные счетчики кэшей моделей по всем процессам воркера"""
+    stats = {}
+    for name, path in (
+        ("captions", CAPTION_CACHE_FILE),
+        ("summaries", SUMMARY_CACHE_FILE),
+    ):
+        if not path.exists():
+            continue
+        cache = PersistentCache(path)
+        try:
+            stats[name] = cache.total_stats
+        finally:
+            cache.close()
+    return stats
+
+
+def write_subtitles(video_path: str, video_id: int):
+    """Обрабатывает видео и сохраняет транскрипцию и саммари.
+
+    Не принимает сессию запроса: каждая запись в базу открывает свою
+    короткую сессию, поэтому функцию можно вызывать из воркера.
+    """
+    with Session(engine) as session:
+        transcription = session.get(VideoTranscription, video_id)
+        transcription.created_at = datetime.now(UTC)
+        tier = transcription.tier
+        session.add(transcription)
+        session.commit()
+
+    def save_progress(partial_text: str):
+        with Session(engine) as session:
+            transcription = session.get(VideoTranscription, video_id)
+            transcription.transcription = partial_text
+            session.add(transcription)
+            session.commit()
+
+    synchronizer = NotesSynchronizer(
+        Subtitles(tier),
+        ImageCaption(tier),
+        TextSummarizer(tier),
+        sampling=tier_sampling(config.frame_sampling, tier),
+    )
+    notes = synchronizer.synchronize(video_path, video_id, save_progress)
+    video_summary = synchronizer.generate_summary(
+        notes, TEXT_DIR / f"{video_id}_{SUMMARY_TREE_POSTFIX}"
+    )
+
+    video_summary_file = str(TEXT_DIR / f"{video_id}_{SUMMARY_POSTFIX}")
+
+    with open(video_summary_file, "w", encoding="utf-8") as f:
+        json.dump(video_summary.summary_dict, f, ensure_ascii=False, indent=2)
+
+    for model in (synchronizer.image_caption, synchronizer.summarizer):
+        if model.cache is not None:
+            model.cache.flush_stats()
+
+    full_transcription = " ".join([note.audio_text for note in notes])
+
+    with Session(engine) as session:
+        transcription = session.get(VideoTranscription, video_id)
+        complete_transcription(session, transcription, full_transcription)
+
+
+def find_completed_transcription(
+    session: Session, content_hash: str, tier: Tier = Tier.balanced
+) -> VideoTranscription | None:
+    """Ищет уже обработанное на том же уровне видео с тем же содержимым"""
+    return session.exec(
+        select(VideoTranscription)
+        .where(
+            VideoTranscription.content_hash == content_hash,
+            VideoTranscription.tier == tier,
+            VideoTranscription.transcription_ready.is_(True),
+        )
+        .order_by(VideoTranscription.id)
+        .limit(1)
+    ).first()
+
+
+def link_transcription_results(
+    session: Session,
+    transcription: VideoTranscription,
+    source: VideoTranscription,
+):
+    """Переиспользует результаты обработки того же видео без пересчета"""
+    shutil.copyfile(
+        TEXT_DIR / f"{source.id}_{SUMMARY_POSTFIX}",
+        TEXT_DIR / f"{transcription.id}_{SUMMARY_POSTFIX}",
+    )
+    complete_transcription(
+        session, transcription, source.transcription, source
+    )
+    session.refresh(transcription)
+
+
+def register_video(
+    session: Session,
+    user_id: int,
+    video_path: Path,
+    content_hash: str,
+    duration_s: float | None = None,
+    tier: Tier | None = None,
+) -> VideoTranscription:
+    """Создает запись о загруженном видео и ставит его в очередь.
+
+    Если то же видео уже обработано на том же уровне, результаты
+    переиспользуются сразу.
+    """
+    video_transcription = VideoTranscription(
+        transcription="",
+        transcription_ready=False,
+        user_id=user_id,
+        video_path=str(video_path),
+        content_hash=content_hash,
+        duration_s=duration_s,
+        tier=tier or config.models.default_tier,
+    )
+    session.add(video_transcription)
+    session.commit()
+    session.refresh(video_transcription)
+
+    source = find_completed_transcription(
+        session, content_hash, video_transcription.tier
+    )
+    if source is not None:
+        link_transcription_results(session, video_transcription, source)
+        return video_transcription
+
+    # Обработку выполняет отдельный процесс worker.py
+    enqueue_job(
+        session,
+        video_transcription.id,
+        video_path,
+        max_attempts=config.worker.max_attempts,
+    )
+    session.refresh(video_transcription)
+    return video_transcription
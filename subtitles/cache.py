@@ -0,0 +1,171 @@
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from pathlib import Path
+
+
+class PersistentCache:
+    """Двухуровневый кэш строк: LRU в памяти и SQLite на диске.
+
+    Дисковый уровень ограничен по суммарному размеру значений: при
+    превышении max_disk_bytes удаляются записи, к которым дольше всего
+    не обращались. Размер считается по таблице в транзакции записи,
+    поэтому лимит общий для всех процессов, пишущих в файл.
+    """
+
+    def __init__(
+        self,
+        path: str | Path,
+        memory_items: int = 1024,
+        max_disk_bytes: int = 64 * 1024 * 1024,
+    ):
+        self.memory_items = memory_items
+        self.max_disk_bytes = max_disk_bytes
+        self.memory_hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self._flushed = {"memory_hits": 0, "disk_hits": 0, "misses": 0}
+
+        self._memory: OrderedDict[str, str] = OrderedDict()
+        self._lock = threading.Lock()
+        self._connection = sqlite3.connect(str(path), check_same_thread=False)
+        self._connection.execute("PRAGMA journal_mode=WAL")
+        self._connection.execute(
+            "CREATE TABLE IF NOT EXISTS cache ("
+            "key TEXT PRIMARY KEY, value TEXT NOT NULL, "
+            "size INTEGER NOT NULL, accessed_at REAL NOT NULL)"
+        )
+        self._connection.execute(
+            "CREATE INDEX IF NOT EXISTS ix_cache_accessed_at "
+            "ON cache (accessed_at)"
+        )
+        self._connection.execute(
+            "CREATE TABLE IF NOT EXISTS stats ("
+            "name TEXT PRIMARY KEY, value INTEGER NOT NULL)"
+        )
+        self._connection.commit()
+
+    def get(self, key: str) -> str | None:
+        with self._lock:
+            if key in self._memory:
+                self._memory.move_to_end(key)
+                self.memory_hits += 1
+                return self._memory[key]
+
+            row = self._connection.execute(
+                "SELECT value FROM cache WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+
+            self._connection.execute(
+                "UPDATE cache SET accessed_at = ? WHERE key = ?",
+                (time.time(), key),
+            )
+            self._connection.commit()
+            self.disk_hits += 1
+            self._remember(key, row[0])
+            return row[0]
+
+    def set(self, key: str, value: str):
+        size = len(value.encode("utf-8"))
+        with self._lock:
+            self._remember(key, value)
+            # Блокировка записи сразу: вставка, подсчет размера и
+            # вытеснение не пересекаются с другими процессами
+            self._connection.execute("BEGIN IMMEDIATE")
+            try:
+                self._connection.execute(
+                    "INSERT OR REPLACE INTO cache "
+                    "(key, value, size, accessed_at) VALUES (?, ?, ?, ?)",
+                    (key, value, size, time.time()),
+                )
+                self._evict()
+            except BaseException:
+                self._connection.rollback()
+                raise
+            self._connection.commit()
+
+    @property
+    def stats(self) -> dict:
+        """Счетчики обращений этого процесса"""
+        return self._format_stats(
+            {name: getattr(self, name) for name in self._flushed}
+        )
+
+    @property
+    def total_stats(self) -> dict:
+        """Счетчики всех процессов, сохраненные flush_stats, вместе с
+        еще не сохраненными счетчиками этого процесса"""
+        with self._lock:
+            counters = dict(
+                self._connection.execute("SELECT name, value FROM stats")
+            )
+        return self._format_stats(
+            {
+                name: counters.get(name, 0) + getattr(self, name) - flushed
+                for name, flushed in self._flushed.items()
+            }
+        )
+
+    def flush_stats(self):
+        """Прибавляет новые счетчики процесса к сохраненным на диске"""
+        with self._lock:
+            for name, flushed in self._flushed.items():
+                delta = getattr(self, name) - flushed
+                self._connection.execute(
+                    "INSERT INTO stats (name, value) VALUES (?, ?) "
+                    "ON CONFLICT (name) DO UPDATE SET value = value + ?",
+                    (name, delta, delta),
+                )
+                self._flushed[name] += delta
+            self._connection.commit()
+
+    def _format_stats(self, counters: dict) -> dict:
+        lookups = sum(counters.values())
+        hits = counters["memory_hits"] + counters["disk_hits"]
+        return {
+            **counters,
+            "hit_rate": round(hits / lookups, 4) if lookups else 0.0,
+            "disk_bytes": self.disk_bytes,
+        }
+
+    @property
+    def disk_bytes(self) -> int:
+        """Суммарный размер значений на диске по всем процессам"""
+        with self._lock:
+            return self._total_size()
+
+    def close(self):
+        with self._lock:
+            self._connection.close()
+
+    def _remember(self, key: str, value: str):
+        self._memory[key] = value
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.memory_items:
+            self._memory.popitem(last=False)
+
+    def _total_size(self) -> int:
+        return self._connection.execute(
+            "SELECT COALESCE(SUM(size), 0) FROM cache"
+        ).fetchone()[0]
+
+    def _evict(self):
+        """Удаляет самые старые записи, пока кэш не влезет в лимит."""
+        disk_bytes = self._total_size()
+        while disk_bytes > self.max_disk_bytes:
+            rows = self._connection.execute(
+                "SELECT key, size FROM cache ORDER BY accessed_at LIMIT 64"
+            ).fetchall()
+            if not rows:
+                return
+            for key, size in rows:
+                if disk_bytes <= self.max_disk_bytes:
+                    break
+                self._connection.execute(
+                    "DELETE FROM cache WHERE key = ?", (key,)
+                )
+                disk_bytes -= size
@@ -0,0 +1,75 @@
+"""ONNX Runtime бэкенд для моделей SingleProcessor.
+
+Модель один раз экспортируется в ONNX через optimum и сохраняется в
+ONNX_DIR, дальше граф загружается из кэша. Экспортированная модель
+подставляется в обычный transformers.pipeline, поэтому API вызовов
+не меняется. Нужен пакет optimum[onnxruntime], он не входит в
+обязательные зависимости.
+"""
+
+import importlib
+from pathlib import Path
+
+from transformers import pipeline
+
+from utils.utils import CACHE_DIR
+
+ONNX_DIR = CACHE_DIR / "onnx"
+PROVIDER = "CPUExecutionProvider"
+
+# Класс optimum для каждой задачи и препроцессоры, которые нужны
+# pipeline вместе с моделью
+ORT_MODELS = {
+    "automatic-speech-recognition": (
+        "ORTModelForSpeechSeq2Seq",
+        ("tokenizer", "feature_extractor"),
+    ),
+    "image-to-text": (
+        "ORTModelForVision2Seq",
+        ("tokenizer", "image_processor"),
+    ),
+    "summarization": ("ORTModelForSeq2SeqLM", ("tokenizer",)),
+}
+
+
+def _ort_class(task: str):
+    if task not in ORT_MODELS:
+        raise ValueError(f"ONNX бэкенд не поддерживает задачу {task}")
+    try:
+        module = importlib.import_module("optimum.onnxruntime")
+    except ImportError as error:
+        raise ImportError(
+            "Для бэкенда onnx установите optimum[onnxruntime]"
+        ) from error
+    return getattr(module, ORT_MODELS[task][0])
+
+
+def export_dir(model_name: str, root: Path | None = None) -> Path:
+    return (root or ONNX_DIR) / model_name.replace("/", "--")
+
+
+def load_ort_model(task: str, model_name: str, root: Path | None = None):
+    """Загружает ONNX граф из кэша, при первом запуске экспортирует"""
+    ort_class = _ort_class(task)
+    path = export_dir(model_name, root)
+    if (path / "config.json").exists():
+        return ort_class.from_pretrained(path, provider=PROVIDER)
+    model = ort_class.from_pretrained(
+        model_name, export=True, provider=PROVIDER
+    )
+    model.save_pretrained(path)
+    return model
+
+
+def onnx_pipeline(task: str, model_name: str, **pipeline_kwargs):
+    """transformers.pipeline поверх модели ONNX Runtime на CPU"""
+    preprocessors = {
+        name: model_name for name in ORT_MODELS.get(task, (None, ()))[1]
+    }
+    return pipeline(
+        task=task,
+        model=load_ort_model(task, model_name),
+        device="cpu",
+        **preprocessors,
+        **pipeline_kwargs,
+    )
@@ -0,0 +1,90 @@
+import queue
+import threading
+import time
+from concurrent.futures import Future
+from typing import Callable, Sequence
+
+
+class MicroBatcher:
+    """Собирает запросы к модели из разных потоков в общие пачки.
+
+    Поток планировщика ждет первый запрос, затем до max_wait_ms
+    добирает следующие, пока пачка не достигнет max_batch_size, и
+    вызывает process_batch одним списком. Результат каждого элемента
+    возвращается вызывающему через Future. on_start выполняется в
+    потоке планировщика до первой пачки, например чтобы задать ему
+    число потоков torch.
+    """
+
+    def __init__(
+        self,
+        process_batch: Callable[[list], list],
+        max_batch_size: int,
+        max_wait_ms: float,
+        name: str = "micro-batcher",
+        on_start: Callable[[], None] | None = None,
+    ):
+        self.process_batch = process_batch
+        self.on_start = on_start
+        self.max_batch_size = max(1, max_batch_size)
+        self.max_wait_s = max_wait_ms / 1000
+        self.batches = 0
+        self.items = 0
+        self._queue: queue.Queue = queue.Queue()
+        self._thread = threading.Thread(
+            target=self._run, name=name, daemon=True
+        )
+        self._thread.start()
+
+    def submit(self, item) -> Future:
+        future = Future()
+        self._queue.put((item, future))
+        return future
+
+    def map(self, items: Sequence) -> list:
+        """Отправляет элементы подряд и ждет все результаты"""
+        futures = [self.submit(item) for item in items]
+        return [future.result() for future in futures]
+
+    def _collect(self) -> list:
+        batch = [self._queue.get()]
+        deadline = time.monotonic() + self.max_wait_s
+        while len(batch) < self.max_batch_size:
+            try:
+                # Уже стоящие в очереди запросы забираются без ожидания
+                batch.append(self._queue.get_nowait())
+                continue
+            except queue.Empty:
+                pass
+            timeout = deadline - time.monotonic()
+            if timeout <= 0:
+                break
+            try:
+                batch.append(self._queue.get(timeout=timeout))
+            except queue.Empty:
+                break
+        return batch
+
+    def _run(self):
+        if self.on_start is not None:
+            self.on_start()
+        while True:
+            batch = self._collect()
+            items = [item for item, _ in batch]
+            futures = [future for _, future in batch]
+            try:
+                results = self.process_batch(items)
+                if len(results) != len(items):
+                    # Иначе лишние Future никогда не завершатся
+                    raise RuntimeError(
+                        f"process_batch вернул {len(results)} результатов "
+                        f"на {len(items)} запросов"
+                    )
+            except Exception as error:
+                for future in futures:
+                    future.set_exception(error)
+                continue
+            self.batches += 1
+            self.items += len(items)
+            for future, result in zip(futures, results):
+                future.set_result(result)
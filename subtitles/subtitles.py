@@ -1,77 +1,399 @@
+import hashlib
 import os
+import re
+import subprocess
+import threading
+from typing import Iterator, Sequence
+
+import numpy as np
 import torch
-import librosa
 import cv2
+import imageio_ffmpeg
 
 from PIL import Image
 
-from moviepy import VideoFileClip
 from transformers import pipeline
-from utils.utils import IMAGES_DIR
+from config.config import (
+    TIER_PROFILES,
+    Config,
+    FrameSampling,
+    Inference,
+    Tier,
+    load_config,
+)
+from subtitles.cache import PersistentCache
+from subtitles.onnx_backend import onnx_pipeline
+from subtitles.scheduler import MicroBatcher
+from utils.utils import (
+    IMAGES_DIR,
+    CACHE_DIR,
+    CAPTION_CACHE_FILE,
+    SUMMARY_CACHE_FILE,
+    ENV_FILE,
+    batched,
+)
+
+config: Config = load_config(ENV_FILE)
 
 DIR = os.path.dirname(os.path.abspath(__file__))
 FILE_VIDEO = os.path.join(DIR, "dir_video", "vid.mp4")
-FILE_AUDIO = os.path.join(DIR, "dir_audio", "extracted_audio.wav")
-
-
-def extract_frames(video_path: str, video_id: int, frame_distance=150):
-    video_imges_temp_dir = IMAGES_DIR / str(video_id)
-    if not (video_imges_temp_dir.exists()):
-        os.makedirs(str(video_imges_temp_dir))
-
+# Частота дискретизации, на которой обучен Whisper
+SAMPLE_RATE = 16000
+
+
+def iter_frames(
+    video_path: str,
+    frame_distance: int = 150,
+    interval_ms: float | None = None,
+) -> Iterator[tuple[float, np.ndarray]]:
+    """Декодирует видео за один проход и отдает каждый frame_distance-й кадр.
+
+    Если задан interval_ms, кадры выбираются по времени, а не по номеру:
+    не чаще одного кадра за interval_ms, независимо от fps.
+    Пропущенные кадры только захватываются через grab(), декодируются
+    через retrieve() лишь выбранные, поэтому дорогих перемоток к ключевому
+    кадру нет. Возвращает пары (timestamp_ms, кадр BGR).
+    """
     capture = cv2.VideoCapture(video_path)
-    totalFrames = capture.get(cv2.CAP_PROP_FRAME_COUNT)
-    timestamps: list[float] = []
-    frames_paths: list[str] = []
-
-    frame_number = 0
-    while frame_number >= 0 and frame_number < totalFrames:
-        if capture.set(cv2.CAP_PROP_POS_FRAMES, frame_number):
-            ret, frame = capture.read()
-            if ret:
-                timestamp = capture.get(cv2.CAP_PROP_POS_MSEC)
-                frame_path = (
-                    video_imges_temp_dir / f"{frame_number}_{timestamp}.png"
-                )
-                cv2.imwrite(frame_path, frame)
+    try:
+        frame_number = 0
+        next_timestamp = 0.0
+        while capture.grab():
+            timestamp = capture.get(cv2.CAP_PROP_POS_MSEC)
+            if interval_ms is None:
+                selected = frame_number % frame_distance == 0
+            else:
+                selected = timestamp >= next_timestamp
+            if selected:
+                ret, frame = capture.retrieve()
+                if ret:
+                    if interval_ms is not None:
+                        next_timestamp = timestamp + interval_ms
+                    yield timestamp, frame
+            frame_number += 1
+    finally:
+        capture.release()
+
+
+def frame_hash(frame: np.ndarray, hash_size: int = 8) -> int:
+    """Перцептивный dHash кадра (BGR или оттенки серого).
+
+    Возвращает hash_size * hash_size бит.
+    """
+    gray = (
+        frame if frame.ndim == 2 else cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
+    )
+    resized = cv2.resize(
+        gray, (hash_size + 1, hash_size), interpolation=cv2.INTER_AREA
+    )
+    bits = (resized[:, 1:] > resized[:, :-1]).flatten()
+    return int.from_bytes(np.packbits(bits).tobytes(), "big")
+
+
+def hash_distance(first: int, second: int) -> int:
+    """Расстояние Хэмминга между двумя хэшами кадров."""
+    return (first ^ second).bit_count()
+
+
+def iter_scene_frames(
+    video_path: str,
+    probe_interval_ms: float = 1000,
+    min_interval_ms: float = 2000,
+    max_interval_ms: float = 60000,
+    hash_threshold: int = 10,
+) -> Iterator[tuple[float, np.ndarray]]:
+    """Отдает кадры только при смене содержимого (например, слайда).
+
+    Кадры проверяются раз в probe_interval_ms. Кадр сохраняется, если его
+    dHash отличается от последнего сохраненного больше чем на
+    hash_threshold бит и с прошлого кадра прошло не меньше
+    min_interval_ms. Если картинка не меняется, кадр все равно
+    сохраняется раз в max_interval_ms.
+    """
+    last_hash = None
+    last_timestamp = 0.0
+    for timestamp, frame in iter_frames(
+        video_path, interval_ms=probe_interval_ms
+    ):
+        current_hash = frame_hash(frame)
+        if last_hash is not None:
+            elapsed = timestamp - last_timestamp
+            if elapsed < min_interval_ms:
+                continue
+            changed = hash_distance(current_hash, last_hash) > hash_threshold
+            if not changed and elapsed < max_interval_ms:
+                continue
+
+        last_hash = current_hash
+        last_timestamp = timestamp
+        yield timestamp, frame
+
+
+def sample_frames(
+    video_path: str, sampling: FrameSampling | None = None
+) -> Iterator[tuple[float, np.ndarray]]:
+    """Выбирает кадры видео согласно настройкам сэмплирования."""
+    sampling = sampling or config.frame_sampling
+    if sampling.mode == "scene":
+        return iter_scene_frames(
+            video_path,
+            probe_interval_ms=sampling.probe_interval_ms,
+            min_interval_ms=sampling.min_interval_ms,
+            max_interval_ms=sampling.max_interval_ms,
+            hash_threshold=sampling.hash_threshold,
+        )
+    if sampling.mode == "interval":
+        return iter_frames(video_path, sampling.frame_distance)
+    raise ValueError(f"Неизвестный режим сэмплирования: {sampling.mode}")
 
-                timestamps.append(timestamp)
-                frames_paths.append(frame_path)
 
-        frame_number += frame_distance
-    capture.release()
-    return frames_paths, timestamps
+def extract_frames(
+    video_path: str, video_id: int, sampling: FrameSampling | None = None
+) -> Iterator[tuple[float, np.ndarray]]:
+    """Отдает выбранные кадры видео в памяти.
 
+    PNG пишутся в IMAGES_DIR только при включенном SAVE_FRAMES (отладка).
+    """
+    sampling = sampling or config.frame_sampling
+    video_imges_temp_dir = IMAGES_DIR / str(video_id)
+    if sampling.save_frames and not (video_imges_temp_dir.exists()):
+        os.makedirs(str(video_imges_temp_dir))
 
-def extract_audio(video_path: str, audio_path: str) -> str:
-    with VideoFileClip(video_path) as video:
-        if video.audio is None:
-            raise ValueError("В видео нет аудиодорожки")
-        video.audio.write_audiofile(audio_path)
-        return audio_path
+    for index, (timestamp, frame) in enumerate(
+        sample_frames(video_path, sampling)
+    ):
+        if sampling.save_frames:
+            frame_path = video_imges_temp_dir / f"{index}_{timestamp}.png"
+            cv2.imwrite(frame_path, frame)
+        yield timestamp, frame
+
+
+def _ffmpeg_audio_command(path: str, sample_rate: int) -> list[str]:
+    return [
+        imageio_ffmpeg.get_ffmpeg_exe(),
+        "-nostdin",
+        "-loglevel",
+        "error",
+        "-i",
+        str(path),
+        "-map",
+        "0:a:0",
+        "-ac",
+        "1",
+        "-ar",
+        str(sample_rate),
+        "-f",
+        "f32le",
+        "-",
+    ]
+
+
+def _raise_ffmpeg_error(stderr: bytes):
+    error = stderr.decode(errors="replace")
+    if "matches no streams" in error:
+        raise ValueError("В видео нет аудиодорожки")
+    raise ValueError(f"Не удалось декодировать аудио: {error}")
+
+
+def load_audio(path: str, sample_rate: int = SAMPLE_RATE) -> np.ndarray:
+    """Декодирует аудиодорожку сразу в моно float32 нужной частоты.
+
+    ffmpeg читает контейнер один раз и отдает PCM через pipe, без
+    промежуточного WAV и повторного ресемплинга.
+    """
+    result = subprocess.run(
+        _ffmpeg_audio_command(path, sample_rate), capture_output=True
+    )
+    if result.returncode != 0:
+        _raise_ffmpeg_error(result.stderr)
+    return np.frombuffer(result.stdout, dtype=np.float32)
+
+
+def probe_duration(path: str) -> float | None:
+    """Длительность медиафайла в секундах по заголовку контейнера."""
+    result = subprocess.run(
+        [imageio_ffmpeg.get_ffmpeg_exe(), "-nostdin", "-i", str(path)],
+        capture_output=True,
+    )
+    match = re.search(
+        rb"Duration: (\d+):(\d{2}):(\d{2}(?:\.\d+)?)", result.stderr
+    )
+    if match is None:
+        return None
+    hours, minutes, seconds = match.groups()
+    return int(hours) * 3600 + int(minutes) * 60 + float(seconds)
+
+
+def _read_samples(stream, count: int) -> np.ndarray:
+    data = stream.read(count * 4)
+    return np.frombuffer(data[: len(data) // 4 * 4], dtype=np.float32)
+
+
+def iter_audio_windows(
+    path: str,
+    window_s: float,
+    overlap_s: float,
+    sample_rate: int = SAMPLE_RATE,
+) -> Iterator[tuple[float, np.ndarray, bool]]:
+    """Читает аудио из pipe ffmpeg перекрывающимися окнами.
+
+    В памяти одновременно держится не больше одного окна, поэтому
+    потребление не зависит от длины записи. Возвращает тройки
+    (начало окна в секундах, сэмплы, последнее ли это окно).
+    """
+    window = int(window_s * sample_rate)
+    step = window - int(overlap_s * sample_rate)
+    if step <= 0:
+        raise ValueError("Перекрытие должно быть меньше окна")
+
+    process = subprocess.Popen(
+        _ffmpeg_audio_command(path, sample_rate),
+        stdout=subprocess.PIPE,
+        stderr=subprocess.PIPE,
+    )
+    try:
+        buffer = _read_samples(process.stdout, window)
+        if buffer.size == 0:
+            process.wait()
+            _raise_ffmpeg_error(process.stderr.read())
+
+        start = 0
+        while True:
+            ahead = np.empty(0, dtype=np.float32)
+            if buffer.size == window:
+                ahead = _read_samples(process.stdout, step)
+            is_last = ahead.size == 0
+            # Поток закончился: ffmpeg мог упасть посреди контейнера,
+            # тогда транскрипция была бы обрезанной
+            if is_last and process.wait() != 0:
+                _raise_ffmpeg_error(process.stderr.read())
+            yield start / sample_rate, buffer, is_last
+            if is_last:
+                break
+            buffer = np.concatenate([buffer[step:], ahead])
+            start += step
+    finally:
+        if process.poll() is None:
+            process.kill()
+        process.wait()
+        process.stdout.close()
+        process.stderr.close()
+
+
+def cpu_supports_bf16() -> bool:
+    """Есть ли в процессоре нативные инструкции bfloat16 (AVX512-BF16
+    или AMX). Без них bfloat16 эмулируется и медленнее float32."""
+    checks = ("_is_avx512_bf16_supported", "_is_amx_tile_supported")
+    return any(getattr(torch.cpu, check, lambda: False)() for check in checks)
+
+
+def select_dtype(device: str, inference: Inference) -> torch.dtype:
+    """Выбирает тип весов модели для устройства"""
+    if device != "cpu":
+        return torch.float16
+    if inference.quantize:
+        # Динамическая квантизация работает с float32 весами
+        return torch.float32
+    if inference.cpu_dtype == "auto":
+        return torch.bfloat16 if cpu_supports_bf16() else torch.float32
+    if inference.cpu_dtype not in ("float32", "bfloat16"):
+        raise ValueError(f"Неизвестный тип весов: {inference.cpu_dtype}")
+    return getattr(torch, inference.cpu_dtype)
+
+
+def configure_torch_threads(inference: Inference):
+    if inference.torch_threads > 0:
+        torch.set_num_threads(inference.torch_threads)
+    if inference.interop_threads > 0:
+        try:
+            torch.set_num_interop_threads(inference.interop_threads)
+        except RuntimeError:
+            # Задается один раз до первой параллельной операции torch
+            pass
+
+
+_caches: dict[str, PersistentCache] = {}
+
+
+def shared_cache(path, max_mb: int) -> PersistentCache | None:
+    """Кэш результатов, общий для всех моделей одного класса.
+
+    Модели разных уровней обработки пишут в один файл, ключи
+    различаются именем модели.
+    """
+    if not config.cache.enabled:
+        return None
+    if str(path) not in _caches:
+        os.makedirs(CACHE_DIR, exist_ok=True)
+        _caches[str(path)] = PersistentCache(
+            path,
+            memory_items=config.cache.memory_items,
+            max_disk_bytes=max_mb * 1024 * 1024,
+        )
+    return _caches[str(path)]
 
 
 class SingleProcessor:
+    # Экземпляры по (класс, имя модели): уровни обработки с одной и той
+    # же моделью используют один экземпляр
     _instances = {}
-
-    def __new__(cls, *args, **kwargs):
-        if cls not in cls._instances:
-            instance = super().__new__(cls)
-            cls._instances[cls] = instance
-            instance._initialized = False
-        return cls._instances[cls]
-
-    def __init__(self, model_name, task, **pipeline_specific_kwargs):
+    # Задачи воркера в режиме потоков создают модели одновременно
+    _init_lock = threading.Lock()
+    # Поле TierProfile с именем модели наследника
+    PROFILE_FIELD = ""
+
+    def __new__(cls, tier: Tier | str | None = None):
+        key = (cls, cls.model_name_for(tier))
+        with SingleProcessor._init_lock:
+            if key not in cls._instances:
+                instance = super().__new__(cls)
+                cls._instances[key] = instance
+                instance._initialized = False
+        return cls._instances[key]
+
+    @classmethod
+    def model_name_for(cls, tier: Tier | str | None = None) -> str:
+        profile = TIER_PROFILES[Tier(tier or config.models.default_tier)]
+        return getattr(profile, cls.PROFILE_FIELD)
+
+    def __init__(
+        self, model_name, task, backend="torch", **pipeline_specific_kwargs
+    ):
         # Проверка в базовом классе - наследникам не нужно проверять
-        if hasattr(self, "_initialized") and self._initialized:
-            return
+        with SingleProcessor._init_lock:
+            if not self._initialized:
+                self._load(
+                    model_name, task, backend, **pipeline_specific_kwargs
+                )
+                self._setup()
 
-        self.torch_dtype = torch.float16
-        self.device = "cuda" if torch.cuda.is_available() else "cpu"
+    def _setup(self):
+        """Кэш и планировщик наследника, один раз на экземпляр.
+
+        Выполняется под _init_lock: задачи, одновременно создающие общий
+        экземпляр, не запускают лишних планировщиков и кэшей.
+        """
 
+    def _load(self, model_name, task, backend, **pipeline_specific_kwargs):
+        configure_torch_threads(config.inference)
         self.model_name = model_name
         self.task = task
+        self.backend = backend
+
+        if backend == "onnx":
+            # ONNX Runtime выполняется на CPU
+            self.device = "cpu"
+            self.torch_dtype = torch.float32
+            self.pipeline = onnx_pipeline(
+                task, model_name, **pipeline_specific_kwargs
+            )
+            self._initialized = True
+            return
+        if backend != "torch":
+            raise ValueError(f"Неизвестный бэкенд модели: {backend}")
 
+        self.device = "cuda" if torch.cuda.is_available() else "cpu"
+        self.torch_dtype = select_dtype(self.device, config.inference)
         self.pipeline = pipeline(
             task=self.task,
             model=self.model_name,
@@ -79,46 +401,161 @@ class SingleProcessor:
             device=self.device,
             **pipeline_specific_kwargs,
         )
+        if self.device == "cpu" and config.inference.quantize:
+            self.pipeline.model = torch.ao.quantization.quantize_dynamic(
+                self.pipeline.model, {torch.nn.Linear}, dtype=torch.qint8
+            )
 
         self._initialized = True
 
+    def _infer(self, *args, **kwargs):
+        """Вызывает pipeline без отслеживания градиентов"""
+        with torch.inference_mode():
+            return self.pipeline(*args, **kwargs)
+
+    def _start_scheduler(self, max_batch_size: int, torch_threads: int = 0):
+        """Ставит перед моделью планировщик общих пачек для всех задач.
+
+        Инференс идет в потоке планировщика, поэтому бюджет потоков
+        torch модели (ASR_TORCH_THREADS, CAPTION_TORCH_THREADS) задается
+        в нем. В пуле процессов задачи не делят модели, и планировщик
+        только добавил бы ожидание, поэтому он нужен лишь при
+        WORKER_POOL=thread.
+        """
+        self.scheduler = None
+        if (
+            config.inference.scheduler_enabled
+            and config.worker.pool == "thread"
+        ):
+            self.scheduler = MicroBatcher(
+                self._run_batch,
+                max_batch_size,
+                config.inference.scheduler_max_wait_ms,
+                name=f"{type(self).__name__}-batcher",
+                on_start=(
+                    (lambda: torch.set_num_threads(torch_threads))
+                    if torch_threads > 0
+                    else None
+                ),
+            )
+
+    def _batch(self, items: list) -> list:
+        """Обрабатывает элементы через планировщик, если он включен"""
+        scheduler = getattr(self, "scheduler", None)
+        if scheduler is None:
+            return self._run_batch(items)
+        return scheduler.map(items)
+
+    def _run_batch(self, items: list) -> list:
+        raise NotImplementedError
+
 
 class ImageCaption(SingleProcessor):
-    def __init__(self):
+    # Для ключа кэша нужен более подробный хэш, чем для поиска смены сцены
+    CACHE_HASH_SIZE = 16
+    PROFILE_FIELD = "caption_model"
+
+    def __init__(self, tier: Tier | str | None = None):
         super().__init__(
-            model_name="Salesforce/blip-image-captioning-large",
+            model_name=self.model_name_for(tier),
             task="image-to-text",
+            backend=config.models.caption_backend,
+        )
+
+    def _setup(self):
+        self.batch_size = config.inference.caption_batch_size
+        self.cache = shared_cache(
+            CAPTION_CACHE_FILE, config.cache.caption_max_mb
         )
+        self._start_scheduler(self.batch_size, config.pipeline.caption_threads)
 
     def caption_image(self, image_path: str):
-        image = Image.open(image_path)
-        result = self.pipeline(image)
-        return result[0]["generated_text"]
+        return self.caption_batch([Image.open(image_path)])[0]
+
+    def caption_batch(
+        self,
+        frames: Sequence[np.ndarray | Image.Image],
+        batch_size: int | None = None,
+    ) -> list[str]:
+        """Подписывает кадры пачками без записи на диск.
+
+        Массивы numpy ожидаются в BGR, как их отдает OpenCV. Если включен
+        кэш, в модель уходят только кадры, которых в нем нет.
+        """
+        if not frames:
+            return []
+        images = [
+            (
+                Image.fromarray(cv2.cvtColor(frame, cv2.COLOR_BGR2RGB))
+                if isinstance(frame, np.ndarray)
+                else frame
+            )
+            for frame in frames
+        ]
+        captions: list[str | None] = [None] * len(images)
+        keys: list[str | None] = [None] * len(images)
+        if self.cache is not None:
+            for index, image in enumerate(images):
+                keys[index] = self._cache_key(image)
+                captions[index] = self.cache.get(keys[index])
+
+        # Одинаковые кадры внутри пачки подписываются один раз
+        missing: dict[str | int, list[int]] = {}
+        for index, text in enumerate(captions):
+            if text is None:
+                missing.setdefault(keys[index] or index, []).append(index)
+        if missing:
+            unique = [images[indexes[0]] for indexes in missing.values()]
+            results = (
+                self._run_batch(unique, batch_size)
+                if batch_size
+                else self._batch(unique)
+            )
+            for indexes, text in zip(missing.values(), results):
+                for index in indexes:
+                    captions[index] = text
+                if self.cache is not None:
+                    self.cache.set(keys[indexes[0]], text)
+        return captions
+
+    def _run_batch(
+        self, images: list[Image.Image], batch_size: int | None = None
+    ) -> list[str]:
+        results = self._infer(images, batch_size=batch_size or self.batch_size)
+        return [result[0]["generated_text"] for result in results]
+
+    def _cache_key(self, image: Image.Image) -> str:
+        gray = np.asarray(image.convert("L"))
+        return f"{self.model_name}:{frame_hash(gray, self.CACHE_HASH_SIZE):x}"
 
 
 class Subtitles(SingleProcessor):
-    def __init__(self):
+    PROFILE_FIELD = "asr_model"
+
+    def __init__(self, tier: Tier | str | None = None):
         super().__init__(
-            model_name="antony66/whisper-large-v3-russian",
+            model_name=self.model_name_for(tier),
             task="automatic-speech-recognition",
+            backend=config.models.asr_backend,
             max_new_tokens=256,
             chunk_length_s=30,
             batch_size=16,
             return_timestamps=True,
         )
 
-    def transcribe_audio(self, audio_path: str) -> str:
-        audio_input, sr = librosa.load(audio_path)
-        result = self.pipeline(
-            audio_input, generate_kwargs={"language": "russian"}
+    def _setup(self):
+        self._start_scheduler(
+            config.inference.asr_batch_size, config.pipeline.asr_threads
         )
-        return result["text"]
 
-    def transcribe_audio_with_timestamps(self, audio_path: str) -> dict:
-        audio_input, sr = librosa.load(audio_path)
-        result = self.pipeline(
-            audio_input, generate_kwargs={"language": "russian"}
-        )
+    def transcribe_audio(self, audio: str | np.ndarray) -> str:
+        return self._batch([self._pipeline_input(audio)])[0]["text"]
+
+    def transcribe_audio_with_timestamps(
+        self, audio: str | np.ndarray
+    ) -> dict:
+        """Распознает речь по пути к файлу или по сигналу SAMPLE_RATE Гц."""
+        result = self._batch([self._pipeline_input(audio)])[0]
         chunks = []
         if "chunks" in result:
             for chunk in result["chunks"]:
@@ -128,50 +565,336 @@ class Subtitles(SingleProcessor):
 
         return {"text": result["text"], "chunks": chunks}
 
+    def _run_batch(self, inputs: list) -> list[dict]:
+        # Куски по chunk_length_s всех входов пачки идут в модель вместе
+        return self._infer(inputs, generate_kwargs={"language": "russian"})
+
+    def transcribe_stream(
+        self,
+        audio_path: str,
+        window_s: float | None = None,
+        overlap_s: float | None = None,
+    ) -> Iterator[list[dict]]:
+        """Распознает речь окнами и отдает чанки по мере готовности окон.
+
+        Каждое окно отвечает за свой отрезок времени до середины
+        перекрытия с соседними, и чанк достается окну, на отрезок
+        которого приходится его середина. Поэтому чанки из зоны
+        перекрытия не дублируются, а чанк, обрезанный концом окна,
+        берется целиком из следующего. Временные метки чанков
+        абсолютные, в секундах.
+        window_s = 0 отключает разбиение: вся дорожка одним окном.
+        """
+        window_s = (
+            config.inference.asr_window_s if window_s is None else window_s
+        )
+        overlap_s = (
+            config.inference.asr_overlap_s if overlap_s is None else overlap_s
+        )
+        if window_s <= 0:
+            windows = [(0.0, load_audio(audio_path), True)]
+            overlap_s = 0
+        else:
+            windows = iter_audio_windows(audio_path, window_s, overlap_s)
+
+        for index, (start, samples, is_last) in enumerate(windows):
+            duration = samples.size / SAMPLE_RATE
+            owned_from = start + overlap_s / 2 if index else 0.0
+            owned_to = (
+                float("inf") if is_last else start + window_s - overlap_s / 2
+            )
+
+            result = self.transcribe_audio_with_timestamps(samples)
+            chunks = []
+            for chunk in result["chunks"]:
+                chunk_start, chunk_end = chunk["timestamp"]
+                chunk_start = start + (chunk_start or 0.0)
+                chunk_end = start + (
+                    duration if chunk_end is None else chunk_end
+                )
+                if owned_from <= (chunk_start + chunk_end) / 2 < owned_to:
+                    chunks.append(
+                        {
+                            "text": chunk["text"],
+                            "timestamp": (chunk_start, chunk_end),
+                        }
+                    )
+            yield chunks
+
+    def _pipeline_input(self, audio: str | np.ndarray) -> dict:
+        if not isinstance(audio, np.ndarray):
+            audio = load_audio(audio)
+        return {"raw": audio, "sampling_rate": SAMPLE_RATE}
+
 
 class TextSummarizer(SingleProcessor):
-    def __init__(self, model_name: str = "IlyaGusev/rut5_base_sum_gazeta"):
+    # Границы предложений: пробелы после знака конца предложения
+    SENTENCE_END = re.compile(r"(?<=[.!?…])\s+")
+    # Быстрый токенизатор не допускает одновременных вызовов из потоков
+    _tokenizer_lock = threading.Lock()
+    PROFILE_FIELD = "summary_model"
+
+    def __init__(self, tier: Tier | str | None = None):
+        self.generate_kwargs = {"min_length": 30, "do_sample": False}
         super().__init__(
-            model_name="IlyaGusev/rut5_base_sum_gazeta",
+            model_name=self.model_name_for(tier),
             task="summarization",
-            min_length=30,
-            do_sample=False,
+            backend=config.models.summary_backend,
+            **self.generate_kwargs,
+        )
+
+    def _setup(self):
+        self.batch_size = config.inference.summary_batch_size
+        self.chunk_tokens = config.inference.summary_chunk_tokens
+        self.chunk_overlap = config.inference.summary_chunk_overlap
+        self.level_max_length = config.inference.summary_level_max_length
+        self.cache = shared_cache(
+            SUMMARY_CACHE_FILE, config.cache.summary_max_mb
         )
+        self._start_scheduler(self.batch_size)
 
     def summarize(self, text: str, max_length: int = 150) -> str:
         """Суммаризирует текст."""
-        if not text.strip():
-            return ""
-
-        if len(text) > 1000:
-            chunks = self._split_text(text, chunk_size=800)
-            summaries = []
-            for chunk in chunks:
-                result = self.pipeline(chunk, max_length=max_length)
-                summaries.append(result[0]["summary_text"])
-            return " ".join(summaries)
+        return self.summarize_lengths(text, [max_length])[0]
+
+    def summarize_lengths(
+        self, text: str, max_lengths: Sequence[int]
+    ) -> list[str]:
+        """Суммаризирует текст для нескольких max_length сразу."""
+        return self.summarize_tree(self.build_tree(text), max_lengths)
+
+    def build_tree(self, text: str, cached: dict | None = None) -> dict:
+        """Строит дерево иерархической (map-reduce) суммаризации.
+
+        levels[0] - чанки исходного текста, каждый следующий уровень -
+        чанки объединенных саммари предыдущего длиной level_max_length.
+        Свертка идет до уровня из одного чанка. Чанки исходного текста
+        не зависят от модели саммари и берутся из cached, пока совпадает
+        хэш текста. Уровни саммари из cached переиспользуются, пока
+        входные чанки совпадают и модель та же.
+        """
+        cached = cached or {}
+        text_hash = self._text_hash(text)
+        if cached.get("text_hash") == text_hash and cached.get("levels"):
+            levels = [cached["levels"][0]]
         else:
-            result = self.pipeline(text, max_length=max_length)
-            return result[0]["summary_text"]
+            levels = [self._split_text(text)]
+
+        reusable = []
+        if cached.get("model") == self.model_name:
+            reusable = cached.get("levels", [])
+
+        while len(levels[-1]) > 1:
+            depth = len(levels)
+            if depth < len(reusable) and reusable[depth - 1] == levels[-1]:
+                levels.append(reusable[depth])
+                continue
+            summaries = self._summarize_chunks(
+                levels[-1], [self.level_max_length]
+            )[0]
+            chunks = self._split_text(" ".join(summaries))
+            if len(chunks) >= len(levels[-1]):
+                # Саммари не короче входа, свертка не сойдется
+                chunks = [" ".join(summaries)]
+            levels.append(chunks)
+        return {
+            "model": self.model_name,
+            "text_hash": text_hash,
+            "levels": levels,
+        }
+
+    def summarize_tree(
+        self, tree: dict, max_lengths: Sequence[int]
+    ) -> list[str]:
+        """Суммаризирует верхний уровень дерева для каждой max_length.
+
+        Верхний чанк токенизируется один раз и переиспользуется для
+        всех длин.
+        """
+        return [
+            " ".join(summaries)
+            for summaries in self._summarize_chunks(
+                tree["levels"][-1], max_lengths
+            )
+        ]
+
+    def _summarize_chunks(
+        self, chunks: list[str], max_lengths: Sequence[int]
+    ) -> list[list[str]]:
+        """Суммаризирует каждый чанк для каждой max_length.
+
+        Если включен кэш, в модель уходят только чанки, которых в нем
+        нет. Одинаковые чанки суммаризируются один раз, недостающие
+        токенизируются один раз для всех длин и отправляются в
+        планировщик по возрастанию длины, чтобы соседние в пачке были
+        близки по числу токенов.
+        """
+        results = [[None] * len(chunks) for _ in max_lengths]
+        keys = [[None] * len(chunks) for _ in max_lengths]
+        if self.cache is not None:
+            for row, max_length in enumerate(max_lengths):
+                for index, chunk in enumerate(chunks):
+                    keys[row][index] = self._cache_key(chunk, max_length)
+                    results[row][index] = self.cache.get(keys[row][index])
+
+        missing: dict[str, list[int]] = {}
+        for index, chunk in enumerate(chunks):
+            if any(summaries[index] is None for summaries in results):
+                missing.setdefault(chunk, []).append(index)
+        if not missing:
+            return results
+
+        input_ids = self._tokenize(list(missing))
+        order = sorted(range(len(input_ids)), key=lambda i: len(input_ids[i]))
+        for row, max_length in enumerate(max_lengths):
+            if all(summary is not None for summary in results[row]):
+                continue
+            summaries = [""] * len(input_ids)
+            batch = self._batch([(input_ids[i], max_length) for i in order])
+            for index, summary in zip(order, batch):
+                summaries[index] = summary
+            for indexes, summary in zip(missing.values(), summaries):
+                for index in indexes:
+                    results[row][index] = summary
+                if self.cache is not None:
+                    self.cache.set(keys[row][indexes[0]], summary)
+        return results
+
+    def _text_hash(self, text: str) -> str:
+        """Хэш текста и параметров разбиения на чанки"""
+        return hashlib.sha256(
+            "\0".join(
+                [str(self.chunk_tokens), str(self.chunk_overlap), text]
+            ).encode("utf-8")
+        ).hexdigest()
+
+    def _cache_key(self, text: str, max_length: int) -> str:
+        digest = hashlib.sha256(
+            "\0".join(
+                [
+                    str(max_length),
+                    str(self.generate_kwargs["min_length"]),
+                    text,
+                ]
+            ).encode("utf-8")
+        ).hexdigest()
+        return f"{self.model_name}:{digest}"
+
+    def _tokenize(self, chunks: list[str]) -> list[list[int]]:
+        prefix = getattr(self.pipeline, "prefix", None) or ""
+        with self._tokenizer_lock:
+            features = self.pipeline.tokenizer(
+                [prefix + chunk for chunk in chunks], truncation=True
+            )
+        return features["input_ids"]
+
+    def _run_batch(self, items: list[tuple[list[int], int]]) -> list[str]:
+        """Суммаризирует токенизированные чанки разных задач.
+
+        Элементы с разной max_length генерируются отдельно.
+        """
+        summaries = [""] * len(items)
+        by_length: dict[int, list[int]] = {}
+        for index, (_, max_length) in enumerate(items):
+            by_length.setdefault(max_length, []).append(index)
+        for max_length, indexes in by_length.items():
+            encoded = self._encode([items[i][0] for i in indexes])
+            generated = self._generate(encoded, max_length)
+            for index, summary in zip(indexes, generated):
+                summaries[index] = summary
+        return summaries
+
+    def _encode(
+        self, input_ids: list[list[int]]
+    ) -> list[tuple[list[int], dict]]:
+        """Собирает пачки из близких по длине токенизированных чанков.
+
+        Чанки сортируются по числу токенов, поэтому в пачке почти нет
+        паддинга. Вместе с пачкой возвращаются исходные индексы чанков.
+        """
+        order = sorted(range(len(input_ids)), key=lambda i: len(input_ids[i]))
+        encoded = []
+        for indexes in batched(order, self.batch_size):
+            with self._tokenizer_lock:
+                inputs = self.pipeline.tokenizer.pad(
+                    {"input_ids": [input_ids[i] for i in indexes]},
+                    return_tensors="pt",
+                )
+            encoded.append((list(indexes), inputs))
+        return encoded
+
+    def _generate(
+        self, encoded: list[tuple[list[int], dict]], max_length: int
+    ) -> list[str]:
+        """Генерирует саммари пачек и возвращает их в исходном порядке"""
+        summaries = [""] * sum(len(indexes) for indexes, _ in encoded)
+        for indexes, inputs in encoded:
+            with torch.inference_mode():
+                output_ids = self.pipeline.model.generate(
+                    **inputs.to(self.pipeline.device),
+                    max_length=max_length,
+                    **self.generate_kwargs,
+                )
+            decoded = self.pipeline.tokenizer.batch_decode(
+                output_ids, skip_special_tokens=True
+            )
+            for index, summary in zip(indexes, decoded):
+                summaries[index] = summary
+        return summaries
+
+    def _split_text(
+        self,
+        text: str,
+        max_tokens: int | None = None,
+        overlap: int | None = None,
+    ) -> list[str]:
+        """Разбивает текст на чанки не длиннее max_tokens токенов.
+
+        Длина считается токенизатором модели, предложения упаковываются
+        в чанк целиком. Последние overlap предложений чанка повторяются
+        в начале следующего. Предложение длиннее бюджета (например,
+        распознанная речь без знаков препинания) режется по токенам.
+        """
+        max_tokens = max_tokens or self.chunk_tokens
+        overlap = self.chunk_overlap if overlap is None else overlap
+        tokenizer = self.pipeline.tokenizer
+
+        sentences = [
+            sentence
+            for sentence in self.SENTENCE_END.split(text.strip())
+            if sentence
+        ]
+        if not sentences:
+            return []
+        with self._tokenizer_lock:
+            sentence_ids = tokenizer(sentences, add_special_tokens=False)[
+                "input_ids"
+            ]
+        pieces = []
+        for sentence, ids in zip(sentences, sentence_ids):
+            if len(ids) <= max_tokens:
+                pieces.append((sentence, len(ids)))
+                continue
+            for start in range(0, len(ids), max_tokens):
+                end = start + max_tokens
+                part = ids[start:end]
+                pieces.append((tokenizer.decode(part), len(part)))
 
-    def _split_text(self, text: str, chunk_size: int = 800) -> list[str]:
-        """Разбивает текст на чанки."""
-        sentences = text.split(". ")
         chunks = []
-        current_chunk = []
-        current_length = 0
-
-        for sentence in sentences:
-            sentence_length = len(sentence)
-            if current_length + sentence_length > chunk_size and current_chunk:
-                chunks.append(". ".join(current_chunk) + ".")
-                current_chunk = [sentence]
-                current_length = sentence_length
-            else:
-                current_chunk.append(sentence)
-                current_length += sentence_length
-
-        if current_chunk:
-            chunks.append(". ".join(current_chunk) + ".")
+        current = []
+        current_tokens = 0
+        for piece in pieces:
+            if current and current_tokens + piece[1] > max_tokens:
+                chunks.append(" ".join(sentence for sentence, _ in current))
+                current = current[-overlap:] if overlap else []
+                current_tokens = sum(tokens for _, tokens in current)
+                # Перекрытие не должно вытеснять новое предложение
+                while current and current_tokens + piece[1] > max_tokens:
+                    current_tokens -= current.pop(0)[1]
+            current.append(piece)
+            current_tokens += piece[1]
+
+        if current:
+            chunks.append(" ".join(sentence for sentence, _ in current))
 
         return chunks
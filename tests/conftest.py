@@ -10,14 +10,19 @@ from sqlalchemy.pool import StaticPool
 from fastapi.testclient import TestClient
 
 from main import app
-from db import get_session
+from db import get_async_session, get_session
 from unittest.mock import MagicMock
-from tests.test_db import engine_test, get_test_session
+from tests.test_db import (
+    engine_test,
+    get_test_async_session,
+    get_test_session,
+)
 
 
 ROOT_DIR = Path(__file__).resolve().parents[1]
 sys.path.insert(0, str(ROOT_DIR))
 app.dependency_overrides[get_session] = get_test_session
+app.dependency_overrides[get_async_session] = get_test_async_session
 
 
 @pytest.fixture(scope="session", autouse=True)
@@ -42,6 +47,34 @@ def client():
     return TestClient(app)
 
 
+@pytest.fixture
+def auth_username():
+    """Пользователь auth_headers, модули тестов переопределяют его"""
+    return "user"
+
+
+@pytest.fixture
+def auth_headers(client, auth_username):
+    """Заголовок с токеном пользователя auth_username"""
+    # База общая на всю сессию тестов, повторная регистрация вернет 400
+    client.post(
+        "/register", json={"username": auth_username, "password": "secret"}
+    )
+    response = client.post(
+        "/token",
+        data={"username": auth_username, "password": "secret"},
+        headers={"Content-Type": "application/x-www-form-urlencoded"},
+    )
+    access_token = response.json()["access_token"]
+    return {"Authorization": f"Bearer {access_token}"}
+
+
+@pytest.fixture
+def anyio_backend():
+    """Асинхронные тесты запускаются только на asyncio"""
+    return "asyncio"
+
+
 @pytest.fixture
 def sample_video():
     """
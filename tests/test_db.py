@@ -1,4 +1,7 @@
+from sqlalchemy.ext.asyncio import create_async_engine
+from sqlalchemy.pool import NullPool
 from sqlmodel import create_engine, Session
+from sqlmodel.ext.asyncio.session import AsyncSession
 
 
 SQLALCHEMY_DATABASE_URL = "sqlite:///./test.db"
@@ -12,3 +15,17 @@ engine_test = create_engine(
 def get_test_session():
     with Session(engine_test) as session:
         yield session
+
+
+# TestClient запускает каждый запрос в своем event loop, поэтому
+# соединения aiosqlite не переиспользуются между запросами
+async_engine_test = create_async_engine(
+    "sqlite+aiosqlite:///./test.db", poolclass=NullPool
+)
+
+
+async def get_test_async_session():
+    async with AsyncSession(
+        async_engine_test, expire_on_commit=False
+    ) as session:
+        yield session
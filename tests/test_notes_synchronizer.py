@@ -1,4 +1,6 @@
 from unittest.mock import patch
+
+from config.config import Pipeline
 from NotesSynchronizer.notes_synchronizer import (
     NotesSynchronizer,
     TimestampedNote,
@@ -7,6 +9,7 @@ from NotesSynchronizer.notes_synchronizer import (
 )
 import sys
 from pathlib import Path
+import numpy as np
 import pytest
 
 sys.path.insert(0, str(Path(__file__).parent.parent))
@@ -22,16 +25,36 @@ class MockSubtitles:
             ],
         }
 
+    def transcribe_stream(self, audio_path: str):
+        chunks = self.transcribe_audio_with_timestamps(audio_path)["chunks"]
+        for chunk in chunks:
+            yield [chunk]
+
 
 class MockImageCaption:
+    batch_size = 8
+
     def caption_image(self, image_path: str):
         return "Тестовое описание изображения"
 
+    def caption_batch(self, frames):
+        return ["Тестовое описание изображения" for _ in frames]
+
 
 class MockTextSummarizer:
     def summarize(self, text: str, max_length: int = 150):
         return "Тестовое резюме"
 
+    def summarize_lengths(self, text: str, max_lengths):
+        return [self.summarize(text, max_length) for max_length in max_lengths]
+
+    def build_tree(self, text: str, cached=None):
+        self.cached = cached
+        return {"model": "mock", "levels": [[text]]}
+
+    def summarize_tree(self, tree, max_lengths):
+        return self.summarize_lengths(tree["levels"][-1][0], max_lengths)
+
 
 class TestTimestampedNote:
     """Тесты для класса TimestampedNote"""
@@ -120,26 +143,91 @@ class TestNotesSynchronizer:
             subtitles_mock, image_caption_mock, summarizer_mock
         )
 
-    @patch("NotesSynchronizer.notes_synchronizer.extract_audio")
     @patch("NotesSynchronizer.notes_synchronizer.extract_frames")
-    def test_synchronize_success(
-        self, mock_extract_frames, mock_extract_audio, synchronizer
-    ):
+    def test_synchronize_success(self, mock_extract_frames, synchronizer):
         """Тест успешной синхронизации заметок"""
 
-        mock_extract_audio.return_value = "/tmp/test_audio.wav"
-        mock_extract_frames.return_value = (
-            ["/tmp/frame1.png", "/tmp/frame2.png"],
-            [1000.0, 6000.0],
+        mock_extract_frames.return_value = iter(
+            [
+                (1000.0, np.zeros((4, 4, 3), dtype=np.uint8)),
+                (6000.0, np.zeros((4, 4, 3), dtype=np.uint8)),
+            ]
         )
         video_path = "/tmp/test_video.mp4"
         video_id = 123
-        result = synchronizer.synchronize(video_path, video_id)
-        mock_extract_audio.assert_called_once()
-        mock_extract_frames.assert_called_once_with(video_path, video_id)
+        progress = []
+        result = synchronizer.synchronize(
+            video_path, video_id, progress.append
+        )
+        mock_extract_frames.assert_called_once_with(video_path, video_id, None)
         assert len(result) == 2
         assert isinstance(result[0], TimestampedNote)
         assert result[0].audio_text == "Первая часть текста"
+        assert result[0].image_description == "Тестовое описание изображения"
+        assert progress == [
+            "Первая часть текста",
+            "Первая часть текста Вторая часть текста",
+        ]
+
+    @patch("NotesSynchronizer.notes_synchronizer.extract_frames")
+    def test_synchronize_sequential_matches_concurrent(
+        self, mock_extract_frames, mock_models
+    ):
+        """Последовательный и параллельный режимы дают одинаковые заметки"""
+        results = []
+        for concurrent in (True, False):
+            mock_extract_frames.return_value = iter(
+                [(1000.0, np.zeros((4, 4, 3), dtype=np.uint8))]
+            )
+            synchronizer = NotesSynchronizer(
+                *mock_models,
+                pipeline=Pipeline(
+                    concurrent=concurrent, asr_threads=0, caption_threads=0
+                ),
+            )
+            results.append(synchronizer.synchronize("/tmp/video.mp4", 1))
+
+        assert results[0] == results[1]
+        assert results[0][0].image_description != ""
+
+    def test_synchronize_by_timestamp_boundaries(self, synchronizer):
+        """Кадр на границе чанков попадает ровно в один, следующий чанк"""
+        transcription = {
+            "text": "",
+            "chunks": [
+                {"text": "a", "timestamp": (0.0, 5.0)},
+                {"text": "b", "timestamp": (5.0, 10.0)},
+                {"text": "c", "timestamp": (10.0, None)},
+            ],
+        }
+        frames = [
+            (12000.0, "f4"),
+            (0.0, "f0"),
+            (5000.0, "f1"),
+            (9999.0, "f2"),
+            (10000.0, "f3"),
+        ]
+
+        notes = synchronizer._synchronize_by_timestamp(transcription, frames)
+
+        assert [note.image_description for note in notes] == [
+            "f0",
+            "f1 f2",
+            "f3 f4",
+        ]
+
+    def test_synchronize_by_timestamp_last_chunk_end(self, synchronizer):
+        """Кадр ровно на конце последнего чанка не теряется"""
+        transcription = {
+            "text": "",
+            "chunks": [{"text": "a", "timestamp": (0.0, 5.0)}],
+        }
+
+        notes = synchronizer._synchronize_by_timestamp(
+            transcription, [(5000.0, "f0"), (5001.0, "f1")]
+        )
+
+        assert notes[0].image_description == "f0"
 
     def test_generate_summary(self, synchronizer):
         """Тест генерации сводки"""
@@ -165,6 +253,26 @@ class TestNotesSynchronizer:
         assert result.detailed == "Тестовое резюме"
         assert len(result.timestamped_summaries) == 2
 
+    def test_generate_summary_reuses_saved_tree(self, synchronizer, tmp_path):
+        """Уровни суммаризации сохраняются и передаются при повторе"""
+        notes = [
+            TimestampedNote(
+                timestamp_ms=0,
+                audio_text="Аудио",
+                image_description="",
+                combined_text="Комбинированный текст",
+            )
+        ]
+        tree_path = tmp_path / "tree.json"
+
+        synchronizer.generate_summary(notes, tree_path)
+        assert synchronizer.summarizer.cached is None
+        synchronizer.generate_summary(notes, tree_path)
+        assert synchronizer.summarizer.cached == {
+            "model": "mock",
+            "levels": [["Комбинированный текст"]],
+        }
+
 
 if __name__ == "__main__":
     pytest.main([__file__, "-v"])
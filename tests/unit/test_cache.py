@@ -0,0 +1,74 @@
+from subtitles.cache import PersistentCache
+
+
+def test_cache_memory_and_disk_hits(tmp_path):
+    cache = PersistentCache(tmp_path / "cache.db", memory_items=1)
+
+    assert cache.get("a") is None
+    cache.set("a", "первый")
+    cache.set("b", "второй")
+
+    assert cache.get("b") == "второй"
+    assert cache.get("a") == "первый"
+    assert cache.stats["memory_hits"] == 1
+    assert cache.stats["disk_hits"] == 1
+    assert cache.stats["misses"] == 1
+
+
+def test_cache_persists_between_instances(tmp_path):
+    cache = PersistentCache(tmp_path / "cache.db")
+    cache.set("key", "value")
+    cache.close()
+
+    reopened = PersistentCache(tmp_path / "cache.db")
+
+    assert reopened.get("key") == "value"
+    assert reopened.stats["disk_hits"] == 1
+
+
+def test_cache_evicts_least_recently_used(tmp_path):
+    cache = PersistentCache(
+        tmp_path / "cache.db", memory_items=0, max_disk_bytes=10
+    )
+    cache.set("old", "12345")
+    cache.set("fresh", "12345")
+    cache.get("old")
+    cache.set("new", "12345")
+
+    assert cache.get("fresh") is None
+    assert cache.get("old") == "12345"
+    assert cache.get("new") == "12345"
+    assert cache.stats["disk_bytes"] == 10
+
+
+def test_cache_size_limit_is_shared_between_processes(tmp_path):
+    first = PersistentCache(
+        tmp_path / "cache.db", memory_items=0, max_disk_bytes=10
+    )
+    second = PersistentCache(
+        tmp_path / "cache.db", memory_items=0, max_disk_bytes=10
+    )
+    first.set("a", "12345")
+    second.set("b", "12345")
+    first.set("c", "12345")
+
+    assert second.get("a") is None
+    assert first.stats["disk_bytes"] == second.stats["disk_bytes"] == 10
+
+
+def test_cache_total_stats_accumulate_across_processes(tmp_path):
+    first = PersistentCache(tmp_path / "cache.db")
+    first.set("key", "value")
+    first.get("key")
+    first.get("missing")
+    first.flush_stats()
+    first.flush_stats()
+
+    second = PersistentCache(tmp_path / "cache.db")
+    second.get("key")
+
+    assert second.stats["disk_hits"] == 1
+    assert second.total_stats["memory_hits"] == 1
+    assert second.total_stats["disk_hits"] == 1
+    assert second.total_stats["misses"] == 1
+    assert second.total_stats["hit_rate"] == round(2 / 3, 4)
@@ -0,0 +1,74 @@
+import pytest
+from sqlalchemy import text
+
+import db
+from config.config import Database
+
+
+def make_database(url: str) -> Database:
+    return Database(
+        url=url,
+        busy_timeout_ms=1500,
+        mmap_size_mb=16,
+        pool_size=7,
+        max_overflow=3,
+        pool_timeout_s=5,
+        pool_recycle_s=600,
+    )
+
+
+def pragma(connection, name: str):
+    return connection.execute(text(f"PRAGMA {name}")).scalar()
+
+
+def test_sqlite_engine_sets_pragmas(tmp_path):
+    engine = db.make_engine(make_database(f"sqlite:///{tmp_path}/app.db"))
+
+    with engine.connect() as connection:
+        assert pragma(connection, "journal_mode") == "wal"
+        # 1 = NORMAL
+        assert pragma(connection, "synchronous") == 1
+        assert pragma(connection, "busy_timeout") == 1500
+        assert pragma(connection, "mmap_size") == 16 * 1024 * 1024
+    engine.dispose()
+
+
+def test_server_engine_uses_pool_settings(monkeypatch):
+    calls = []
+    monkeypatch.setattr(
+        db, "create_engine", lambda url, **kwargs: calls.append(kwargs)
+    )
+
+    db.make_engine(make_database("postgresql://app@localhost/notes"))
+
+    assert calls == [
+        {
+            "pool_size": 7,
+            "max_overflow": 3,
+            "pool_timeout": 5,
+            "pool_recycle": 600,
+            "pool_pre_ping": True,
+        }
+    ]
+
+
+def test_async_url_uses_async_driver():
+    assert db.async_url("sqlite:///app.db").drivername == "sqlite+aiosqlite"
+    assert (
+        db.async_url("postgresql+psycopg2://app@localhost/notes").drivername
+        == "postgresql+asyncpg"
+    )
+    with pytest.raises(ValueError):
+        db.async_url("mssql+pyodbc://app@localhost/notes")
+
+
+@pytest.mark.anyio
+async def test_async_sqlite_engine_sets_pragmas(tmp_path):
+    engine = db.make_async_engine(
+        make_database(f"sqlite:///{tmp_path}/app.db")
+    )
+
+    async with engine.connect() as connection:
+        assert await connection.run_sync(pragma, "journal_mode") == "wal"
+        assert await connection.run_sync(pragma, "busy_timeout") == 1500
+    await engine.dispose()
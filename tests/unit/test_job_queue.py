@@ -0,0 +1,85 @@
+import pytest
+from datetime import UTC, datetime, timedelta
+from sqlmodel import Session, SQLModel, create_engine
+from db import Job, JobStatus, VideoTranscription
+from services.job_queue import (
+    claim_job,
+    complete_job,
+    enqueue_job,
+    fail_job,
+    recover_stale_jobs,
+)
+
+
+@pytest.fixture
+def session():
+    engine = create_engine("sqlite:///:memory:")
+    SQLModel.metadata.create_all(engine)
+    with Session(engine) as session:
+        yield session
+
+
+@pytest.fixture
+def transcription(session: Session):
+    transcription = VideoTranscription(user_id=1, transcription="")
+    session.add(transcription)
+    session.commit()
+    session.refresh(transcription)
+    return transcription
+
+
+def test_claim_job_takes_oldest_once(session, transcription):
+    first = enqueue_job(session, transcription.id, "first.mp4")
+    enqueue_job(session, transcription.id, "second.mp4")
+
+    claimed = claim_job(session, "worker-1")
+
+    assert claimed.id == first.id
+    assert claimed.status == JobStatus.running
+    assert claimed.attempts == 1
+    assert claim_job(session, "worker-2").video_path == "second.mp4"
+    assert claim_job(session, "worker-3") is None
+
+
+def test_failed_job_is_retried_until_max_attempts(session, transcription):
+    enqueue_job(session, transcription.id, "video.mp4", max_attempts=2)
+
+    job = claim_job(session, "worker")
+    assert fail_job(session, job.id, "boom").status == JobStatus.queued
+    session.refresh(transcription)
+    assert transcription.transcription_failed is False
+
+    job = claim_job(session, "worker")
+    assert job.attempts == 2
+    job = fail_job(session, job.id, "boom")
+    assert job.status == JobStatus.failed
+    assert job.error == "boom"
+    session.refresh(transcription)
+    assert transcription.transcription_failed is True
+
+
+def test_complete_job(session, transcription):
+    enqueue_job(session, transcription.id, "video.mp4")
+    job = claim_job(session, "worker")
+
+    complete_job(session, job.id)
+
+    job = session.get(Job, job.id)
+    assert job.status == JobStatus.done
+    assert job.finished_at is not None
+
+
+def test_recover_stale_jobs(session, transcription):
+    enqueue_job(session, transcription.id, "stale.mp4")
+    enqueue_job(session, transcription.id, "alive.mp4")
+    stale = claim_job(session, "dead-worker")
+    alive = claim_job(session, "worker")
+    stale.heartbeat_at = datetime.now(UTC).replace(tzinfo=None) - timedelta(
+        minutes=10
+    )
+    session.add(stale)
+    session.commit()
+
+    assert recover_stale_jobs(session, stale_after_s=120) == [stale.id]
+    assert session.get(Job, stale.id).status == JobStatus.queued
+    assert session.get(Job, alive.id).status == JobStatus.running
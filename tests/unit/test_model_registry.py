@@ -0,0 +1,90 @@
+import threading
+
+import pytest
+
+import main
+from services.model_registry import ModelRegistry
+
+
+def failing_loader():
+    raise OSError("нет весов")
+
+
+def test_background_loading_reports_per_model_state():
+    release = threading.Event()
+    registry = ModelRegistry(
+        "background",
+        loaders={"slow": lambda: release.wait(5), "broken": failing_loader},
+    )
+
+    registry.start()
+    status = registry.status()
+    assert status["ready"] is False
+    assert status["models"]["slow"]["state"] in ("not_loaded", "loading")
+
+    release.set()
+    registry._thread.join(5)
+    status = registry.status()
+    assert status["models"]["slow"]["state"] == "ready"
+    assert status["models"]["broken"]["state"] == "failed"
+    assert "нет весов" in status["models"]["broken"]["error"]
+    assert status["ready"] is False
+
+
+def test_lazy_loading_loads_once_on_first_use():
+    calls = []
+    registry = ModelRegistry(
+        "lazy", loaders={"model": lambda: calls.append(1) or "модель"}
+    )
+
+    registry.start()
+    assert registry.status()["models"]["model"]["state"] == "not_loaded"
+    assert registry.status()["ready"] is True
+    assert registry.get("model") == "модель"
+    assert registry.get("model") == "модель"
+    assert calls == [1]
+    assert registry.status()["ready"] is True
+
+
+def test_disabled_loading_skips_models():
+    registry = ModelRegistry("disabled", loaders={"model": failing_loader})
+
+    registry.start()
+    assert registry.status()["ready"] is True
+    with pytest.raises(RuntimeError):
+        registry.get("model")
+    with pytest.raises(ValueError):
+        ModelRegistry("eager")
+
+
+def test_lazy_loading_failure_is_not_ready():
+    registry = ModelRegistry("lazy", loaders={"model": failing_loader})
+
+    with pytest.raises(OSError):
+        registry.get("model")
+    assert registry.status()["models"]["model"]["state"] == "failed"
+    assert registry.status()["ready"] is False
+
+
+def test_health_ready_endpoint(client, monkeypatch):
+    registry = ModelRegistry("background", loaders={"model": lambda: "модель"})
+    monkeypatch.setattr(main, "models", registry)
+
+    response = client.get("/health/ready")
+    assert response.status_code == 503
+    assert response.json()["models"]["model"]["state"] == "not_loaded"
+
+    registry.get("model")
+    response = client.get("/health/ready")
+    assert response.status_code == 200
+    assert response.json()["ready"] is True
+
+
+def test_health_ready_without_api_models(client, monkeypatch):
+    for loading in ("lazy", "disabled"):
+        registry = ModelRegistry(loading, loaders={"model": failing_loader})
+        monkeypatch.setattr(main, "models", registry)
+
+        response = client.get("/health/ready")
+        assert response.status_code == 200
+        assert response.json()["loading"] == loading
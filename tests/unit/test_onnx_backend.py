@@ -0,0 +1,55 @@
+import pytest
+
+from subtitles import onnx_backend
+
+
+class FakeORTModel:
+    calls = []
+
+    @classmethod
+    def from_pretrained(cls, model_id, export=False, provider=None):
+        cls.calls.append((str(model_id), export, provider))
+        return cls()
+
+    def save_pretrained(self, path):
+        path.mkdir(parents=True)
+        (path / "config.json").write_text("{}")
+
+
+def test_model_is_exported_once_and_loaded_from_cache(tmp_path, monkeypatch):
+    monkeypatch.setattr(onnx_backend, "_ort_class", lambda task: FakeORTModel)
+    FakeORTModel.calls = []
+
+    onnx_backend.load_ort_model("summarization", "org/model", tmp_path)
+    onnx_backend.load_ort_model("summarization", "org/model", tmp_path)
+
+    cached = tmp_path / "org--model"
+    assert FakeORTModel.calls == [
+        ("org/model", True, "CPUExecutionProvider"),
+        (str(cached), False, "CPUExecutionProvider"),
+    ]
+
+
+def test_onnx_pipeline_passes_preprocessors(monkeypatch):
+    monkeypatch.setattr(
+        onnx_backend, "load_ort_model", lambda task, name: "ort-model"
+    )
+    monkeypatch.setattr(onnx_backend, "pipeline", lambda **kwargs: kwargs)
+
+    built = onnx_backend.onnx_pipeline(
+        "automatic-speech-recognition", "org/whisper", chunk_length_s=30
+    )
+
+    assert built == {
+        "task": "automatic-speech-recognition",
+        "model": "ort-model",
+        "device": "cpu",
+        "tokenizer": "org/whisper",
+        "feature_extractor": "org/whisper",
+        "chunk_length_s": 30,
+    }
+
+
+def test_unsupported_task():
+    with pytest.raises(ValueError):
+        onnx_backend.load_ort_model("text-generation", "org/model")
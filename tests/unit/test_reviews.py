@@ -0,0 +1,223 @@
+from datetime import datetime
+from itertools import count
+
+import pytest
+from fastapi import status
+from sqlmodel import Session, select
+
+from db import SERVICE_RATING_KEY, ReviewRating
+from services.review_service import (
+    check_review_ratings,
+    reviews_page_statement,
+)
+from tests.test_db import engine_test
+
+# Каждый тест пишет отзывы на свою транскрипцию и не видит чужие
+transcription_ids = count(9001)
+
+
+@pytest.fixture
+def auth_username():
+    return "reviewer"
+
+
+@pytest.fixture
+def transcription_id(client, auth_headers):
+    transcription_id = next(transcription_ids)
+    for number, rating in enumerate([3, 5, 1, 5, 2, 4, 3]):
+        response = client.post(
+            "/reviews/",
+            json={
+                "username": "reviewer",
+                "transcription_id": transcription_id,
+                "rating": rating,
+                "comment": f"отзыв {number}",
+            },
+            headers=auth_headers,
+        )
+        assert response.status_code == status.HTTP_200_OK
+    return transcription_id
+
+
+def read_all_pages(
+    client, transcription_id: int, sort_by: str, limit: int
+) -> list[str]:
+    comments, cursor = [], None
+    while True:
+        params = {"sort_by": sort_by, "limit": limit}
+        if cursor is not None:
+            params["cursor"] = cursor
+        response = client.get(f"/reviews/{transcription_id}", params=params)
+        assert response.status_code == status.HTTP_200_OK
+        page = response.json()
+        assert len(page["items"]) <= limit
+        comments += [item["comment"] for item in page["items"]]
+        cursor = page["next_cursor"]
+        if cursor is None:
+            return comments
+
+
+@pytest.mark.parametrize("sort_by", ["newest", "oldest", "best", "worst"])
+def test_pages_match_single_listing(client, transcription_id, sort_by):
+    response = client.get(
+        f"/reviews/{transcription_id}",
+        params={"sort_by": sort_by, "limit": 100},
+    )
+    full = [item["comment"] for item in response.json()["items"]]
+
+    assert len(full) == 7
+    assert response.json()["next_cursor"] is None
+    assert read_all_pages(client, transcription_id, sort_by, 2) == full
+
+
+def test_sort_orders(client, transcription_id):
+    def ratings(sort_by):
+        response = client.get(
+            f"/reviews/{transcription_id}", params={"sort_by": sort_by}
+        )
+        return [item["rating"] for item in response.json()["items"]]
+
+    assert ratings("best") == [5, 5, 4, 3, 3, 2, 1]
+    assert ratings("worst") == [1, 2, 3, 3, 4, 5, 5]
+    newest = client.get(f"/reviews/{transcription_id}").json()["items"]
+    assert newest[0]["comment"] == "отзыв 6"
+
+
+@pytest.mark.parametrize("cursor", ["not-a-cursor", "e30="])
+def test_invalid_cursor(client, cursor):
+    response = client.get("/reviews", params={"cursor": cursor})
+
+    assert response.status_code == status.HTTP_400_BAD_REQUEST
+
+
+def test_cursor_from_other_sort_is_rejected(client, transcription_id):
+    cursor = client.get(
+        f"/reviews/{transcription_id}", params={"limit": 1}
+    ).json()["next_cursor"]
+
+    response = client.get(
+        f"/reviews/{transcription_id}",
+        params={"sort_by": "best", "cursor": cursor},
+    )
+
+    assert response.status_code == status.HTTP_400_BAD_REQUEST
+
+
+def query_plan(statement) -> str:
+    compiled = statement.compile(engine_test)
+    # План не зависит от значений, даты передаются строкой как в базе
+    params = tuple(
+        str(value) if isinstance(value, datetime) else value
+        for value in (compiled.params[name] for name in compiled.positiontup)
+    )
+    with engine_test.connect() as connection:
+        rows = connection.exec_driver_sql(
+            f"EXPLAIN QUERY PLAN {compiled}", params
+        ).all()
+    return "\n".join(row[-1] for row in rows)
+
+
+@pytest.mark.parametrize(
+    "sort_by, index, key_range",
+    [
+        ("newest", "ix_review_transcription_created", "created_dt_tm<?"),
+        ("oldest", "ix_review_transcription_created", "created_dt_tm>?"),
+        ("best", "ix_review_transcription_rating_created", "rating<?"),
+        ("worst", "ix_review_transcription_rating_newest", "rating>?"),
+    ],
+)
+def test_next_page_is_index_range(
+    client, transcription_id, sort_by, index, key_range
+):
+    cursor = client.get(
+        f"/reviews/{transcription_id}",
+        params={"sort_by": sort_by, "limit": 2},
+    ).json()["next_cursor"]
+
+    plan = query_plan(
+        reviews_page_statement(transcription_id, 2, sort_by, cursor)
+    )
+
+    assert f"USING INDEX {index} (transcription_id=? AND {key_range})" in plan
+    assert "TEMP B-TREE" not in plan
+
+
+def test_summary_uses_aggregates(client, transcription_id):
+    response = client.get(
+        "/reviews/summary", params={"transcription_id": transcription_id}
+    )
+
+    assert response.status_code == status.HTTP_200_OK
+    assert response.json() == {
+        "transcription_id": transcription_id,
+        "count": 7,
+        "average": 3.29,
+        "stars": {"1": 1, "2": 1, "3": 2, "4": 1, "5": 2},
+    }
+
+
+def test_summary_without_reviews(client):
+    response = client.get(
+        "/reviews/summary",
+        params={"transcription_id": next(transcription_ids)},
+    )
+
+    assert response.json()["count"] == 0
+    assert response.json()["average"] == 0
+
+
+def test_service_summary(client, auth_headers):
+    before = client.get("/reviews/summary").json()
+    client.post(
+        "/reviews/",
+        json={"username": "reviewer", "rating": 4, "comment": "сервис"},
+        headers=auth_headers,
+    )
+
+    after = client.get("/reviews/summary").json()
+
+    assert after["transcription_id"] is None
+    assert after["count"] == before["count"] + 1
+    assert after["stars"]["4"] == before["stars"]["4"] + 1
+
+
+def test_service_reviews_share_one_aggregate(client, auth_headers):
+    for rating in (2, 5):
+        client.post(
+            "/reviews/",
+            json={"username": "reviewer", "rating": rating, "comment": "ок"},
+            headers=auth_headers,
+        )
+
+    with Session(engine_test) as session:
+        rows = session.exec(
+            select(ReviewRating).where(ReviewRating.transcription_id.is_(None))
+        ).all()
+    assert [row.key for row in rows] == [SERVICE_RATING_KEY]
+
+
+def test_checker_rebuilds_aggregates(transcription_id):
+    with Session(engine_test) as session:
+        assert check_review_ratings(session) == []
+        rating = session.exec(
+            select(ReviewRating).where(
+                ReviewRating.transcription_id == transcription_id
+            )
+        ).one()
+        rating.count = 0
+        rating.stars_5 = 0
+        session.add(rating)
+        session.commit()
+
+        assert check_review_ratings(session, repair=True) == [transcription_id]
+        assert check_review_ratings(session) == []
+        rebuilt = session.exec(
+            select(ReviewRating).where(
+                ReviewRating.transcription_id == transcription_id
+            )
+        ).one()
+        assert (rebuilt.count, rebuilt.rating_sum, rebuilt.stars_5) == (
+            7,
+            23,
+            2,
+        )
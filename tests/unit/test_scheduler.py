@@ -0,0 +1,90 @@
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from subtitles.scheduler import MicroBatcher
+
+
+def test_concurrent_requests_are_batched_together():
+    batches = []
+
+    def process(items):
+        batches.append(list(items))
+        return [item * 2 for item in items]
+
+    batcher = MicroBatcher(process, max_batch_size=8, max_wait_ms=200)
+    barrier = threading.Barrier(8)
+
+    def call(item):
+        barrier.wait()
+        return batcher.submit(item).result()
+
+    with ThreadPoolExecutor(max_workers=8) as executor:
+        results = list(executor.map(call, range(8)))
+
+    assert results == [item * 2 for item in range(8)]
+    assert len(batches) < 8
+    assert sorted(item for batch in batches for item in batch) == list(
+        range(8)
+    )
+
+
+def test_batch_size_is_bounded():
+    batches = []
+    release = threading.Event()
+
+    def process(items):
+        release.wait(5)
+        batches.append(len(items))
+        return items
+
+    batcher = MicroBatcher(process, max_batch_size=3, max_wait_ms=0)
+    futures = [batcher.submit(item) for item in range(8)]
+    release.set()
+
+    assert [future.result() for future in futures] == list(range(8))
+    assert max(batches) == 3
+    assert sum(batches) == batcher.items == 8
+
+
+def test_errors_are_returned_to_every_caller():
+    def process(items):
+        raise RuntimeError("нет памяти")
+
+    batcher = MicroBatcher(process, max_batch_size=4, max_wait_ms=50)
+
+    futures = [batcher.submit(item) for item in range(2)]
+
+    for future in futures:
+        with pytest.raises(RuntimeError, match="нет памяти"):
+            future.result()
+    # Планировщик продолжает работу после ошибки
+    batcher.process_batch = lambda items: items
+    assert batcher.map([1, 2]) == [1, 2]
+
+
+def test_missing_results_fail_every_caller():
+    batcher = MicroBatcher(
+        lambda items: items[:-1], max_batch_size=4, max_wait_ms=50
+    )
+
+    futures = [batcher.submit(item) for item in range(3)]
+
+    for future in futures:
+        with pytest.raises(RuntimeError, match="результатов на"):
+            future.result(timeout=5)
+
+
+def test_on_start_runs_in_scheduler_thread():
+    started = []
+    batcher = MicroBatcher(
+        lambda items: items,
+        max_batch_size=2,
+        max_wait_ms=0,
+        name="test-batcher",
+        on_start=lambda: started.append(threading.current_thread().name),
+    )
+
+    assert batcher.map([1, 2, 3]) == [1, 2, 3]
+    assert started == ["test-batcher"]
@@ -0,0 +1,574 @@
+import subprocess
+import sys
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from types import SimpleNamespace
+
+import cv2
+import imageio_ffmpeg
+import numpy as np
+import pytest
+import torch
+
+from config.config import FrameSampling, Tier, tier_sampling
+from PIL import Image
+
+from subtitles import subtitles as subtitles_module
+from subtitles.cache import PersistentCache
+from subtitles.scheduler import MicroBatcher
+from subtitles.subtitles import (
+    SAMPLE_RATE,
+    ImageCaption,
+    SingleProcessor,
+    Subtitles,
+    TextSummarizer,
+    frame_hash,
+    hash_distance,
+    iter_audio_windows,
+    iter_frames,
+    iter_scene_frames,
+    load_audio,
+    sample_frames,
+    select_dtype,
+)
+
+
+@pytest.fixture
+def video_file(tmp_path):
+    """Синтетическое видео: 100 кадров 25 fps, яркость равна номеру кадра"""
+    path = str(tmp_path / "video.mp4")
+    writer = cv2.VideoWriter(
+        path, cv2.VideoWriter_fourcc(*"mp4v"), 25, (64, 48)
+    )
+    for i in range(100):
+        writer.write(np.full((48, 64, 3), i * 2, dtype=np.uint8))
+    writer.release()
+    return path
+
+
+def test_iter_frames_samples_every_nth_frame(video_file):
+    frames = list(iter_frames(video_file, frame_distance=30))
+
+    timestamps = [timestamp for timestamp, _ in frames]
+    assert timestamps == [0.0, 1200.0, 2400.0, 3600.0]
+    assert all(frame.shape == (48, 64, 3) for _, frame in frames)
+
+
+def test_iter_frames_is_lazy(video_file):
+    frames = iter_frames(video_file, frame_distance=30)
+
+    timestamp, _ = next(frames)
+    frames.close()
+
+    assert timestamp == 0.0
+
+
+def write_slides(path: str, slides: list[np.ndarray], seconds: int = 4):
+    writer = cv2.VideoWriter(
+        path, cv2.VideoWriter_fourcc(*"mp4v"), 25, (64, 48)
+    )
+    for slide in slides:
+        for _ in range(seconds * 25):
+            writer.write(slide)
+    writer.release()
+
+
+@pytest.fixture
+def slides_video(tmp_path):
+    """Три разных "слайда" по 4 секунды"""
+    rng = np.random.default_rng(42)
+    slides = [
+        cv2.resize(
+            rng.integers(0, 255, (6, 8, 3), dtype=np.uint8),
+            (64, 48),
+            interpolation=cv2.INTER_NEAREST,
+        )
+        for _ in range(3)
+    ]
+    path = str(tmp_path / "slides.mp4")
+    write_slides(path, slides)
+    return path, slides
+
+
+def test_frame_hash_distance(slides_video):
+    _, slides = slides_video
+
+    assert hash_distance(frame_hash(slides[0]), frame_hash(slides[0])) == 0
+    assert hash_distance(frame_hash(slides[0]), frame_hash(slides[1])) > 10
+
+
+def test_iter_scene_frames_keeps_only_slide_changes(slides_video):
+    path, _ = slides_video
+
+    timestamps = [timestamp for timestamp, _ in iter_scene_frames(path)]
+
+    assert timestamps == [0.0, 4000.0, 8000.0]
+
+
+def test_iter_scene_frames_respects_max_interval(tmp_path):
+    path = str(tmp_path / "static.mp4")
+    write_slides(path, [np.full((48, 64, 3), 128, dtype=np.uint8)], 10)
+
+    timestamps = [
+        timestamp
+        for timestamp, _ in iter_scene_frames(path, max_interval_ms=3000)
+    ]
+
+    assert timestamps == [0.0, 3000.0, 6000.0, 9000.0]
+
+
+def test_sample_frames_rejects_unknown_mode(video_file):
+    sampling = FrameSampling(
+        mode="unknown",
+        frame_distance=150,
+        probe_interval_ms=1000,
+        min_interval_ms=2000,
+        max_interval_ms=60000,
+        hash_threshold=10,
+        save_frames=False,
+    )
+
+    with pytest.raises(ValueError):
+        sample_frames(video_file, sampling)
+
+
+def test_caption_batch_converts_frames_in_memory():
+    calls = []
+
+    def fake_pipeline(images, batch_size):
+        calls.append((images, batch_size))
+        return [
+            [{"generated_text": f"caption {i}"}] for i in range(len(images))
+        ]
+
+    caption = object.__new__(ImageCaption)
+    caption.pipeline = fake_pipeline
+    caption.batch_size = 4
+    caption.cache = None
+    bgr_frame = np.zeros((4, 4, 3), dtype=np.uint8)
+    bgr_frame[..., 2] = 255
+    pil_image = Image.new("RGB", (4, 4))
+
+    result = caption.caption_batch([bgr_frame, pil_image])
+
+    assert result == ["caption 0", "caption 1"]
+    images, batch_size = calls[0]
+    assert batch_size == 4
+    assert images[0].getpixel((0, 0)) == (255, 0, 0)
+    assert images[1] is pil_image
+
+
+def test_caption_batch_uses_cache(tmp_path):
+    calls = []
+
+    def fake_pipeline(images, batch_size):
+        calls.append(len(images))
+        return [[{"generated_text": "слайд"}] for _ in images]
+
+    caption = object.__new__(ImageCaption)
+    caption.pipeline = fake_pipeline
+    caption.batch_size = 4
+    caption.model_name = "test-model"
+    caption.cache = PersistentCache(tmp_path / "captions.db")
+    frame = np.zeros((32, 32, 3), dtype=np.uint8)
+    frame[:, :16] = 255
+
+    assert caption.caption_batch([frame, frame]) == ["слайд", "слайд"]
+    assert caption.caption_batch([frame.copy()]) == ["слайд"]
+    assert calls == [1]
+    assert caption.cache.stats["misses"] == 2
+    assert caption.cache.stats["memory_hits"] == 1
+
+
+def test_load_audio_decodes_to_16khz_mono(tmp_path):
+    path = str(tmp_path / "tone.wav")
+    subprocess.run(
+        [
+            imageio_ffmpeg.get_ffmpeg_exe(),
+            "-loglevel",
+            "error",
+            "-f",
+            "lavfi",
+            "-i",
+            "sine=frequency=440:duration=1:sample_rate=44100",
+            "-ac",
+            "2",
+            path,
+        ],
+        check=True,
+    )
+
+    audio = load_audio(path)
+
+    assert audio.dtype == np.float32
+    assert audio.shape == (16000,)
+    assert 0.05 < np.abs(audio).max() <= 1.0
+
+
+def test_load_audio_without_audio_track(video_file):
+    with pytest.raises(ValueError, match="нет аудиодорожки"):
+        load_audio(video_file)
+
+
+@pytest.fixture
+def tone_file(tmp_path):
+    """Синусоида 10 секунд"""
+    path = str(tmp_path / "tone.wav")
+    subprocess.run(
+        [
+            imageio_ffmpeg.get_ffmpeg_exe(),
+            "-loglevel",
+            "error",
+            "-f",
+            "lavfi",
+            "-i",
+            "sine=frequency=440:duration=10",
+            path,
+        ],
+        check=True,
+    )
+    return path
+
+
+def test_iter_audio_windows_overlap(tone_file):
+    windows = list(iter_audio_windows(tone_file, window_s=4, overlap_s=1))
+
+    starts = [start for start, _, _ in windows]
+    sizes = [samples.size for _, samples, _ in windows]
+    assert starts == [0.0, 3.0, 6.0]
+    assert sizes == [64000, 64000, 64000]
+    assert [is_last for _, _, is_last in windows] == [False, False, True]
+
+
+def test_iter_audio_windows_fails_on_decode_error(monkeypatch):
+    # ffmpeg успевает отдать часть сэмплов и завершается с ошибкой
+    script = (
+        "import sys; sys.stdout.buffer.write(bytes(4000)); "
+        "sys.stderr.write('Invalid data'); sys.exit(1)"
+    )
+    monkeypatch.setattr(
+        subtitles_module,
+        "_ffmpeg_audio_command",
+        lambda path, sample_rate: [sys.executable, "-c", script],
+    )
+
+    with pytest.raises(ValueError, match="Invalid data"):
+        list(iter_audio_windows("broken.mp4", window_s=4, overlap_s=1))
+
+
+def test_transcribe_stream_deduplicates_overlap(tone_file):
+    # Речь в абсолютном времени: "б" пересекает конец первого окна,
+    # "г" целиком в перекрытии второго и третьего окон
+    speech = [
+        ("а", 0.5, 2.0),
+        ("б", 3.2, 4.6),
+        ("в", 5.0, 6.0),
+        ("г", 6.2, 6.4),
+        ("д", 8.0, 9.5),
+    ]
+    window_starts = iter([0.0, 3.0, 6.0])
+
+    def transcribe(samples):
+        start = next(window_starts)
+        end = start + samples.size / SAMPLE_RATE
+        return {
+            "text": "",
+            "chunks": [
+                {
+                    "text": text,
+                    # Чанк, обрезанный концом окна, приходит без конца
+                    "timestamp": (
+                        max(chunk_start, start) - start,
+                        None if chunk_end > end else chunk_end - start,
+                    ),
+                }
+                for text, chunk_start, chunk_end in speech
+                if chunk_start < end and chunk_end > start
+            ],
+        }
+
+    subtitles = object.__new__(Subtitles)
+    subtitles.transcribe_audio_with_timestamps = transcribe
+
+    windows = list(
+        subtitles.transcribe_stream(tone_file, window_s=4, overlap_s=1)
+    )
+
+    assert [[c["text"] for c in chunks] for chunks in windows] == [
+        ["а"],
+        ["б", "в", "г"],
+        ["д"],
+    ]
+    # Чанк на границе окон берется целиком из следующего окна
+    assert windows[1][0]["timestamp"] == (3.2, 4.6)
+
+
+class FakeEncoding(dict):
+    def to(self, device):
+        return self
+
+
+class FakeTokenizer:
+    """Токенами считаются слова"""
+
+    def __init__(self):
+        self.calls = []
+        self.padded = []
+
+    def __call__(self, texts, **kwargs):
+        self.calls.append(texts)
+        input_ids = [text.split() for text in texts]
+        return {
+            "input_ids": input_ids,
+            "attention_mask": [[1] * len(ids) for ids in input_ids],
+        }
+
+    def decode(self, ids):
+        return " ".join(ids)
+
+    def pad(self, features, return_tensors):
+        self.padded.append([len(ids) for ids in features["input_ids"]])
+        return FakeEncoding(
+            input_ids=[" ".join(ids) for ids in features["input_ids"]]
+        )
+
+    def batch_decode(self, output_ids, skip_special_tokens):
+        return output_ids
+
+
+class FakeModel:
+    def __init__(self):
+        self.calls = []
+
+    def generate(self, input_ids, max_length, **kwargs):
+        self.calls.append((len(input_ids), max_length))
+        return [f"{text[:3]}/{max_length}" for text in input_ids]
+
+
+def make_summarizer(batch_size=2, chunk_tokens=55, chunk_overlap=0):
+    summarizer = object.__new__(TextSummarizer)
+    summarizer.model_name = "fake"
+    summarizer.pipeline = SimpleNamespace(
+        tokenizer=FakeTokenizer(), model=FakeModel(), device="cpu"
+    )
+    summarizer.generate_kwargs = {"min_length": 30, "do_sample": False}
+    summarizer.batch_size = batch_size
+    summarizer.chunk_tokens = chunk_tokens
+    summarizer.chunk_overlap = chunk_overlap
+    summarizer.level_max_length = 50
+    summarizer.cache = None
+    return summarizer
+
+
+def test_summarize_lengths_encodes_once_and_batches_by_length():
+    summarizer = make_summarizer()
+    # Соседние предложения не помещаются в один чанк: 5 чанков, 3 пачки
+    text = " ".join(
+        f"{i:03d} " + "слово " * (words - 2) + "конец."
+        for i, words in enumerate([50, 30, 40, 20, 45])
+    )
+
+    concise, detailed = summarizer.summarize_lengths(text, [150, 300])
+
+    tokenizer = summarizer.pipeline.tokenizer
+    # Разбиение и токенизация на каждом из двух уровней, верхний
+    # чанк дополняется до пачки отдельно для каждой длины
+    assert len(tokenizer.calls) == 4
+    assert tokenizer.padded == [[20, 30], [40, 45], [50], [5], [5]]
+    # Чанки свертываются в один уровень, он суммаризируется для каждой
+    # длины
+    assert summarizer.pipeline.model.calls == [
+        (2, 50),
+        (2, 50),
+        (1, 50),
+        (1, 150),
+        (1, 300),
+    ]
+    assert concise == "000/150"
+    assert detailed == "000/300"
+    assert summarizer.summarize_lengths("  ", [150, 300]) == ["", ""]
+
+
+def test_build_tree_reduces_and_reuses_cached_levels():
+    summarizer = make_summarizer(chunk_tokens=5)
+    text = "a1b c d. a2b c d. a3b c d. a4b c d."
+
+    tree = summarizer.build_tree(text)
+
+    assert tree == {
+        "model": "fake",
+        "text_hash": summarizer._text_hash(text),
+        "levels": [
+            ["a1b c d.", "a2b c d.", "a3b c d.", "a4b c d."],
+            ["a1b/50 a2b/50 a3b/50 a4b/50"],
+        ],
+    }
+    calls = len(summarizer.pipeline.model.calls)
+    tokenized = len(summarizer.pipeline.tokenizer.calls)
+    # Тот же текст и модель: нижние уровни не пересчитываются
+    assert summarizer.build_tree(text, tree) == tree
+    assert len(summarizer.pipeline.model.calls) == calls
+    assert len(summarizer.pipeline.tokenizer.calls) == tokenized
+    # Другая модель: пересчитываются только уровни саммари, чанки
+    # текста берутся из кэша без повторного разбиения
+    cached_chunks = [["x1 c.", "x2 c."], *tree["levels"][1:]]
+    rebuilt = summarizer.build_tree(
+        text, {**tree, "model": "other", "levels": cached_chunks}
+    )
+    assert len(summarizer.pipeline.model.calls) > calls
+    assert rebuilt["levels"] == [["x1 c.", "x2 c."], ["x1 /50 x2 /50"]]
+    # Другой текст: чанки разбиваются заново
+    other = summarizer.build_tree("b1b c d.", tree)
+    assert other["levels"] == [["b1b c d."]]
+
+
+def test_split_text_packs_sentences_by_token_budget():
+    summarizer = make_summarizer()
+
+    assert summarizer._split_text("a b c. d e. f g h.", max_tokens=5) == [
+        "a b c. d e.",
+        "f g h.",
+    ]
+    assert summarizer._split_text(
+        "a b c. d e. f g h.", max_tokens=5, overlap=1
+    ) == ["a b c. d e.", "d e. f g h."]
+    # Речь без знаков препинания режется по токенам
+    assert summarizer._split_text("1 2 3 4 5 6 7", max_tokens=3) == [
+        "1 2 3",
+        "4 5 6",
+        "7",
+    ]
+
+
+def test_summarize_lengths_memoizes_chunk_summaries(tmp_path):
+    summarizer = make_summarizer(chunk_tokens=3)
+    summarizer.cache = PersistentCache(tmp_path / "summaries.db")
+    text = "a1b c d. a1b c d."
+
+    first = summarizer.summarize_lengths(text, [150, 300])
+    calls = list(summarizer.pipeline.model.calls)
+    second = summarizer.summarize_lengths(text, [150, 300])
+
+    assert second == first
+    # Одинаковые чанки суммаризируются один раз, повтор берется из кэша
+    assert calls == [(1, 50), (1, 150), (1, 300)]
+    assert summarizer.pipeline.model.calls == calls
+    assert summarizer.cache.stats["memory_hits"] == 4
+    # min_length входит в ключ
+    summarizer.generate_kwargs = {"min_length": 10, "do_sample": False}
+    summarizer.summarize_lengths(text, [150])
+    assert len(summarizer.pipeline.model.calls) == 5
+
+
+@pytest.mark.parametrize(
+    "device, cpu_dtype, quantize, bf16, expected",
+    [
+        ("cuda", "auto", False, False, torch.float16),
+        ("cpu", "auto", False, True, torch.bfloat16),
+        ("cpu", "auto", False, False, torch.float32),
+        ("cpu", "bfloat16", True, True, torch.float32),
+        ("cpu", "float32", False, True, torch.float32),
+    ],
+)
+def test_select_dtype(
+    monkeypatch, device, cpu_dtype, quantize, bf16, expected
+):
+    monkeypatch.setattr("subtitles.subtitles.cpu_supports_bf16", lambda: bf16)
+    inference = SimpleNamespace(cpu_dtype=cpu_dtype, quantize=quantize)
+
+    assert select_dtype(device, inference) == expected
+
+
+def test_summarizer_batches_chunks_of_concurrent_jobs():
+    summarizer = make_summarizer(batch_size=4)
+    summarizer.scheduler = MicroBatcher(
+        summarizer._run_batch, max_batch_size=4, max_wait_ms=200
+    )
+    barrier = threading.Barrier(2)
+
+    def job(text):
+        barrier.wait()
+        return summarizer.summarize(text)
+
+    with ThreadPoolExecutor(max_workers=2) as executor:
+        results = list(executor.map(job, ["a1b c d.", "a2b c d."]))
+
+    assert results == ["a1b/150", "a2b/150"]
+    assert summarizer.pipeline.model.calls == [(2, 150)]
+
+
+@pytest.mark.parametrize(
+    "pool, started", [("thread", True), ("process", False)]
+)
+def test_scheduler_starts_only_for_thread_pool(monkeypatch, pool, started):
+    monkeypatch.setattr(subtitles_module.config.worker, "pool", pool)
+    monkeypatch.setattr(
+        subtitles_module.config.inference, "scheduler_enabled", True
+    )
+    summarizer = make_summarizer()
+
+    summarizer._start_scheduler(2)
+
+    assert (summarizer.scheduler is not None) is started
+
+
+def test_shared_processor_is_set_up_once(monkeypatch):
+    started = []
+
+    def load(self, *args, **kwargs):
+        self.model_name = "fake"
+        self._initialized = True
+
+    monkeypatch.setattr(SingleProcessor, "_instances", {})
+    monkeypatch.setattr(SingleProcessor, "_load", load)
+    monkeypatch.setattr(subtitles_module, "shared_cache", lambda *args: None)
+    monkeypatch.setattr(
+        SingleProcessor,
+        "_start_scheduler",
+        lambda self, *args: started.append(self),
+    )
+    barrier = threading.Barrier(4)
+
+    def create(_):
+        barrier.wait()
+        return TextSummarizer()
+
+    with ThreadPoolExecutor(max_workers=4) as executor:
+        summarizers = set(executor.map(create, range(4)))
+
+    assert len(summarizers) == 1
+    assert len(started) == 1
+
+
+def test_processors_are_keyed_by_tier_model(monkeypatch):
+    monkeypatch.setattr(SingleProcessor, "_instances", {})
+    monkeypatch.setattr(
+        SingleProcessor, "__init__", lambda self, *args, **kwargs: None
+    )
+
+    fast = ImageCaption(Tier.fast)
+    balanced = ImageCaption(Tier.balanced)
+
+    assert fast is not balanced
+    assert ImageCaption("accurate") is balanced
+    assert TextSummarizer("fast") is TextSummarizer("accurate")
+    assert ImageCaption.model_name_for("fast").endswith("-base")
+
+
+def test_tier_sampling_scales_intervals():
+    sampling = FrameSampling(
+        mode="scene",
+        frame_distance=150,
+        probe_interval_ms=1000,
+        min_interval_ms=2000,
+        max_interval_ms=60000,
+        hash_threshold=10,
+        save_frames=False,
+    )
+
+    fast = tier_sampling(sampling, Tier.fast)
+
+    assert fast.probe_interval_ms == 2000
+    assert fast.frame_distance == 300
+    assert tier_sampling(sampling, Tier.balanced) == sampling
+    assert tier_sampling(sampling, Tier.accurate).min_interval_ms == 1000
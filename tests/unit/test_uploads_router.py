@@ -0,0 +1,261 @@
+import fcntl
+import hashlib
+import os
+import time
+from datetime import UTC, datetime, timedelta
+
+import pytest
+from fastapi import status
+from sqlmodel import Session
+
+import main
+from config.config import Tier
+from db import UploadSession, VideoTranscription
+from services import upload_service
+from services.upload_service import expire_uploads
+from tests.test_db import engine_test
+
+
+@pytest.fixture
+def auth_username():
+    return "uploader"
+
+
+@pytest.fixture(autouse=True)
+def video_dir(tmp_path, monkeypatch):
+    monkeypatch.setattr(upload_service, "VIDEO_DIR", tmp_path)
+    return tmp_path
+
+
+def test_process_video_stores_by_hash(client, auth_headers, video_dir):
+    response = client.post(
+        "/process/",
+        files={"video": ("lecture.MP4", b"video-bytes", "video/mp4")},
+        headers=auth_headers,
+    )
+
+    assert response.status_code == status.HTTP_200_OK
+    data = response.json()
+    assert data["transcription_ready"] is False
+    content_hash = hashlib.sha256(b"video-bytes").hexdigest()
+    assert (video_dir / content_hash).exists()
+    with Session(engine_test) as session:
+        transcription = session.get(VideoTranscription, data["id"])
+        assert transcription.content_hash == content_hash
+
+
+def test_process_video_stores_tier(client, auth_headers):
+    response = client.post(
+        "/process/",
+        files={"video": ("draft.mp4", b"draft-bytes", "video/mp4")},
+        data={"tier": "fast"},
+        headers=auth_headers,
+    )
+
+    assert response.status_code == status.HTTP_200_OK
+    assert response.json()["tier"] == "fast"
+    with Session(engine_test) as session:
+        transcription = session.get(VideoTranscription, response.json()["id"])
+        assert transcription.tier == Tier.fast
+
+    response = client.post(
+        "/process/",
+        files={"video": ("draft.mp4", b"draft-bytes", "video/mp4")},
+        data={"tier": "turbo"},
+        headers=auth_headers,
+    )
+    assert response.status_code == status.HTTP_422_UNPROCESSABLE_CONTENT
+
+
+def test_process_video_rejects_large_upload(
+    client, auth_headers, video_dir, monkeypatch
+):
+    monkeypatch.setattr(upload_service, "MAX_UPLOAD_BYTES", 4)
+
+    response = client.post(
+        "/process/",
+        files={"video": ("lecture.mp4", b"too large", "video/mp4")},
+        headers=auth_headers,
+    )
+
+    assert response.status_code == status.HTTP_413_CONTENT_TOO_LARGE
+    assert list(video_dir.iterdir()) == []
+
+
+def test_resumable_upload(client, auth_headers, video_dir):
+    content = b"0123456789"
+    response = client.post(
+        "/uploads/",
+        json={"filename": "lecture.mp4", "size": len(content)},
+        headers=auth_headers,
+    )
+    upload_id = response.json()["id"]
+
+    response = client.put(
+        f"/uploads/{upload_id}",
+        content=content[:4],
+        headers={**auth_headers, "Upload-Offset": "0"},
+    )
+    assert response.json()["offset"] == 4
+    assert response.json()["transcription_id"] is None
+
+    # Повтор с устаревшим смещением
+    response = client.put(
+        f"/uploads/{upload_id}",
+        content=content[:4],
+        headers={**auth_headers, "Upload-Offset": "0"},
+    )
+    assert response.status_code == status.HTTP_409_CONFLICT
+    assert response.json()["detail"]["offset"] == 4
+
+    # Возобновление после перезапуска: состояние хэша восстанавливается
+    upload_service._hashers.clear()
+    assert (
+        client.get(f"/uploads/{upload_id}", headers=auth_headers).json()[
+            "offset"
+        ]
+        == 4
+    )
+    response = client.put(
+        f"/uploads/{upload_id}",
+        content=content[4:],
+        headers={**auth_headers, "Upload-Offset": "4"},
+    )
+
+    data = response.json()
+    assert data["offset"] == len(content)
+    assert data["transcription_id"] is not None
+    content_hash = hashlib.sha256(content).hexdigest()
+    assert [p.name for p in video_dir.iterdir()] == [content_hash]
+
+
+def test_resumable_upload_rejects_extra_bytes(client, auth_headers):
+    response = client.post(
+        "/uploads/",
+        json={"filename": "lecture.mp4", "size": 2},
+        headers=auth_headers,
+    )
+    upload_id = response.json()["id"]
+
+    response = client.put(
+        f"/uploads/{upload_id}",
+        content=b"abc",
+        headers={**auth_headers, "Upload-Offset": "0"},
+    )
+
+    assert response.status_code == status.HTTP_413_CONTENT_TOO_LARGE
+
+
+def test_process_video_rejects_declared_size_before_body(
+    client, auth_headers, monkeypatch
+):
+    monkeypatch.setattr(upload_service, "MAX_UPLOAD_BYTES", 4)
+    monkeypatch.setattr(upload_service, "MULTIPART_OVERHEAD", 0)
+
+    async def fail_if_called(video):
+        raise AssertionError("тело не должно дойти до ручки")
+
+    monkeypatch.setattr(main, "receive_video", fail_if_called)
+
+    response = client.post(
+        "/process/",
+        files={"video": ("lecture.mp4", b"too large", "video/mp4")},
+        headers=auth_headers,
+    )
+    assert response.status_code == status.HTTP_413_CONTENT_TOO_LARGE
+
+    # Тело без Content-Length обрывается по мере приема
+    response = client.post(
+        "/process/",
+        content=(part for part in [b"--boundary\r\n", b"x" * 64]),
+        headers={
+            **auth_headers,
+            "Content-Type": "multipart/form-data; boundary=boundary",
+        },
+    )
+    assert response.status_code == status.HTTP_413_CONTENT_TOO_LARGE
+
+
+def start_upload(client, auth_headers, size: int) -> str:
+    response = client.post(
+        "/uploads/",
+        json={"filename": "lecture.mp4", "size": size},
+        headers=auth_headers,
+    )
+    return response.json()["id"]
+
+
+def test_resumable_upload_locked_by_other_process(
+    client, auth_headers, video_dir
+):
+    upload_id = start_upload(client, auth_headers, 4)
+    with open(video_dir / f".upload-{upload_id}", "ab") as f:
+        fcntl.flock(f, fcntl.LOCK_EX)
+        response = client.put(
+            f"/uploads/{upload_id}",
+            content=b"data",
+            headers={**auth_headers, "Upload-Offset": "0"},
+        )
+
+    assert response.status_code == status.HTTP_409_CONFLICT
+    assert response.json()["detail"]["offset"] == 0
+
+
+def test_resumable_upload_after_write_by_other_process(
+    client, auth_headers, video_dir
+):
+    content = b"0123456789"
+    upload_id = start_upload(client, auth_headers, len(content))
+    client.put(
+        f"/uploads/{upload_id}",
+        content=content[:4],
+        headers={**auth_headers, "Upload-Offset": "0"},
+    )
+    # Другой воркер uvicorn дописал кусок, хэш этого процесса устарел
+    with open(video_dir / f".upload-{upload_id}", "ab") as f:
+        f.write(content[4:7])
+
+    response = client.put(
+        f"/uploads/{upload_id}",
+        content=content[7:],
+        headers={**auth_headers, "Upload-Offset": "7"},
+    )
+
+    assert response.json()["offset"] == len(content)
+    content_hash = hashlib.sha256(content).hexdigest()
+    assert (video_dir / content_hash).exists()
+
+
+def test_expire_uploads(video_dir):
+    old = datetime.now(UTC).replace(tzinfo=None) - timedelta(hours=48)
+    stale_time = time.time() - 48 * 3600
+    with Session(engine_test) as session:
+        abandoned = UploadSession(
+            user_id=1, filename="a.mp4", size=10, created_at=old
+        )
+        active = UploadSession(
+            user_id=1, filename="b.mp4", size=10, created_at=old
+        )
+        fresh = UploadSession(user_id=1, filename="c.mp4", size=10)
+        session.add_all([abandoned, active, fresh])
+        session.commit()
+        ids = [abandoned.id, active.id, fresh.id]
+        for upload_id in ids[:2]:
+            (video_dir / f".upload-{upload_id}").write_bytes(b"12")
+        os.utime(video_dir / f".upload-{ids[0]}", (stale_time, stale_time))
+        orphan = video_dir / ".upload-orphan"
+        orphan.write_bytes(b"12")
+        os.utime(orphan, (stale_time, stale_time))
+        (video_dir / ".upload-recent").write_bytes(b"12")
+
+        assert expire_uploads(session, max_age_s=24 * 3600) == 2
+
+        assert [
+            upload_id
+            for upload_id in ids
+            if session.get(UploadSession, upload_id) is not None
+        ] == ids[1:]
+        assert sorted(path.name for path in video_dir.iterdir()) == [
+            f".upload-{ids[1]}",
+            ".upload-recent",
+        ]
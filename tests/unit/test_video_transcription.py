@@ -1,8 +1,22 @@
+import hashlib
 import pytest
 from datetime import UTC, datetime, timedelta
+from sqlalchemy.ext.asyncio import create_async_engine
+from sqlalchemy.pool import StaticPool
 from sqlmodel import Session, SQLModel, create_engine
-from db import VideoTranscription
-from services.video_service import get_user_stats
+from sqlmodel.ext.asyncio.session import AsyncSession
+from config.config import Tier
+from db import UserStats, VideoTranscription, backfill_processing_s
+from services import upload_service, video_service
+from services.upload_service import store_by_hash
+from services.video_service import (
+    complete_transcription,
+    compute_user_stats,
+    find_completed_transcription,
+    get_user_stats,
+    link_transcription_results,
+)
+from utils.utils import SUMMARY_POSTFIX
 
 
 @pytest.fixture
@@ -13,24 +27,162 @@ def session():
         yield session
 
 
-def test_user_stats_calculation(session: Session):
+@pytest.fixture
+async def async_session():
+    engine = create_async_engine("sqlite+aiosqlite://", poolclass=StaticPool)
+    async with engine.begin() as connection:
+        await connection.run_sync(SQLModel.metadata.create_all)
+    async with AsyncSession(engine) as session:
+        yield session
+    await engine.dispose()
+
+
+@pytest.mark.anyio
+async def test_user_stats_calculation(async_session: AsyncSession):
     start_time = datetime.now(UTC) - timedelta(minutes=10)
 
     # Явно передаем путь к видео и текст, чтобы не ловить ошибки базы
     video = VideoTranscription(
         user_id=1,
         created_at=start_time,
-        completed_at=datetime.now(UTC),
         video_path="test.mp4",
         transcription="",  # Гарантируем отсутствие None
         transcription_ready=False,
+        duration_s=1800,
     )
-    session.add(video)
-    session.commit()
+    async_session.add(video)
+    await async_session.commit()
+    await async_session.run_sync(complete_transcription, video, "текст")
 
     # 3. Проверяем статистику
-    stats = get_user_stats(session, user_id=1)
+    stats = await get_user_stats(async_session, user_id=1)
 
     assert stats["total_videos"] == 1
     # Время должно быть ровно 600 секунд (10 минут)
     assert stats["avg_processing_time"] == 600
+    assert stats["total_minutes"] == 30
+    assert stats["p95_processing_time"] == 600
+
+
+@pytest.mark.anyio
+async def test_user_stats_are_updated_incrementally(
+    async_session: AsyncSession,
+):
+    now = datetime.now(UTC)
+    videos = [
+        VideoTranscription(
+            user_id=1, created_at=now - timedelta(seconds=seconds)
+        )
+        for seconds in range(1, 21)
+    ]
+    async_session.add_all(videos)
+    await async_session.commit()
+    for video in videos:
+        await async_session.run_sync(complete_transcription, video, "")
+
+    stored = await async_session.get(UserStats, 1)
+    computed = await async_session.run_sync(compute_user_stats, 1)
+
+    assert stored.total_videos == computed.total_videos == 20
+    assert stored.total_processing_s == pytest.approx(
+        computed.total_processing_s
+    )
+    # Nearest-rank: 19-е из 20 значений
+    assert stored.p95_processing_s == computed.p95_processing_s
+    assert round(stored.p95_processing_s) == 19
+
+
+@pytest.mark.anyio
+async def test_user_stats_fall_back_to_sql_aggregate(
+    async_session: AsyncSession,
+):
+    completed_at = datetime.now(UTC)
+    processed = VideoTranscription(
+        user_id=2, completed_at=completed_at, processing_s=30, duration_s=120
+    )
+    async_session.add(processed)
+    await async_session.commit()
+    await async_session.refresh(processed)
+    # Переиспользованный результат считается видео, но не временем
+    async_session.add(
+        VideoTranscription(
+            user_id=2,
+            completed_at=completed_at,
+            duration_s=120,
+            reused_from=processed.id,
+        )
+    )
+    async_session.add(VideoTranscription(user_id=2))
+    await async_session.commit()
+
+    stats = await get_user_stats(async_session, user_id=2)
+
+    assert await async_session.get(UserStats, 2) is None
+    assert stats == {
+        "total_videos": 2,
+        "avg_processing_time": 30,
+        "total_minutes": 4,
+        "p95_processing_time": 30,
+    }
+
+
+def test_backfill_processing_s(session: Session):
+    created_at = datetime(2026, 1, 1, 12, 0)
+    legacy = VideoTranscription(
+        user_id=3,
+        created_at=created_at,
+        completed_at=created_at + timedelta(minutes=5),
+    )
+    session.add(legacy)
+    session.add(VideoTranscription(user_id=3, created_at=created_at))
+    session.commit()
+
+    assert backfill_processing_s(session) == 1
+    assert backfill_processing_s(session) == 0
+    session.refresh(legacy)
+    assert legacy.processing_s == 300
+    assert compute_user_stats(session, 3).total_videos == 1
+
+
+def test_store_by_hash_deduplicates_content(tmp_path, monkeypatch):
+    monkeypatch.setattr(upload_service, "VIDEO_DIR", tmp_path)
+    content_hash = hashlib.sha256(b"lecture").hexdigest()
+    uploads = [tmp_path / f".upload-{i}" for i in range(3)]
+    for upload in uploads:
+        upload.write_bytes(b"lecture")
+
+    paths = [store_by_hash(upload, content_hash)[0] for upload in uploads]
+
+    first_path = tmp_path / content_hash
+    assert paths == [first_path] * 3
+    assert [p.name for p in tmp_path.iterdir()] == [first_path.name]
+
+
+def test_link_transcription_results(session: Session, tmp_path, monkeypatch):
+    monkeypatch.setattr(video_service, "TEXT_DIR", tmp_path)
+    source = VideoTranscription(
+        user_id=1,
+        transcription="готовый текст",
+        transcription_ready=True,
+        content_hash="abc",
+    )
+    pending = VideoTranscription(
+        user_id=1, transcription="", content_hash="abc"
+    )
+    session.add(source)
+    session.add(pending)
+    session.commit()
+    (tmp_path / f"{source.id}_{SUMMARY_POSTFIX}").write_text("{}")
+
+    found = find_completed_transcription(session, "abc")
+    link_transcription_results(session, pending, found)
+
+    assert found.id == source.id
+    assert pending.transcription == "готовый текст"
+    assert pending.transcription_ready
+    assert pending.reused_from == source.id
+    assert pending.processing_s is None
+    assert (tmp_path / f"{pending.id}_{SUMMARY_POSTFIX}").exists()
+    assert find_completed_transcription(session, "missing") is None
+    # Результат другого уровня обработки не переиспользуется
+    assert find_completed_transcription(session, "abc", Tier.fast) is None
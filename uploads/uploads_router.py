@@ -0,0 +1,119 @@
+from fastapi import APIRouter, Depends, Header, HTTPException, Request, status
+from fastapi.concurrency import run_in_threadpool
+from pydantic import BaseModel
+
+from config.config import Tier
+from db import SessionDep, UploadSession, User
+from services.upload_service import (
+    append_chunk,
+    check_upload_size,
+    finish_upload,
+    upload_offset,
+)
+from services.video_service import register_video
+from subtitles.subtitles import config, probe_duration
+from users.users import get_current_active_user
+
+router = APIRouter(prefix="/uploads")
+
+
+class UploadCreate(BaseModel):
+    filename: str
+    size: int
+    tier: Tier | None = None
+
+
+class UploadStatus(BaseModel):
+    id: str
+    size: int
+    offset: int
+    transcription_id: int | None = None
+
+
+def get_user_upload(
+    upload_id: str,
+    session: SessionDep,
+    current_user: User = Depends(get_current_active_user),
+) -> UploadSession:
+    upload = session.get(UploadSession, upload_id)
+    if upload is None or upload.user_id != current_user.id:
+        raise HTTPException(
+            status_code=404, detail=f"upload with id {upload_id} not found"
+        )
+    return upload
+
+
+def upload_status(upload: UploadSession) -> UploadStatus:
+    return UploadStatus(
+        id=upload.id,
+        size=upload.size,
+        offset=upload_offset(upload),
+        transcription_id=upload.transcription_id,
+    )
+
+
+# Начало докачиваемой загрузки
+@router.post("/", response_model=UploadStatus)
+def create_upload(
+    upload: UploadCreate,
+    session: SessionDep,
+    current_user: User = Depends(get_current_active_user),
+):
+    check_upload_size(upload.size)
+    upload_session = UploadSession(
+        user_id=current_user.id,
+        filename=upload.filename,
+        size=upload.size,
+        tier=upload.tier or config.models.default_tier,
+    )
+    session.add(upload_session)
+    session.commit()
+    session.refresh(upload_session)
+    return upload_status(upload_session)
+
+
+# Текущее смещение, с которого нужно продолжать загрузку
+@router.get("/{upload_id}", response_model=UploadStatus)
+def get_upload(upload: UploadSession = Depends(get_user_upload)):
+    return upload_status(upload)
+
+
+# Очередной кусок файла начиная с байта Upload-Offset
+@router.put("/{upload_id}", response_model=UploadStatus)
+async def upload_chunk(
+    request: Request,
+    session: SessionDep,
+    upload_offset_header: int = Header(alias="Upload-Offset"),
+    upload: UploadSession = Depends(get_user_upload),
+):
+    if upload.transcription_id is not None:
+        raise HTTPException(
+            status_code=status.HTTP_409_CONFLICT,
+            detail="Загрузка уже завершена",
+        )
+
+    # Коммиты ниже сбрасывают атрибуты upload, поэтому ответ собирается
+    # заранее, чтобы не перечитывать их из базы в event loop
+    result = UploadStatus(id=upload.id, size=upload.size, offset=0)
+    result.offset = await append_chunk(
+        upload, upload_offset_header, request.stream()
+    )
+    if result.offset == result.size:
+        video_path, content_hash = await run_in_threadpool(
+            finish_upload, upload
+        )
+        duration_s = await run_in_threadpool(probe_duration, video_path)
+        transcription = await run_in_threadpool(
+            register_video,
+            session,
+            upload.user_id,
+            video_path,
+            content_hash,
+            duration_s,
+            upload.tier,
+        )
+        result.transcription_id = transcription.id
+        upload.transcription_id = transcription.id
+        session.add(upload)
+        await run_in_threadpool(session.commit)
+    return result
@@ -1,14 +1,15 @@
 from sqlmodel import select
 from pydantic import BaseModel
+from sqlmodel.ext.asyncio.session import AsyncSession
 from jose import JWTError, jwt
-from sqlalchemy.orm import Session
 from passlib.context import CryptContext
 from datetime import datetime, timedelta, timezone
 from fastapi import Depends, HTTPException, status
+from fastapi.concurrency import run_in_threadpool
 from fastapi.security import OAuth2PasswordBearer
 
 
-from db import User, get_session
+from db import User, get_async_session
 from config.config import Config, load_config
 from utils.utils import ENV_FILE
 
@@ -48,11 +49,20 @@ def get_password_hash(password):
     return pwd_context.hash(password)
 
 
-def authenticate_user(db: Session, username: str, password: str):
-    user = db.exec(select(User).where(User.username == username)).first()
+# Хэширование argon2 нагружает CPU, поэтому уходит в пул потоков и не
+# блокирует event loop
+async def hash_password(password: str) -> str:
+    return await run_in_threadpool(get_password_hash, password)
+
+
+async def authenticate_user(db: AsyncSession, username: str, password: str):
+    result = await db.exec(select(User).where(User.username == username))
+    user = result.first()
     if not user:
         return False
-    if not verify_password(password, user.hashed_password):
+    if not await run_in_threadpool(
+        verify_password, password, user.hashed_password
+    ):
         return False
     return user
 
@@ -69,8 +79,9 @@ def create_access_token(data: dict, expires_delta: timedelta = None):
 
 
 # Получение текущего пользователя
-def get_current_user(
-    token: str = Depends(oauth2_scheme), db: Session = Depends(get_session)
+async def get_current_user(
+    token: str = Depends(oauth2_scheme),
+    db: AsyncSession = Depends(get_async_session),
 ):
     credentials_exception = HTTPException(
         status_code=status.HTTP_401_UNAUTHORIZED,
@@ -84,13 +95,16 @@ def get_current_user(
             raise credentials_exception
     except JWTError:
         raise credentials_exception
-    user = db.exec(select(User).where(User.username == username)).first()
+    result = await db.exec(select(User).where(User.username == username))
+    user = result.first()
     if user is None:
         raise credentials_exception
     return user
 
 
-def get_current_active_user(current_user: User = Depends(get_current_user)):
+async def get_current_active_user(
+    current_user: User = Depends(get_current_user),
+):
     if current_user.disabled:
         raise HTTPException(status_code=400, detail="Inactive user")
     return current_user
@@ -1,15 +1,15 @@
 from sqlalchemy import select
-from sqlalchemy.orm import Session
+from sqlmodel.ext.asyncio.session import AsyncSession
 from datetime import timedelta
 from fastapi import Depends, HTTPException, status, APIRouter
 from fastapi.security import OAuth2PasswordRequestForm
 
 
-from db import User, get_session
+from db import User, get_async_session
 from users.users import (
     UserOut,
     UserCreate,
-    get_password_hash,
+    hash_password,
     authenticate_user,
     create_access_token,
     Token,
@@ -23,29 +23,30 @@ router = APIRouter()
 
 # Регистрация
 @router.post("/register", response_model=UserOut)
-def register(user: UserCreate, db: Session = Depends(get_session)):
-    db_user = db.exec(
-        select(User).where(User.username == user.username)
-    ).first()
+async def register(
+    user: UserCreate, db: AsyncSession = Depends(get_async_session)
+):
+    result = await db.exec(select(User).where(User.username == user.username))
+    db_user = result.first()
     if db_user:
         raise HTTPException(
             status_code=400, detail="Username already registered"
         )
-    hashed_password = get_password_hash(user.password)
+    hashed_password = await hash_password(user.password)
     db_user = User(username=user.username, hashed_password=hashed_password)
     db.add(db_user)
-    db.commit()
-    db.refresh(db_user)
+    await db.commit()
+    await db.refresh(db_user)
     return db_user
 
 
 # Логин
 @router.post("/token", response_model=Token)
-def login_for_access_token(
+async def login_for_access_token(
     form_data: OAuth2PasswordRequestForm = Depends(),
-    db: Session = Depends(get_session),
+    db: AsyncSession = Depends(get_async_session),
 ):
-    user = authenticate_user(db, form_data.username, form_data.password)
+    user = await authenticate_user(db, form_data.username, form_data.password)
     if not user:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
@@ -60,5 +61,5 @@ def login_for_access_token(
 
 
 @router.get("/users/me", response_model=UserOut)
-def read_users_me(current_user: User = Depends(get_current_active_user)):
+async def read_users_me(current_user: User = Depends(get_current_active_user)):
     return current_user
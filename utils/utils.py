@@ -1,9 +1,23 @@
+from itertools import islice
 from pathlib import Path
+from typing import Iterable, Iterator, TypeVar
+
+T = TypeVar("T")
 
 ROOT_DIR = Path.cwd()
 VIDEO_DIR = ROOT_DIR / "subtitles" / "dir_video"
-AUDIO_DIR = ROOT_DIR / "subtitles" / "dir_audio"
 TEXT_DIR = ROOT_DIR / "subtitles" / "dir_text"
 IMAGES_DIR = ROOT_DIR / "subtitles" / "parsed_images"
+CACHE_DIR = ROOT_DIR / "subtitles" / "dir_cache"
+CAPTION_CACHE_FILE = CACHE_DIR / "captions.db"
+SUMMARY_CACHE_FILE = CACHE_DIR / "summaries.db"
 SUMMARY_POSTFIX = "summary.json"
+SUMMARY_TREE_POSTFIX = "summary_tree.json"
 ENV_FILE = ROOT_DIR / ".env.example"
+
+
+def batched(iterable: Iterable[T], size: int) -> Iterator[list[T]]:
+    """Разбивает итерируемый объект на списки длиной не больше size."""
+    iterator = iter(iterable)
+    while batch := list(islice(iterator, size)):
+        yield batch
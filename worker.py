@@ -0,0 +1,143 @@
+"""Воркер очереди обработки видео.
+
+Запуск: PYTHONPATH=. python worker.py
+
+Забирает задачи из таблицы job и выполняет их в ограниченном пуле
+процессов (WORKER_PROCESSES). Модели загружаются один раз на процесс пула.
+При WORKER_POOL=thread задачи выполняются в потоках одного процесса:
+модели загружаются один раз, а их планировщики собирают запросы
+одновременных задач в общие пачки. В пуле процессов (по умолчанию)
+у каждой задачи свои модели, и планировщик не запускается.
+Упавшие задачи повторяются до JOB_MAX_ATTEMPTS раз, задачи упавших
+воркеров возвращаются в очередь по отсутствию heartbeat. Раз в час
+удаляются загрузки без активности дольше UPLOAD_EXPIRE_H.
+"""
+
+import os
+import signal
+import socket
+import threading
+import time
+import traceback
+from concurrent.futures import (
+    Executor,
+    Future,
+    ProcessPoolExecutor,
+    ThreadPoolExecutor,
+)
+from concurrent.futures.process import BrokenProcessPool
+from multiprocessing import get_context
+
+from sqlmodel import Session
+
+from db import engine, create_db_and_tables
+from services.job_queue import (
+    claim_job,
+    complete_job,
+    fail_job,
+    heartbeat,
+    recover_stale_jobs,
+)
+from services.upload_service import expire_uploads
+from subtitles.subtitles import config
+
+WORKER_ID = f"{socket.gethostname()}:{os.getpid()}"
+# Как часто искать брошенные загрузки
+UPLOAD_CLEANUP_INTERVAL_S = 3600
+
+
+def _init_process():
+    # Соединения родителя не должны переиспользоваться в дочернем процессе
+    engine.dispose(close=False)
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+
+
+def run_job(job_id: int, transcription_id: int, video_path: str):
+    """Выполняет задачу в процессе пула, отправляя heartbeat."""
+    from services.video_service import write_subtitles
+
+    stop = threading.Event()
+
+    def beat():
+        while not stop.wait(config.worker.heartbeat_s):
+            with Session(engine) as session:
+                heartbeat(session, job_id)
+
+    thread = threading.Thread(target=beat, daemon=True)
+    thread.start()
+    try:
+        write_subtitles(video_path, transcription_id)
+    except Exception:
+        with Session(engine) as session:
+            fail_job(session, job_id, traceback.format_exc())
+        raise
+    finally:
+        stop.set()
+
+    with Session(engine) as session:
+        complete_job(session, job_id)
+
+
+def _make_pool() -> Executor:
+    if config.worker.pool == "thread":
+        return ThreadPoolExecutor(
+            max_workers=config.worker.processes, thread_name_prefix="job"
+        )
+    if config.worker.pool != "process":
+        raise ValueError(f"Неизвестный пул воркера: {config.worker.pool}")
+    return ProcessPoolExecutor(
+        max_workers=config.worker.processes,
+        mp_context=get_context("spawn"),
+        initializer=_init_process,
+    )
+
+
+def main():
+    create_db_and_tables()
+    stopping = threading.Event()
+    signal.signal(signal.SIGTERM, lambda *_: stopping.set())
+    signal.signal(signal.SIGINT, lambda *_: stopping.set())
+
+    pool = _make_pool()
+    running: dict[int, Future] = {}
+    next_cleanup = 0.0
+    try:
+        while not stopping.is_set():
+            with Session(engine) as session:
+                recover_stale_jobs(session, config.worker.stale_after_s)
+            if time.monotonic() >= next_cleanup:
+                next_cleanup = time.monotonic() + UPLOAD_CLEANUP_INTERVAL_S
+                with Session(engine) as session:
+                    expire_uploads(session, config.upload.expire_h * 3600)
+
+            broken = False
+            for job_id, future in list(running.items()):
+                if not future.done():
+                    continue
+                del running[job_id]
+                if isinstance(future.exception(), BrokenProcessPool):
+                    # Процесс пула умер, не успев записать результат
+                    broken = True
+                    with Session(engine) as session:
+                        fail_job(session, job_id, "Процесс воркера упал")
+            if broken:
+                pool.shutdown(wait=False, cancel_futures=True)
+                pool = _make_pool()
+
+            while len(running) < config.worker.processes:
+                with Session(engine) as session:
+                    job = claim_job(session, WORKER_ID)
+                if job is None:
+                    break
+                running[job.id] = pool.submit(
+                    run_job, job.id, job.transcription_id, job.video_path
+                )
+
+            stopping.wait(config.worker.poll_interval_s)
+    finally:
+        # Незавершенные задачи вернутся в очередь по отсутствию heartbeat
+        pool.shutdown(wait=True, cancel_futures=True)
+
+
+if __name__ == "__main__":
+    main()